@@ -1,8 +1,8 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-import scipy.stats
-from scipy.stats import linregress
+import regression
+import render
 m = np.array([14.541391237647325, 16.756128786151876, 15.829604890719585,
                                16.29457480995023, 13.829093893418786, 14.182568722430029,
                                16.03907734592769, 17.138868011663146, 15.998250803312972,
@@ -37,13 +37,12 @@ for i in range(19):
 D_final = np.array(D_final)
 v_final = np.array(v_final)
 
-slope, intercept, r_value, p_value, std_err = linregress(D_final, v_final)
+fit = regression.diagnostics(D_final, v_final)
+slope, intercept, r_value, p_value, std_err = (fit[key] for key in ('slope', 'intercept', 'rvalue', 'pvalue', 'stderr'))
 
-D_fit = np.linspace(min(D_final), max(D_final), 100)  # Distance range for plotting
-v_fit = slope * D_fit + intercept  # Best-fit line
-
-plt.scatter(D_final,v_final)
-plt.plot(D_fit, v_fit)
+ax = plt.gca()
+render.draw_scatter(ax, D_final, v_final)
+render.draw_fit_line(ax, slope, intercept, min(D_final), max(D_final))  # Best-fit line
 plt.xlabel("Distance (Mpc)")
 plt.ylabel("Recessional Velocity (km/s)")
 plt.title("Hubble's Law with Best-Fit Line")
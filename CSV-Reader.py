@@ -1,20 +1,16 @@
-import json
+import json_stream
 
 def read_json_to_array(file_path, fields):
     try:
-        with open(file_path, 'r') as file:
-            data = json.load(file)  # Load JSON file into a Python data structure
-            
-            # Ensure data is in list format (wrap in list if it's a single object)
-            if isinstance(data, dict):
-                data = [data]
-            
-            # Extract only the specified fields
-            filtered_data = [
-                {field: item.get(field) for field in fields} for item in data
-            ]
-            
-            return filtered_data
+        # Parse incrementally, keeping only the specified fields; numeric
+        # arrays come back as NumPy arrays instead of lists of Python floats
+        data = json_stream.extract_fields(file_path, fields)
+
+        # Ensure data is in list format (wrap in list if it's a single object)
+        if isinstance(data, dict):
+            data = [data]
+
+        return data
     except Exception as e:
         print(f"An error occurred: {e}")
         return []
@@ -0,0 +1,239 @@
+"""
+Concurrent ingest and fitting for catalogs delivered as many per-field files.
+
+Files are read and decoded on an executor (json.load holds the GIL, so a
+process pool is used whenever there is more than one core), at most
+`concurrency` at a time; each finished file is handed on as a (3, n) float64
+block in completion order, so the fits for the first fields run while later
+files are still loading. Result documents are written from a thread with the
+same temp-file-and-rename as atomic_io.write_json_atomic.
+
+    python async_ingest.py fields/*.json --models kappa distance_extinction --output-dir results
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+import atomic_io
+import catalog_store
+import hubble_models
+import model_sweep
+
+DEFAULT_CONCURRENCY = 8
+
+CatalogBatch = namedtuple('CatalogBatch', ['path', 'columns', 'seconds', 'error'])
+
+
+def load_columns(path):
+    # Runs in a worker: read and decode one catalog file into a contiguous (3, n) float64 block
+    start = time.perf_counter()
+    try:
+        data = catalog_store.read_catalog(path)
+        columns = np.stack([np.asarray(data[name], dtype=np.float64) for name in catalog_store.CATALOG_COLUMNS])
+    except Exception as e:
+        return CatalogBatch(path, None, time.perf_counter() - start, f"{type(e).__name__}: {e}")
+    return CatalogBatch(path, columns, time.perf_counter() - start, None)
+
+
+def fit_catalog(columns, models, method='auto'):
+    # Runs in a worker: every model from its default starting point on one block
+    return [model_sweep.fit_columns(columns, name, model_sweep.initial_guesses(name)[0], method) for name in models]
+
+
+def make_executor(workers=None, processes=None):
+    """Process pool when there are several cores (or processes=True), threads otherwise."""
+    workers = workers or os.cpu_count() or 1
+    if processes is None:
+        processes = workers > 1
+    if processes:
+        return ProcessPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ingest')
+
+
+async def iter_catalogs(paths, executor=None, concurrency=DEFAULT_CONCURRENCY, hold=False):
+    """
+    Async generator of CatalogBatch in completion order. At most `concurrency`
+    files are being decoded or waiting to be consumed at any time, so a slow
+    consumer bounds memory instead of letting decoded blocks pile up. A file
+    that fails to load is yielded with `error` set and `columns` None.
+
+    A batch's slot is freed when the consumer asks for the next one; with
+    `hold`, (batch, release) pairs are yielded instead and the slot stays
+    taken until release() is called, for consumers that hand batches on to
+    other tasks.
+    """
+    paths = list(paths)
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(concurrency)
+    ready = asyncio.Queue()
+
+    async def load(path):
+        # The slot is released by the consumer once it is done with the batch
+        await slots.acquire()
+        try:
+            batch = await loop.run_in_executor(executor, load_columns, path)
+        except Exception as e:  # e.g. a broken process pool
+            batch = CatalogBatch(path, None, 0.0, f"{type(e).__name__}: {e}")
+        await ready.put(batch)
+
+    def releaser():
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                slots.release()
+        return release
+
+    tasks = [asyncio.ensure_future(load(path)) for path in paths]
+    try:
+        for _ in paths:
+            batch = await ready.get()
+            release = releaser()
+            if hold:
+                yield batch, release
+                continue
+            try:
+                yield batch
+            finally:
+                release()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def write_json(output_data, path, executor=None):
+    # Atomic write off the event loop
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(executor, atomic_io.write_json_atomic, output_data, path)
+    return path
+
+
+def result_path_for(path, output_dir, root=None):
+    # <name>_results.json; below `root`, the directories are kept in the name (a/field.json -> a__field_results.json)
+    relative = os.path.relpath(path, root) if root else os.path.basename(path)
+    name = os.path.splitext(relative)[0].replace(os.sep, '__')
+    return os.path.join(output_dir, f"{name}_results.json")
+
+
+def result_paths(paths, output_dir):
+    """
+    {path: result file}. Files are named by basename unless two inputs share
+    one, then by their path below the inputs' common directory; if results
+    would still collide this raises ValueError rather than overwrite one.
+    """
+    paths = list(paths)
+    names = [os.path.basename(p) for p in paths]
+    root = None
+    if len(set(names)) < len(names):
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths])
+    outputs = {p: result_path_for(os.path.abspath(p) if root else p, output_dir, root) for p in paths}
+    seen = {}
+    for path, output in outputs.items():
+        if output in seen and os.path.abspath(seen[output]) != os.path.abspath(path):
+            raise ValueError(f"{seen[output]} and {path} would both write {output}")
+        seen[output] = path
+    return outputs
+
+
+async def fit_catalogs(paths, models=tuple(hubble_models.MODELS), output_dir='.', executor=None,
+                       concurrency=DEFAULT_CONCURRENCY, method='auto', on_result=None):
+    """
+    Load every catalog, fit `models` to each as soon as it arrives and write
+    its result file (see result_paths). A file keeps its `concurrency` slot
+    until its results are written, so decoded blocks never pile up behind
+    pending fits. Loading and fitting share `executor`; writes go to a small
+    thread pool. Returns the result documents in completion order;
+    `on_result(document)` is called as each one is written.
+    """
+    loop = asyncio.get_running_loop()
+    paths, models = list(paths), list(models)
+    outputs = result_paths(paths, output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    writer = ThreadPoolExecutor(max_workers=2, thread_name_prefix='result-writer')
+
+    async def fit_and_write(batch, release):
+        try:
+            return await _fit_and_write(batch)
+        finally:
+            # The decoded block is no longer needed; let the next file load
+            release()
+
+    async def _fit_and_write(batch):
+        document = {
+            'dataset': {'path': batch.path, 'rows': 0},
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'load_seconds': batch.seconds,
+        }
+        if batch.error:
+            logging.error(f"Failed to load {batch.path}: {batch.error}")
+            document['error'] = batch.error
+            document['results'] = []
+        else:
+            document['dataset']['rows'] = int(batch.columns.shape[1])
+            start = time.perf_counter()
+            document['results'] = await loop.run_in_executor(executor, fit_catalog, batch.columns, models, method)
+            document['fit_seconds'] = time.perf_counter() - start
+        document['output'] = await write_json(document, outputs[batch.path], writer)
+        if on_result is not None:
+            on_result(document)
+        return document
+
+    fits = []
+    try:
+        async for batch, release in iter_catalogs(paths, executor, concurrency, hold=True):
+            logging.info(f"Loaded {batch.path} in {batch.seconds:.3f} s")
+            fits.append(asyncio.ensure_future(fit_and_write(batch, release)))
+        documents = []
+        for next_done in asyncio.as_completed(fits):
+            documents.append(await next_done)
+        return documents
+    finally:
+        for task in fits:
+            task.cancel()
+        await asyncio.gather(*fits, return_exceptions=True)
+        writer.shutdown()
+
+
+def run(paths, models=tuple(hubble_models.MODELS), output_dir='.', workers=None, processes=None,
+        concurrency=DEFAULT_CONCURRENCY, method='auto', on_result=None):
+    # Synchronous entry point for scripts
+    with make_executor(workers, processes) as executor:
+        return asyncio.run(fit_catalogs(paths, models, output_dir, executor, concurrency, method, on_result))
+
+
+def _print_document(document):
+    if 'error' in document:
+        print(f"{document['dataset']['path']}: {document['error']}")
+        return
+    fits = ', '.join(f"{r['model']} H0={r['params'].get('H0', float('nan')):.2f}"
+                     for r in document['results'] if r['success'])
+    print(f"{document['dataset']['path']} ({document['dataset']['rows']} rows): {fits} -> {document['output']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load many catalog files concurrently and fit each as it arrives')
+    parser.add_argument('catalogs', nargs='+', help='JSON, .npy or .csv catalog files')
+    parser.add_argument('--models', nargs='+', choices=sorted(hubble_models.MODELS), default=list(hubble_models.MODELS))
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--threads', action='store_true', help='decode and fit on threads instead of processes')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='files in flight at once')
+    parser.add_argument('--method', choices=('auto', 'linear', 'nonlinear'), default='auto')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        result_paths(args.catalogs, args.output_dir)
+    except ValueError as e:
+        parser.error(str(e))
+    start = time.perf_counter()
+    documents = run(args.catalogs, args.models, args.output_dir, args.workers, False if args.threads else None,
+                    args.concurrency, args.method, _print_document)
+    print(f"Fitted {len(documents)} catalogs in {time.perf_counter() - start:.2f} s")
@@ -0,0 +1,25 @@
+import json
+import os
+import tempfile
+
+# mkstemp creates files 0600; results should get the mode a plain open() would.
+# The umask can only be read by setting it, so read it once at import.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def write_json_atomic(output_data, path):
+    # Write to a temp file in the same directory and rename over the target,
+    # so readers never see a half-written document
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(output_data, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
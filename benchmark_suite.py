@@ -0,0 +1,300 @@
+"""
+CPU benchmark suite for the Challenge 2 pipeline.
+
+Synthetic catalogs with the Challenge2_data.json schema are generated at each
+requested size, and every stage is timed (best of --repeat) and then run once
+more under tracemalloc for its peak allocation. Results go to a JSON document
+that --compare checks against an earlier run.
+
+    python benchmark_suite.py --sizes 1e3 1e4 1e5 1e6 --output bench.json
+    python benchmark_suite.py --sizes 1e3 1e4 --compare bench.json
+
+Scripts that run at import time are measured through the module functions
+they call; each stage's `equivalent` field names the script code it stands for.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import atomic_io
+import catalog_store
+
+c_kms = 299792.458
+DEFAULT_SIZES = (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6)
+# Regressions slower than this factor fail --compare
+REGRESSION_FACTOR = 1.25
+# JSON text is ~60 bytes per row; past this the JSON stages are skipped unless asked for
+DEFAULT_MAX_JSON_ROWS = 10 ** 7
+
+
+### Synthetic catalogs ###
+def make_catalog(rows, seed=0, H0=70.0):
+    """(m, M, z) shaped like Challenge2_data.json: 10-200 Mpc, M around -18, scatter about Hubble's law."""
+    rng = np.random.default_rng(seed)
+    d = rng.uniform(10.0, 200.0, rows)
+    M = rng.normal(-18.0, 1.2, rows)
+    m = M + 5 * np.log10(d * 1e6) - 5 + rng.normal(0.0, 0.1, rows)
+    z = np.clip(H0 * d / c_kms + rng.normal(0.0, 0.001, rows), 1e-4, None)
+    return m, M, z
+
+
+def write_catalog_json(path, columns, chunk_rows=1 << 20):
+    # Column-major JSON like Challenge2_data.json, written in chunks so 10^8 rows fit in memory
+    with open(path, 'w') as f:
+        f.write('{')
+        for i, (name, values) in enumerate(zip(catalog_store.CATALOG_COLUMNS, columns)):
+            f.write(('' if i == 0 else ', ') + json.dumps(name) + ': [')
+            for start in range(0, len(values), chunk_rows):
+                if start:
+                    f.write(', ')
+                f.write(', '.join(map(repr, values[start:start + chunk_rows].tolist())))
+            f.write(']')
+        f.write('}')
+    return path
+
+
+### Stages ###
+# Each stage is (name, equivalent script code, setup(ctx) -> callable). setup runs outside the timing.
+def _json_load(ctx):
+    def run():
+        with open(ctx['json'], 'r') as f:
+            return json.load(f)
+    return run
+
+
+def _store_load(ctx):
+    def run():
+        data = catalog_store.open_columns(ctx['store'])
+        return np.array(data.block)  # touch every page
+    return run
+
+
+def _json_extract(ctx):
+    import json_stream
+    return lambda: json_stream.extract_fields(ctx['json'], [catalog_store.CATALOG_COLUMNS[2]])
+
+
+def _transform_data(ctx):
+    data = dict(zip(catalog_store.CATALOG_COLUMNS, (col.tolist() for col in ctx['columns'])))
+    return lambda: catalog_store.as_table(data)
+
+
+def _transform_store(ctx):
+    data = catalog_store.open_columns(ctx['store'])
+    return lambda: np.ascontiguousarray(catalog_store.as_table(data))
+
+
+def _calculate_expression(ctx):
+    import streaming
+    z = ctx['columns'][2]
+    return lambda: streaming.relativistic_velocity(z, 299792458)
+
+
+def _velocity_calc(ctx):
+    import streaming
+    m, M, _ = ctx['columns']
+    return lambda: streaming.distance_mpc(m, M)
+
+
+def _corrected_distances(method):
+    def setup(ctx):
+        import distance_solver
+        m, M, _ = ctx['columns']
+        return lambda: distance_solver.corrected_distances(0.003, m, M, method=method)
+    return setup
+
+
+def _fit_model(name):
+    def setup(ctx):
+        import lsq_solver
+        m, M, z = ctx['columns']
+        return lambda: lsq_solver.fit_model(name, m, M, z)
+    return setup
+
+
+def _fit_k(ctx):
+    import eval_cache
+    import iterative_k
+    m, M, z = ctx['columns']
+
+    def run():
+        # Start cold each time; otherwise repeats are answered from the objective caches
+        for cache in list(eval_cache._registry.values()):
+            cache.clear()
+        return iterative_k.fit_k(m, M, z)
+    return run
+
+
+def _linear_fit(ctx):
+    import regression
+    import streaming
+    m, M, z = ctx['columns']
+    d = streaming.distance_mpc(m, M)
+    v = c_kms * z
+    return lambda: regression.diagnostics(d, v)
+
+
+def _plot_hubble(ctx):
+    import render
+    import streaming
+    m, M, z = ctx['columns']
+    d = streaming.distance_mpc(m, M)
+    v = c_kms * z
+    out = os.path.join(ctx['tmpdir'], 'hubble.png')
+    return lambda: render.render_hubble(d, v, 70.0, 0.0, out)
+
+
+def _plot_line(ctx):
+    import render
+    import streaming
+    m, M, z = ctx['columns']
+    d = streaming.distance_mpc(m, M)
+    out = os.path.join(ctx['tmpdir'], 'line.png')
+    return lambda: render.render_line(d, c_kms * z, out)
+
+
+STAGES = [
+    ('json_load', 'load_data_from_json (json.load)', _json_load),
+    ('store_load', 'load_data_from_json (catalog_store .npy)', _store_load),
+    ('json_extract', 'CSV-Reader.read_json_to_array, one field', _json_extract),
+    ('transform_data', 'transform_data on a json.load dict', _transform_data),
+    ('transform_store', 'transform_data on the columnar store', _transform_store),
+    ('calculate_expression', 'calculate_expression (relativistic velocity)', _calculate_expression),
+    ('velocity_calc', 'velocity_calc (distance modulus)', _velocity_calc),
+    ('corrected_distances_lambertw', 'CH_TG01 / Challenge_byTiger corrected distances', _corrected_distances('lambertw')),
+    ('corrected_distances_newton', 'corrected_distances(method="newton")', _corrected_distances('newton')),
+    ('fit_constant_extinction', 'cpc_gpt1.py', _fit_model('constant_extinction')),
+    ('fit_distance_extinction', 'cpc_gpt2.py', _fit_model('distance_extinction')),
+    ('fit_rv_ebv', 'tiger_new.py', _fit_model('rv_ebv')),
+    ('fit_kappa', 'gpu_calc.py', _fit_model('kappa')),
+    ('fit_k', 'CH_TG01.py', _fit_k),
+    ('fit_linear', 'CH_TG02.py linregress', _linear_fit),
+    ('plot_hubble', 'CH_TG01 / CH_TG02 Hubble diagram', _plot_hubble),
+    ('plot_line', 'plotter.py', _plot_line),
+]
+JSON_STAGES = {'json_load', 'json_extract', 'transform_data'}
+
+
+def measure(func, repeat):
+    # One untimed warm-up (lazy imports, first-touch page faults), the best wall
+    # time over `repeat` runs, then one run under tracemalloc for the peak
+    func()
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def environment():
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        rev = ''
+    import scipy
+    import compute_backend
+    return {
+        'backend': compute_backend.get_backend().name,
+        'git_revision': rev or None,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def run_suite(sizes=DEFAULT_SIZES, stages=None, repeat=3, seed=0, max_json_rows=DEFAULT_MAX_JSON_ROWS,
+              progress=True):
+    selected = [s for s in STAGES if stages is None or s[0] in stages]
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for rows in sizes:
+            columns = make_catalog(rows, seed)
+            ctx = {'columns': columns, 'tmpdir': tmpdir}
+            block = np.lib.format.open_memmap(os.path.join(tmpdir, 'catalog.npy'), mode='w+',
+                                              dtype=np.float64, shape=(3, rows))
+            block[:] = np.stack(columns)
+            block.flush()
+            del block
+            ctx['store'] = os.path.join(tmpdir, 'catalog.npy')
+            with_json = rows <= max_json_rows
+            if with_json and any(name in JSON_STAGES for name, _, _ in selected):
+                ctx['json'] = write_catalog_json(os.path.join(tmpdir, 'catalog.json'), columns)
+
+            for name, equivalent, setup in selected:
+                entry = {'stage': name, 'equivalent': equivalent, 'rows': rows}
+                if name in JSON_STAGES and not with_json:
+                    entry['skipped'] = f"over --max-json-rows ({max_json_rows})"
+                else:
+                    try:
+                        seconds, peak = measure(setup(ctx), repeat)
+                        entry.update(seconds=seconds, peak_bytes=peak, rows_per_second=rows / seconds)
+                    except Exception as e:
+                        entry['error'] = f"{type(e).__name__}: {e}"
+                results.append(entry)
+                if progress:
+                    if 'seconds' in entry:
+                        print(f"{rows:>11,d} {name:30s} {entry['seconds'] * 1000:10.2f} ms "
+                              f"{entry['peak_bytes'] / 2 ** 20:9.1f} MiB", file=sys.stderr)
+                    else:
+                        print(f"{rows:>11,d} {name:30s} {entry.get('skipped') or entry.get('error')}",
+                              file=sys.stderr)
+    return {'environment': environment(), 'repeat': repeat, 'seed': seed, 'results': results}
+
+
+def compare(current, baseline, factor=REGRESSION_FACTOR):
+    """List (stage, rows, baseline s, current s) for stages that got slower than `factor`."""
+    before = {(r['stage'], r['rows']): r['seconds'] for r in baseline['results'] if 'seconds' in r}
+    regressions = []
+    for r in current['results']:
+        old = before.get((r['stage'], r['rows']))
+        if old and 'seconds' in r and r['seconds'] > factor * old:
+            regressions.append((r['stage'], r['rows'], old, r['seconds']))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time and memory-profile every pipeline stage at scale')
+    parser.add_argument('--sizes', type=float, nargs='+', default=DEFAULT_SIZES, help='rows, e.g. 1e3 1e6 1e8')
+    parser.add_argument('--stages', nargs='+', choices=[s[0] for s in STAGES])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-json-rows', type=float, default=DEFAULT_MAX_JSON_ROWS)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='earlier results file; exit 1 on regressions')
+    parser.add_argument('--factor', type=float, default=REGRESSION_FACTOR)
+    parser.add_argument('--backend', help='compute backend (default: $HUBBLE_BACKEND or fused)')
+    args = parser.parse_args()
+
+    if args.backend:
+        import compute_backend
+        compute_backend.set_backend(args.backend)
+    # The degenerate models warn on every fit; keep the timings readable
+    logging.basicConfig(level=logging.ERROR)
+    report = run_suite([int(s) for s in args.sizes], args.stages, args.repeat, args.seed, int(args.max_json_rows))
+    atomic_io.write_json_atomic(report, args.output)
+    print(f"Results saved to {args.output}")
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.factor)
+        for stage, rows, old, new in regressions:
+            print(f"REGRESSION {stage} at {rows} rows: {old * 1000:.2f} ms -> {new * 1000:.2f} ms")
+        sys.exit(1 if regressions else 0)
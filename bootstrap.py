@@ -0,0 +1,238 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+import numpy as np
+import catalog_store
+import hubble_models
+import model_sweep
+import streaming
+
+DEFAULT_RESAMPLES = 10000
+# Resamples per vectorized block, further capped so the (block, n) index and count
+# matrices stay within BLOCK_MAX_ELEMENTS, as for the batched objectives
+BLOCK_RESAMPLES = 1024
+BLOCK_MAX_ELEMENTS = hubble_models.BATCH_MAX_ELEMENTS
+# Resamples per worker task for the nonlinear fits; fixed so results don't depend on worker count
+TASK_RESAMPLES = 64
+
+
+def resample_counts(rng, n, size):
+    """
+    Draw a (size, n) matrix of bootstrap indices and return how often each
+    observation was picked in each resample, i.e. integer bootstrap weights.
+    """
+    idx = rng.integers(0, n, size=(size, n))
+    flat = idx + (np.arange(size) * n)[:, None]
+    return np.bincount(flat.ravel(), minlength=size * n).reshape(size, n)
+
+
+def _solve_weighted(W, x, y, through_origin):
+    # Weighted least squares for every row of W at once, from its sufficient statistics
+    Sxx = W @ (x * x)
+    Sxy = W @ (x * y)
+    if through_origin:
+        return Sxy / Sxx, np.zeros(len(W))
+    S0 = W.sum(axis=1)
+    Sx = W @ x
+    Sy = W @ y
+    slope = (S0 * Sxy - Sx * Sy) / (S0 * Sxx - Sx * Sx)
+    return slope, (Sy - slope * Sx) / S0
+
+
+def bootstrap_linear(x, y, n_resamples=DEFAULT_RESAMPLES, seed=0, weights=None, through_origin=False,
+                     block=None):
+    """
+    Slope and intercept of y on x for n_resamples bootstrap resamples, computed
+    in blocks of weighted sufficient statistics instead of one linregress each.
+    Observation weights, if given, multiply the resample counts. `block`
+    defaults to BLOCK_RESAMPLES resamples, fewer for large n.
+    """
+    x = np.asarray(x, dtype=float)
+    if block is None:
+        block = max(1, min(BLOCK_RESAMPLES, BLOCK_MAX_ELEMENTS // max(len(x), 1)))
+    y = np.asarray(y, dtype=float)
+    w = None if weights is None else np.asarray(weights, dtype=float)
+    rng = np.random.default_rng(seed)
+    slopes = np.empty(n_resamples)
+    intercepts = np.empty(n_resamples)
+    for start in range(0, n_resamples, block):
+        size = min(block, n_resamples - start)
+        W = resample_counts(rng, len(x), size).astype(float)
+        if w is not None:
+            W *= w
+        slopes[start:start + size], intercepts[start:start + size] = _solve_weighted(W, x, y, through_origin)
+    return slopes, intercepts
+
+
+def jackknife_linear(x, y, weights=None, through_origin=False):
+    # Leave-one-out slopes and intercepts, all n at once by subtracting each row's contribution
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    w = np.ones_like(x) if weights is None else np.asarray(weights, dtype=float)
+    Sxx = np.dot(w, x * x) - w * x * x
+    Sxy = np.dot(w, x * y) - w * x * y
+    if through_origin:
+        return Sxy / Sxx, np.zeros_like(x)
+    S0 = w.sum() - w
+    Sx = np.dot(w, x) - w * x
+    Sy = np.dot(w, y) - w * y
+    slope = (S0 * Sxy - Sx * Sy) / (S0 * Sxx - Sx * Sx)
+    return slope, (Sy - slope * Sx) / S0
+
+
+def percentile_interval(samples, confidence=0.95):
+    samples = np.asarray(samples)
+    samples = samples[np.isfinite(samples)]
+    alpha = (1 - confidence) / 2
+    return tuple(np.quantile(samples, [alpha, 1 - alpha]))
+
+
+def bca_interval(samples, estimate, jackknife, confidence=0.95):
+    """
+    Bias-corrected and accelerated interval from bootstrap samples, the
+    full-sample estimate and leave-one-out (jackknife) estimates.
+    """
+    samples = np.asarray(samples)
+    samples = samples[np.isfinite(samples)]
+    jackknife = np.asarray(jackknife)
+    normal = NormalDist()
+    below = np.mean(samples < estimate)
+    below = min(max(below, 1 / len(samples)), 1 - 1 / len(samples))
+    z0 = normal.inv_cdf(below)
+    diff = jackknife.mean() - jackknife
+    denom = 6 * np.sum(diff ** 2) ** 1.5
+    accel = np.sum(diff ** 3) / denom if denom else 0.0
+
+    alpha = (1 - confidence) / 2
+    levels = []
+    for q in (alpha, 1 - alpha):
+        zq = normal.inv_cdf(q)
+        levels.append(normal.cdf(z0 + (z0 + zq) / (1 - accel * (z0 + zq))))
+    return tuple(np.quantile(samples, levels))
+
+
+def summarize(samples, estimate, jackknife=None, confidence=0.95):
+    samples = np.asarray(samples)
+    finite = samples[np.isfinite(samples)]
+    out = {
+        'estimate': float(estimate),
+        'std_error': float(np.std(finite, ddof=1)),
+        'percentile_interval': [float(v) for v in percentile_interval(finite, confidence)],
+        'resamples': int(len(samples)),
+        'failed': int(len(samples) - len(finite)),
+    }
+    if jackknife is not None:
+        out['bca_interval'] = [float(v) for v in bca_interval(finite, estimate, jackknife, confidence)]
+    return out
+
+
+def h0_bootstrap(m, M, z, n_resamples=DEFAULT_RESAMPLES, seed=0, through_origin=False, confidence=0.95,
+                 c=streaming.c_kms):
+    """Bootstrap H0 from the distance/velocity regression CH_TG02.py does with linregress."""
+    d = streaming.distance_mpc(np.asarray(m, dtype=float), np.asarray(M, dtype=float))
+    v = c * np.asarray(z, dtype=float)
+    slopes, intercepts = bootstrap_linear(d, v, n_resamples, seed, through_origin=through_origin)
+    W = np.ones((1, len(d)))
+    H0, intercept = (float(a[0]) for a in _solve_weighted(W, d, v, through_origin))
+    jk_slopes, jk_intercepts = jackknife_linear(d, v, through_origin=through_origin)
+    result = {'H0': summarize(slopes, H0, jk_slopes, confidence)}
+    if not through_origin:
+        result['intercept'] = summarize(intercepts, intercept, jk_intercepts, confidence)
+    return result
+
+
+### Nonlinear models: fits over resamples, spread across processes ###
+def _fit_resamples(model_name, seed_seq, size):
+    # Worker task: `size` resample fits, driven by its own SeedSequence child
+    m, M, z = model_sweep._worker_columns
+    rng = np.random.default_rng(seed_seq)
+    n = len(m)
+    estimates = []
+    for _ in range(size):
+        idx = rng.integers(0, n, size=n)
+        estimates.append(_fit_params(model_name, m[idx], M[idx], z[idx]))
+    return estimates
+
+
+def _fit_params(model_name, m, M, z):
+    # Parameter vector of one fit, or None if it failed (a resample can make a fit ill-posed)
+    try:
+        if model_name == model_sweep.ITERATIVE_K:
+            import iterative_k
+            fit = iterative_k.fit_k(m, M, z)
+            params = [fit['k'], fit['H0']]
+        else:
+            import lsq_solver
+            params = list(lsq_solver.fit_model(model_name, m, M, z).x)
+    except Exception:
+        return None
+    return params if np.all(np.isfinite(params)) else None
+
+
+def param_names(model_name):
+    if model_name == model_sweep.ITERATIVE_K:
+        return ('k', 'H0')
+    import hubble_models
+    return hubble_models.get_model(model_name).param_names
+
+
+def bootstrap_model(model_name, m, M, z, n_resamples=1000, seed=0, workers=None, confidence=0.95, bca=False):
+    """
+    Refit a nonlinear model on n_resamples resamples in a process pool. Each
+    task gets an independent child of SeedSequence(seed), and the task split
+    does not depend on `workers`, so results are reproducible on any machine.
+    """
+    columns = np.stack([np.asarray(col, dtype=np.float64) for col in (m, M, z)])
+    sizes = [min(TASK_RESAMPLES, n_resamples - s) for s in range(0, n_resamples, TASK_RESAMPLES)]
+    children = np.random.SeedSequence(seed).spawn(len(sizes))
+    shm, shape = model_sweep.share_catalog(columns)
+    try:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                                 initializer=model_sweep._attach_catalog, initargs=(shm.name, shape)) as pool:
+            blocks = list(pool.map(_fit_resamples, [model_name] * len(sizes), children, sizes))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    names = param_names(model_name)
+    fits = [est if est is not None else [np.nan] * len(names) for block in blocks for est in block]
+    samples = np.array(fits, dtype=float)
+    estimate = _fit_params(model_name, *columns)
+    if estimate is None:
+        raise ValueError(f"{model_name} does not converge on the full catalog")
+    jackknife = None
+    if bca:
+        # One leave-one-out copy at a time; an (n, n) keep-mask would be O(n^2) memory
+        jackknife = np.array([_fit_params(model_name, *np.delete(columns, i, axis=1))
+                              for i in range(columns.shape[1])], dtype=float)
+    return {name: summarize(samples[:, i], estimate[i], None if jackknife is None else jackknife[:, i], confidence)
+            for i, name in enumerate(names)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Bootstrap uncertainties for H0 and the model parameters')
+    parser.add_argument('catalog', nargs='?', default='Challenge2_data.json')
+    parser.add_argument('--model', default='linear', choices=('linear',) + model_sweep.SWEEP_MODELS,
+                        help="'linear' is the CH_TG02 distance/velocity regression")
+    parser.add_argument('--resamples', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--through-origin', action='store_true')
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--bca', action='store_true', help='BCa intervals for nonlinear models (n extra fits)')
+    args = parser.parse_args()
+
+    data = catalog_store.read_catalog(args.catalog)
+    m, M, z = (np.asarray(data[name]) for name in catalog_store.CATALOG_COLUMNS)
+    if args.model == 'linear':
+        result = h0_bootstrap(m, M, z, args.resamples or DEFAULT_RESAMPLES, args.seed, args.through_origin,
+                              args.confidence)
+    else:
+        result = bootstrap_model(args.model, m, M, z, args.resamples or 1000, args.seed, args.workers,
+                                 args.confidence, args.bca)
+    for name, stats in result.items():
+        line = f"{name}: {stats['estimate']:.4f} ± {stats['std_error']:.4f}, percentile {stats['percentile_interval']}"
+        if 'bca_interval' in stats:
+            line += f", BCa {stats['bca_interval']}"
+        print(line)
@@ -1,15 +1,16 @@
-import json
 import logging
+import fastlog
 import numpy as np
+import catalog_store
+import kernels
 
 # Set up logging configuration
-logging.basicConfig(filename='2.23-15-11-24.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+fastlog.setup_logging('2.23-15-11-24.log')
 
 def load_data_from_json(file_path):
     logging.info(f"Attempting to load data from {file_path}")
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
+        data = catalog_store.read_catalog(file_path, mode='c')
         logging.info("Data loaded successfully from JSON file.")
         return data
     except Exception as e:
@@ -19,26 +20,24 @@ def load_data_from_json(file_path):
 def transform_data(data):
     logging.info("Starting data transformation.")
     try:
-        transformed_data = np.array([data["Apparent Magitude (m)"], data["Absolute Magnitude (M)"], data["Redshift (z)"]]).T
+        transformed_data = catalog_store.as_table(data)
         logging.info("Data transformation completed successfully.")
         return transformed_data
     except Exception as e:
         logging.error(f"Error in data transformation: {e}")
         return None
 
-def multiply_column(data, column_index, x):
+def multiply_column(data, column_index, x, copy=True):
+    # copy=False scales the caller's array in place
     if data is None:
         logging.error("Input 'data' is None")
         return None
 
     try:
-        if column_index < 0 or column_index >= data.shape[1]:
-            raise IndexError("Column index is out of bounds")
-
-        data[:, column_index] *= x
+        data = kernels.scale_column(data, column_index, x, copy=copy)
 
         formatted_data = np.array2string(data, formatter={'float_kind':lambda x: "%.10f" % x})
-        logging.info(f"Data after multiplying column {column_index + 1}: {formatted_data}")
+        logging.info("Data after multiplying column %d: %s", column_index + 1, fastlog.array_summary(data))
         print(f"Data after multiplying column {column_index + 1}: {formatted_data}")
 
         return data
@@ -58,7 +57,7 @@ def main(file_path):
         return None
 
     formatted_data = np.array2string(transformed_data, formatter={'float_kind':lambda x: "%.10f" % x})
-    logging.info(f"Transformed data: {formatted_data}")
+    logging.info("Transformed data: %s", fastlog.array_summary(transformed_data))
     print(f"Transformed data: {formatted_data}")
 
     return transformed_data
@@ -1,15 +1,15 @@
-import json
 import logging
-import numpy as np
+import fastlog
+import catalog_store
+import kernels
 
 # Set up logging configuration
-logging.basicConfig(filename='2.05-15-11-24.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+fastlog.setup_logging('2.05-15-11-24.log')
 
 def load_data_from_json(file_path):
     logging.info(f"Attempting to load data from {file_path}")
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
+        data = catalog_store.read_catalog(file_path, mode='c')
         logging.info("Data loaded successfully from JSON file.")
         return data
     except Exception as e:
@@ -19,27 +19,25 @@ def load_data_from_json(file_path):
 def transform_data(data):
     logging.info("Starting data transformation.")
     try:
-        transformed_data = np.array([data["Apparent Magitude (m)"], data["Absolute Magnitude (M)"], data["Redshift (z)"]]).T
+        transformed_data = catalog_store.as_table(data)
         logging.info("Data transformation completed successfully.")
         return transformed_data
     except Exception as e:
         logging.error(f"Error in data transformation: {e}")
         return None
 
-def multiply_column(data, column_index, x):
+def multiply_column(data, column_index, x, copy=True):
+    # copy=False scales the caller's array in place
     if data is None:
         logging.error("Input 'data' is None")
         return None
 
     try:
-        if column_index < 0 or column_index >= data.shape[1]:
-            raise IndexError("Column index is out of bounds")
-
-        data[:, column_index] *= x
+        data = kernels.scale_column(data, column_index, x, copy=copy)
+        logging.info("Data after multiplying column %d: %s", column_index + 1, fastlog.array_summary(data))
 
         for i, row in enumerate(data, 1):
             formatted_row = ["{:.10f}".format(value) for value in row]
-            logging.info(f"Row {i} after multiplying column {column_index + 1}: {formatted_row}")
             print(f"Row {i} after multiplying column {column_index + 1}: {formatted_row}")
 
         return data
@@ -58,10 +56,10 @@ def main(file_path):
         logging.error("Exiting due to data transformation error.")
         return None
 
+    logging.info("Transformed data: %s", fastlog.array_summary(transformed_data))
     for i, row in enumerate(transformed_data, 1):
         formatted_row = ["{:.10f}".format(value) for value in row]
         print(f"{i} = {formatted_row}")
-        logging.info(f"Row {i} = {formatted_row}")
 
     return transformed_data
 
@@ -1,15 +1,16 @@
-import json
 import logging
+import fastlog
 import numpy as np
+import catalog_store
+import streaming
 
 # Set up logging configuration
-logging.basicConfig(filename='rqa-2.31-15-11-24.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+fastlog.setup_logging('rqa-2.31-15-11-24.log')
 
 def load_data_from_json(file_path):
     logging.info(f"Attempting to load data from {file_path}")
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
+        data = catalog_store.read_catalog(file_path)
         logging.info("Data loaded successfully from JSON file.")
         return data
     except Exception as e:
@@ -19,7 +20,7 @@ def load_data_from_json(file_path):
 def transform_data(data):
     logging.info("Starting data transformation.")
     try:
-        transformed_data = np.array([data["Apparent Magitude (m)"], data["Absolute Magnitude (M)"], data["Redshift (z)"]]).T
+        transformed_data = catalog_store.as_table(data)
         logging.info("Data transformation completed successfully.")
         return transformed_data
     except Exception as e:
@@ -36,10 +37,10 @@ def calculate_expression(data, column_index, c):
             raise IndexError("Column index is out of bounds")
 
         col = data[:, column_index]
-        result = (((col + 1)**2) - 1) / (((col + 1)**2 + 1)) * c
+        result = streaming.relativistic_velocity(col, c)
 
         formatted_result = np.array2string(result, formatter={'float_kind':lambda x: "%.10f" % x})
-        logging.info(f"Calculated result for column {column_index + 1}: {formatted_result}")
+        logging.info("Calculated result for column %d: %s", column_index + 1, fastlog.array_summary(result))
         print(f"Calculated result for column {column_index + 1}: {formatted_result}")
 
         return result
@@ -59,7 +60,7 @@ def file_loader(file_path):
         return None
 
     formatted_data = np.array2string(transformed_data, formatter={'float_kind':lambda x: "%.10f" % x})
-    logging.info(f"Transformed data: {formatted_data}")
+    logging.info("Transformed data: %s", fastlog.array_summary(transformed_data))
     print(f"Transformed data: {formatted_data}")
 
     return transformed_data
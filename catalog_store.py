@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+import sys
+import numpy as np
+
+# Column order of the on-disk block. Row i of the stored (3, n) array holds
+# the column named CATALOG_COLUMNS[i], so `block.T` is the same (n, 3) layout
+# that transform_data has always produced.
+CATALOG_COLUMNS = ("Apparent Magitude (m)", "Absolute Magnitude (M)", "Redshift (z)")
+CATALOG_DTYPE = np.float64
+
+
+class ColumnCatalog(dict):
+    """
+    Mapping of column name -> zero-copy view into one memory-mapped block.
+
+    Behaves like the dict json.load used to return, so existing
+    `data['Redshift (z)']` lookups keep working; `block` is the underlying
+    (3, n) memmap for callers that want the whole table.
+    """
+
+    def __init__(self, block):
+        super().__init__(zip(CATALOG_COLUMNS, block))
+        self.block = block
+
+    def as_table(self):
+        # (n, 3) view, columns stay contiguous because the block is stored by column
+        return self.block.T
+
+
+def store_path_for(json_path):
+    root, _ = os.path.splitext(json_path)
+    return root + '.npy'
+
+
+def convert_json_to_columns(json_path, store_path=None, dtype=CATALOG_DTYPE):
+    if store_path is None:
+        store_path = store_path_for(json_path)
+    logging.info(f"Converting {json_path} to columnar store {store_path}")
+    with open(json_path, 'r') as f:
+        data = json.load(f)
+
+    n = len(data[CATALOG_COLUMNS[0]])
+    for name in CATALOG_COLUMNS:
+        if len(data[name]) != n:
+            raise ValueError(f"Column {name!r} has {len(data[name])} rows, expected {n}")
+
+    block = np.lib.format.open_memmap(store_path, mode='w+', dtype=dtype, shape=(len(CATALOG_COLUMNS), n))
+    for i, name in enumerate(CATALOG_COLUMNS):
+        block[i] = data[name]
+    block.flush()
+    del block
+    logging.info(f"Wrote {n} rows x {len(CATALOG_COLUMNS)} columns to {store_path}")
+    return store_path
+
+
+def open_columns(store_path, mode='r'):
+    block = np.load(store_path, mmap_mode=mode)
+    if block.ndim != 2 or block.shape[0] != len(CATALOG_COLUMNS):
+        raise ValueError(f"{store_path} is not a catalog store (shape {block.shape})")
+    return ColumnCatalog(block)
+
+
+def _with_dtype(data, dtype):
+    # Columns in the requested float dtype; a store already in that dtype stays memory-mapped
+    if dtype is None:
+        return data
+    if isinstance(data, ColumnCatalog):
+        if data.block.dtype == dtype:
+            return data
+        return ColumnCatalog(data.block.astype(dtype))
+    return ColumnCatalog(np.array([data[name] for name in CATALOG_COLUMNS], dtype=dtype))
+
+
+def read_catalog(file_path, mode='r', dtype=None):
+    """
+    Load a catalog, preferring the memory-mapped store over JSON.
+
+    `file_path` may point at the .npy store directly, or at the JSON file; in
+    the latter case a sibling store is used when it is at least as new as the
+    JSON, so the scripts pick it up without changing their hard-coded paths.
+    A .csv catalog (challenge-data.csv) is parsed into the same column layout.
+
+    `dtype` (default: the precision.py storage dtype, i.e. float32 when
+    HUBBLE_PRECISION=float32 and as stored otherwise) converts the columns.
+    """
+    import precision
+    dtype = precision.storage_dtype() if dtype is None else np.dtype(dtype)
+    if file_path.endswith('.npy'):
+        return _with_dtype(open_columns(file_path, mode), dtype)
+    if file_path.endswith('.csv'):
+        import csv_ingest
+        return _with_dtype(csv_ingest.read_catalog_csv(file_path), dtype)
+
+    store_path = store_path_for(file_path)
+    if os.path.exists(store_path) and os.path.getmtime(store_path) >= os.path.getmtime(file_path):
+        logging.info(f"Using columnar store {store_path} for {file_path}")
+        return _with_dtype(open_columns(store_path, mode), dtype)
+
+    with open(file_path, 'r') as f:
+        return _with_dtype(json.load(f), dtype)
+
+
+def as_table(data):
+    # Zero-copy for the columnar store, the original np.array(...).T for plain JSON dicts
+    if isinstance(data, ColumnCatalog):
+        return data.as_table()
+    return np.array([data[name] for name in CATALOG_COLUMNS]).T
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python catalog_store.py <catalog.json> [store.npy] [float64|float32]")
+        sys.exit(2)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    out = convert_json_to_columns(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None,
+                                  sys.argv[3] if len(sys.argv) > 3 else CATALOG_DTYPE)
+    print(f"Columnar store written to {out}")
@@ -0,0 +1,174 @@
+"""
+Interchangeable implementations of the element-wise kernels:
+
+    relativistic_velocity  ((1+z)^2 - 1) / ((1+z)^2 + 1) * c
+    distance_mpc           10**((m - M + 5)/5) / 1e6
+    residuals              m_obs - model(params, v, M) for a MagnitudeModel
+
+'numpy' is the reference: the plain expressions, one temporary per operator.
+'fused' runs the in-place kernels from kernels.py (bit-identical results,
+scratch columns from a reused workspace). 'threaded' splits the arrays into
+chunks and runs the fused kernels on a thread pool (NumPy releases the GIL
+inside ufuncs). 'torch' runs relativistic_velocity and distance_mpc on torch
+CPU tensors if torch is installed; its residuals are the fused NumPy kernel,
+since the model functions are written against NumPy.
+
+The backend is chosen with set_backend(name) or the HUBBLE_BACKEND
+environment variable (default 'fused').
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import kernels
+
+ENV_VAR = 'HUBBLE_BACKEND'
+DEFAULT_BACKEND = 'fused'
+# Below this many elements per chunk the thread hand-off costs more than it saves
+MIN_CHUNK = 1 << 16
+
+
+class NumpyBackend:
+    name = 'numpy'
+
+    def relativistic_velocity(self, z, c):
+        zp1_sq = (z + 1) ** 2
+        return (zp1_sq - 1) / (zp1_sq + 1) * c
+
+    def distance_mpc(self, m, M):
+        return 10 ** ((m - M + 5) / 5) / 1e6
+
+    def residuals(self, model, params, v, M, m_obs):
+        return m_obs - model.model(params, v, M)
+
+
+class FusedBackend:
+    name = 'fused'
+
+    def relativistic_velocity(self, z, c):
+        return kernels.relativistic_velocity(z, c)
+
+    def distance_mpc(self, m, M):
+        return kernels.distance_mpc(m, M)
+
+    def residuals(self, model, params, v, M, m_obs):
+        return kernels.magnitude_residuals(model, params, v, M, m_obs)
+
+
+class ThreadedBackend:
+    """Fused kernels on chunks, run by a pool of `workers` threads (default: one per core)."""
+    name = 'threaded'
+
+    def __init__(self, workers=None, min_chunk=MIN_CHUNK):
+        self.workers = workers or os.cpu_count() or 1
+        self.min_chunk = min_chunk
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='hubble-kernel')
+            return self._pool
+
+    def _slices(self, n):
+        chunks = max(1, min(self.workers, n // self.min_chunk))
+        bounds = np.linspace(0, n, chunks + 1).astype(int)
+        return [slice(a, b) for a, b in zip(bounds[:-1], bounds[1:])]
+
+    def _run(self, kernel, arrays, out):
+        # kernel(*array_slices, out_slice) on each chunk; inline when one chunk is enough
+        slices = self._slices(len(out)) if out.ndim else [None]
+        if len(slices) == 1:
+            kernel(*arrays, out)
+            return out
+        futures = [self._executor().submit(kernel, *(a[s] for a in arrays), out[s]) for s in slices]
+        for f in futures:
+            f.result()
+        return out
+
+    def relativistic_velocity(self, z, c):
+        z = kernels.as_float(z)
+        return self._run(lambda z, out: kernels.relativistic_velocity(z, c, out), (z,), np.empty_like(z))
+
+    def distance_mpc(self, m, M):
+        m, M = np.broadcast_arrays(kernels.as_float(m), kernels.as_float(M))
+        return self._run(kernels.distance_mpc, (m, M), np.empty(m.shape, np.result_type(m, M)))
+
+    def residuals(self, model, params, v, M, m_obs):
+        m_obs = kernels.as_float(m_obs)
+        v, M = np.broadcast_arrays(v, M)
+        return self._run(lambda v, M, m_obs, out: kernels.magnitude_residuals(model, params, v, M, m_obs, out),
+                         (v, M, m_obs), np.empty_like(m_obs))
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+class TorchBackend:
+    """
+    Velocity and distance on torch CPU tensors (torch's intra-op thread pool
+    does the splitting), in the input's float32/float64 dtype. Residuals stay
+    on the fused NumPy kernel.
+    """
+    name = 'torch'
+
+    def __init__(self, threads=None):
+        try:
+            import torch
+        except ImportError as exc:
+            raise ImportError("torch backend requires PyTorch") from exc
+        self.torch = torch
+        if threads:
+            torch.set_num_threads(threads)
+
+    def _tensor(self, x, dtype):
+        return self.torch.from_numpy(np.ascontiguousarray(x, dtype=dtype))
+
+    def relativistic_velocity(self, z, c):
+        z = kernels.as_float(z)
+        s = (self._tensor(z, z.dtype) + 1) ** 2
+        return ((s - 1) / (s + 1) * c).numpy()
+
+    def distance_mpc(self, m, M):
+        m, M = kernels.as_float(m), kernels.as_float(M)
+        dtype = np.result_type(m, M)
+        return (self.torch.pow(10.0, (self._tensor(m, dtype) - self._tensor(M, dtype) + 5) / 5) / 1e6).numpy()
+
+    def residuals(self, model, params, v, M, m_obs):
+        # The model functions are written against NumPy, so this is the fused kernel
+        return kernels.magnitude_residuals(model, params, v, M, m_obs)
+
+
+BACKENDS = {
+    'numpy': NumpyBackend,
+    'fused': FusedBackend,
+    'threaded': ThreadedBackend,
+    'torch': TorchBackend,
+}
+
+_current = None
+
+
+def set_backend(name=None, **options):
+    """Select the backend by name (None: $HUBBLE_BACKEND or 'fused'); returns it."""
+    global _current
+    name = name or os.environ.get(ENV_VAR) or DEFAULT_BACKEND
+    try:
+        cls = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown compute backend {name!r}; choose from {sorted(BACKENDS)}") from None
+    backend = cls(**options)
+    if _current is not None and hasattr(_current, 'shutdown'):
+        _current.shutdown()
+    _current = backend
+    return backend
+
+
+def get_backend():
+    if _current is None:
+        return set_backend()
+    return _current
@@ -1,58 +1,67 @@
+import argparse
 import numpy as np
-from scipy.optimize import minimize
-import json
+import atomic_io
+import catalog_store
+import hubble_models
+import lsq_solver
+import profiling
+import result_store
 import logging
-from datetime import datetime
+import fastlog
 
 # Configure logging
-log_filename = datetime.now().strftime('logfile_%Y%m%d_%H%M%S.log')
-logging.basicConfig(filename=log_filename, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Runs log to the indexed run-log store ($HUBBLE_RUN_LOG, default runlogs/); see run_log_store.py
+fastlog.setup_logging()
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--no-cache', action='store_true', help='refit from the initial guess, ignoring stored results')
+args = parser.parse_args()
 
 logging.info("Starting the process")
 
 # Read data from JSON file
 def json_reader(file_path):
     logging.info(f"Reading data from {file_path}")
-    with open(file_path, 'r') as file:
-        data = json.load(file)
+    data = catalog_store.read_catalog(file_path)
     logging.info("Data successfully read from JSON file")
     return data
 
-data = json_reader('Challenge2_data.json')
-apparent_magnitudes = np.array(data['Apparent Magitude (m)'])
-absolute_magnitudes = np.array(data['Absolute Magnitude (M)'])
-z = np.array(data['Redshift (z)'])
+profiling.lap('load')
+file_path = 'Challenge2_data.json'
+data = json_reader(file_path)
+profiling.lap('transform')
+apparent_magnitudes = np.asarray(data['Apparent Magitude (m)'])
+absolute_magnitudes = np.asarray(data['Absolute Magnitude (M)'])
+z = np.asarray(data['Redshift (z)'])
 
+profiling.lap('velocity')
 # Calculate radial velocities from redshift (v = c * z)
 c_kms = 299792.458  # Speed of light in km/s
 radial_velocities = c_kms * z
 logging.info("Calculated radial velocities from redshift")
 
-# Define the model function (fix R_V = 3.1)
-def magnitude_model(params, v, M):
-    H0, E_BV = params
-    R_V = 3.1  # Fixed value for R_V
-    A_V = R_V * E_BV
-    m_model = M + 5 * np.log10(v / H0) - 5 + A_V
-    return m_model
-
-# Define the residuals function
-def residuals(params, v, M, m_obs):
-    m_model = magnitude_model(params, v, M)
-    return m_obs - m_model
+# Model function (fix R_V = 3.1), residuals and analytic Jacobian
+model = hubble_models.get_model('constant_extinction')
+magnitude_model = model.model
+residuals = model.residuals
 
 # Initial guesses for parameters: H0 and E(B-V)
 initial_guess = [60, 0.1]
 logging.info(f"Initial guess for parameters: H0 = {initial_guess[0]}, E(B-V) = {initial_guess[1]}")
 
 # Minimize the sum of squared residuals
+profiling.lap('fit')
 logging.info("Starting optimization process")
-result = minimize(
-    lambda params: np.sum(residuals(params, radial_velocities, absolute_magnitudes, apparent_magnitudes)**2),
-    initial_guess,
-    bounds=[(0, 100), (0.0, 3.0)]  # Bounds for H0 and E(B-V)
+# Linear in (-5*log10(H0), E(B-V)), so this is solved in closed form; identical reruns
+# come from the result store (no warm start: a closed form has no starting point to improve)
+bounds = [(0, 100), (0.0, 3.0)]  # Bounds for H0 and E(B-V)
+fit_args = (radial_velocities, absolute_magnitudes, apparent_magnitudes)
+result = result_store.cached_fit(
+    lambda start: lsq_solver.solve_linear(model, *fit_args, start, bounds=bounds),
+    model.name, fit_args, initial_guess, bounds, 'linear', warm_start=False, source=file_path,
+    use_cache=not args.no_cache
 )
-logging.info("Optimization process completed")
+logging.info(f"Optimization process completed ({result.message})")
 
 # Extract best-fit parameters
 H0_best, E_BV_best = result.x
@@ -61,17 +70,22 @@ logging.info(f"Best-fit parameters: H0 = {H0_best:.2f}, E(B-V) = {E_BV_best:.2f}
 # Print results
 print(f"Best-fit Hubble constant (H0): {H0_best:.2f} km/s/Mpc")
 print(f"Best-fit E(B-V): {E_BV_best:.2f}")
+if result.degenerate:
+    print("Warning: H0 and E(B-V) are degenerate; only -5*log10(H0) + 3.1*E(B-V) is constrained, "
+          "so H0 sits wherever the bounds on E(B-V) put it")
 
 # Save the results to a JSON file
 output_data = {
     'Hubble constant (H0)': H0_best,
-    'E(B-V)': E_BV_best
+    'E(B-V)': E_BV_best,
+    'Provenance': result_store.provenance(result, model.name, bounds, initial_guess, 'linear', file_path)
 }
 
 output_file_path = 'optimization_results.json'
 logging.info(f"Saving results to {output_file_path}")
-with open(output_file_path, 'w') as output_file:
-    json.dump(output_data, output_file, indent=4)
+profiling.lap('write')
+atomic_io.write_json_atomic(output_data, output_file_path)
+profiling.write_profile_for(output_file_path)
 logging.info("Results successfully saved to JSON file")
 
 logging.info("Process completed")
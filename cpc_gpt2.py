@@ -1,26 +1,38 @@
+import argparse
 import numpy as np
-from scipy.optimize import minimize
-import json
+import atomic_io
+import catalog_store
+import hubble_models
+import lsq_solver
+import profiling
+import result_store
 import logging
-from datetime import datetime
+import fastlog
 
 # Configure logging
-log_filename = datetime.now().strftime('logfile_%Y%m%d_%H%M%S.log')
-logging.basicConfig(filename=log_filename, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Runs log to the indexed run-log store ($HUBBLE_RUN_LOG, default runlogs/); see run_log_store.py
+fastlog.setup_logging()
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--no-cache', action='store_true', help='refit from the initial guess, ignoring stored results')
+args = parser.parse_args()
 
 # Read data from JSON file
 def json_reader(file_path):
     logging.info(f"Reading data from {file_path}")
-    with open(file_path, 'r') as file:
-        data = json.load(file)
+    data = catalog_store.read_catalog(file_path)
     logging.info("Data successfully read from JSON file")
     return data
 
-data = json_reader('Challenge2_data.json')
-apparent_magnitudes = np.array(data['Apparent Magitude (m)'])
-absolute_magnitudes = np.array(data['Absolute Magnitude (M)'])
-z = np.array(data['Redshift (z)'])
+profiling.lap('load')
+file_path = 'Challenge2_data.json'
+data = json_reader(file_path)
+profiling.lap('transform')
+apparent_magnitudes = np.asarray(data['Apparent Magitude (m)'])
+absolute_magnitudes = np.asarray(data['Absolute Magnitude (M)'])
+z = np.asarray(data['Redshift (z)'])
 
+profiling.lap('velocity')
 # Calculate radial velocities from redshift (v = c * z)
 c_kms = 299792.458  # Speed of light in km/s
 radial_velocities = c_kms * z
@@ -28,29 +40,25 @@ bounds=[(50, 100), (0,1)]
 
 logging.info("Radial velocities calculated from redshift")
 
-# Define the model function with distance-dependent extinction
-def magnitude_model(params, v, M):
-    H0, gamma = params  # gamma is the extinction coefficient
-    d = v / H0  # Distance in Mpc
-    A_V = gamma * d  # Distance-dependent extinction
-    m_model = M + 5 * np.log10(d) + 25 + A_V  # 25 is added for distance in Mpc
-    return m_model
-
-# Define the residuals function
-def residuals(params, v, M, m_obs):
-    m_model = magnitude_model(params, v, M)
-    return m_obs - m_model
+# Model function with distance-dependent extinction, residuals and analytic Jacobian
+model = hubble_models.get_model('distance_extinction')
+magnitude_model = model.model
+residuals = model.residuals
 
 # Initial guesses for parameters: H0 (Hubble constant), gamma (extinction coefficient)
 initial_guess = [70, 0.5]
 logging.info(f"Initial guess for parameters: H0={initial_guess[0]}, gamma={initial_guess[1]}")
 
 # Minimize the sum of squared residuals
+profiling.lap('fit')
 logging.info("Starting optimization process")
-result = minimize(
-    lambda params: np.sum(residuals(params, radial_velocities, absolute_magnitudes, apparent_magnitudes)**2),
-    initial_guess,
-    bounds=bounds  # Updated bounds applied here
+# Identical reruns come from the result store; a changed catalog starts from the nearest stored fit
+fit_args = (radial_velocities, absolute_magnitudes, apparent_magnitudes)
+result = result_store.cached_fit(
+    lambda start: lsq_solver.solve_nonlinear(residuals, model.jacobian, start, args=fit_args,
+                                             bounds=bounds),  # Updated bounds applied here
+    model.name, fit_args, initial_guess, bounds, 'trf', source=file_path,
+    use_cache=not args.no_cache
 )
 
 # Extract best-fit parameters
@@ -61,14 +69,20 @@ logging.info(f"Optimization completed. Best-fit parameters: H0={H0_best:.2f}, ga
 print(f"Best-fit Hubble constant (H0): {H0_best:.2f} km/s/Mpc")
 print(f"Best-fit extinction coefficient (gamma): {gamma_best:.4f} mag/Mpc")
 
+H0_err, gamma_err = np.sqrt(np.diag(result.cov))
+logging.info(f"Standard errors: H0={H0_err:.2f}, gamma={gamma_err:.4f} ({result.nfev} evaluations)")
+
 # Save the results to a JSON file
 output_data = {
     'Hubble constant (H0)': H0_best,
-    'Extinction coefficient (gamma)': gamma_best
+    'Extinction coefficient (gamma)': gamma_best,
+    'Covariance': result.cov.tolist(),
+    'Provenance': result_store.provenance(result, model.name, bounds, initial_guess, 'trf', file_path)
 }
 
 output_file_path = 'optimization_results.json'
 logging.info(f"Saving results to {output_file_path}")
-with open(output_file_path, 'w') as output_file:
-    json.dump(output_data, output_file, indent=4)
+profiling.lap('write')
+atomic_io.write_json_atomic(output_data, output_file_path)
+profiling.write_profile_for(output_file_path)
 logging.info("Results successfully saved to JSON file")
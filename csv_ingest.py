@@ -0,0 +1,256 @@
+"""
+Typed, column-projecting CSV reader for plain numeric exports such as
+challenge-data.csv and plot_data.csv.
+
+With pandas installed (the default engine) the whole file goes through its
+C tokenizer in one call with the declared dtypes and usecols: no type
+inference, and unprojected columns are skipped. Otherwise byte blocks cut at
+line ends are parsed in C by np.fromstring into buffers preallocated from a
+newline count, and the projected columns copied out.
+
+The numpy engine rounds every decimal correctly (identical to json.load and
+np.loadtxt) but reads integers through float64 (exact up to 2**53), does not
+support quoted fields and is about twice as slow. The pandas float parser can
+be off by an ULP on long decimals like plot_data.csv's; pass engine='numpy'
+where values must be bit-identical to the JSON.
+"""
+import argparse
+import csv
+import time
+import numpy as np
+
+BLOCK_SIZE = 1 << 22
+# Rows per chunk for the pandas engine
+CHUNK_ROWS = 1 << 18
+
+
+def read_header(path):
+    with open(path, 'r', newline='') as f:
+        return next(csv.reader([f.readline()]))
+
+
+def resolve_columns(header, columns):
+    # Column names or positions -> positions in the file
+    if columns is None:
+        return list(range(len(header)))
+    positions = []
+    for col in columns:
+        if isinstance(col, (int, np.integer)):
+            if not -len(header) <= col < len(header):
+                raise IndexError(f"Column index {col} out of range for {len(header)} columns")
+            positions.append(int(col) % len(header))
+        elif col in header:
+            positions.append(header.index(col))
+        else:
+            raise KeyError(f"Column {col!r} not in header {header}")
+    return positions
+
+
+def count_rows(path, block_size=BLOCK_SIZE):
+    # Upper bound on data rows (newlines after the header, plus an unterminated last line)
+    lines = 0
+    last = b'\n'
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            lines += block.count(b'\n')
+            last = block[-1:]
+    return max(lines + (last != b'\n') - 1, 0)
+
+
+def iter_blocks(path, block_size=BLOCK_SIZE):
+    """Yield the data rows as byte blocks that each end on a complete line."""
+    with open(path, 'rb') as f:
+        f.readline()  # header
+        carry = b''
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            block = carry + block
+            cut = block.rfind(b'\n')
+            if cut < 0:
+                carry = block
+                continue
+            carry = block[cut + 1:]
+            yield block[:cut]
+        if carry.strip():
+            yield carry
+
+
+def parse_block(raw, n_fields, positions):
+    """
+    Parse one block of complete lines into an (rows, n_fields) float64 table
+    and return the row count and the projected columns (strided views).
+    """
+    raw = raw.replace(b'\r', b'').strip(b'\n')
+    if not raw:
+        return 0, [np.empty(0) for _ in positions]
+    if b'"' in raw:
+        raise ValueError("Quoted CSV fields are not supported by the numpy engine")
+    rows = raw.count(b'\n') + 1
+    values = np.fromstring(raw.replace(b'\n', b','), dtype=np.float64, sep=',')
+    if len(values) != rows * n_fields:
+        raise ValueError(f"Malformed CSV block: parsed {len(values)} values for {rows} rows of {n_fields}")
+    table = values.reshape(rows, n_fields)
+    return rows, [table[:, p] for p in positions]
+
+
+def _pandas():
+    try:
+        import pandas as pd
+    except ImportError:
+        return None
+    return pd
+
+
+def _pandas_engine(engine):
+    # pandas for 'auto' (when installed) and 'pandas', None for the numpy engine
+    pd = _pandas() if engine in ('auto', 'pandas') else None
+    if engine == 'pandas' and pd is None:
+        raise ImportError("engine='pandas' needs pandas installed")
+    return pd
+
+
+def _read_pandas(pd, path, header, positions, kinds):
+    # The projected columns of the whole file in one read_csv call
+    dtype = {p: kind for p, kind in zip(positions, kinds)}
+    frame = pd.read_csv(path, usecols=sorted(set(positions)), dtype=dtype, header=0, names=range(len(header)),
+                        engine='c')
+    return [frame[p].to_numpy() for p in positions]
+
+
+def _iter_projected(path, header, positions, kinds, engine, block_size):
+    # (rows, [column arrays]) per chunk from the chosen engine
+    pd = _pandas_engine(engine)
+    if pd is not None:
+        dtype = {p: kind for p, kind in zip(positions, kinds)}
+        for chunk in pd.read_csv(path, usecols=sorted(set(positions)), dtype=dtype, header=0, names=range(len(header)),
+                                 chunksize=CHUNK_ROWS, engine='c'):
+            yield len(chunk), [chunk[p].to_numpy() for p in positions]
+        return
+    for raw in iter_blocks(path, block_size):
+        yield parse_block(raw, len(header), positions)
+
+
+def read_csv_columns(path, columns=None, dtypes=None, engine='auto', block_size=BLOCK_SIZE):
+    """
+    Read the given columns (names or positions; all by default) of a numeric
+    CSV into a dict {header name: array}. `dtypes` maps a column name to its
+    dtype, everything else is float64. engine is 'auto', 'pandas' or 'numpy'.
+    """
+    header = read_header(path)
+    positions = resolve_columns(header, columns)
+    names = [header[p] for p in positions]
+    dtypes = dtypes or {}
+    kinds = [np.dtype(dtypes.get(name, np.float64)) for name in names]
+    pd = _pandas_engine(engine)
+    if pd is not None:
+        return dict(zip(names, _read_pandas(pd, path, header, positions, kinds)))
+    capacity = count_rows(path, block_size)
+    out = [np.empty(capacity, dtype=kind) for kind in kinds]
+    filled = 0
+    for rows, fields in _iter_projected(path, header, positions, kinds, engine, block_size):
+        for buf, field in zip(out, fields):
+            buf[filled:filled + rows] = field
+        filled += rows
+    return {name: buf[:filled] for name, buf in zip(names, out)}
+
+
+def iter_csv_chunks(path, columns=None, dtypes=None, engine='auto', block_size=BLOCK_SIZE):
+    # Streaming variant: one tuple of typed arrays per chunk, nothing preallocated for the whole file
+    header = read_header(path)
+    positions = resolve_columns(header, columns)
+    dtypes = dtypes or {}
+    kinds = [np.dtype(dtypes.get(header[p], np.float64)) for p in positions]
+    for rows, fields in _iter_projected(path, header, positions, kinds, engine, block_size):
+        if rows:
+            yield tuple(np.asarray(field, dtype=kind) for field, kind in zip(fields, kinds))
+
+
+def read_catalog_csv(path, engine='auto', block_size=BLOCK_SIZE):
+    """
+    The three catalog columns of a CSV such as challenge-data.csv, parsed into
+    one (3, n) float64 block and wrapped like the columnar store, so
+    `catalog_store.as_table` gives the same (n, 3) array transform_data does.
+    engine='numpy' gives values bit-identical to the JSON, at about half the speed.
+    """
+    import catalog_store
+    header = read_header(path)
+    positions = resolve_columns(header, catalog_store.CATALOG_COLUMNS)
+    kinds = [np.dtype(catalog_store.CATALOG_DTYPE)] * len(positions)
+    pd = _pandas_engine(engine)
+    if pd is not None:
+        return catalog_store.ColumnCatalog(np.stack(_read_pandas(pd, path, header, positions, kinds)))
+    block = np.empty((len(positions), count_rows(path, block_size)), dtype=catalog_store.CATALOG_DTYPE)
+    filled = 0
+    for rows, fields in _iter_projected(path, header, positions, kinds, engine, block_size):
+        for i, field in enumerate(fields):
+            block[i, filled:filled + rows] = field
+        filled += rows
+    return catalog_store.ColumnCatalog(block[:, :filled])
+
+
+### Benchmarks ###
+def _time(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark(path, columns=None, repeat=5):
+    """Best-of-`repeat` seconds for this reader against pd.read_csv and np.loadtxt on the same columns."""
+    header = read_header(path)
+    positions = resolve_columns(header, columns)
+    results = {
+        'csv_ingest (numpy engine)': _time(lambda: read_csv_columns(path, positions, engine='numpy'), repeat),
+        'np.loadtxt': _time(lambda: np.loadtxt(path, delimiter=',', skiprows=1, usecols=positions, ndmin=2), repeat),
+    }
+    pd = _pandas()
+    if pd is not None:
+        results['csv_ingest (pandas engine)'] = _time(lambda: read_csv_columns(path, positions, engine='pandas'),
+                                                      repeat)
+        results['pd.read_csv (plotter.py)'] = _time(lambda: pd.read_csv(path), repeat)
+        results['pd.read_csv(usecols, dtype)'] = _time(
+            lambda: pd.read_csv(path, usecols=positions, dtype={header[p]: np.float64 for p in positions}), repeat)
+    return results
+
+
+def write_synthetic_csv(path, rows, digits=25, seed=0):
+    # plot_data.csv-shaped file (integer distance, long decimal velocity) for benchmarking
+    rng = np.random.default_rng(seed)
+    distance = rng.integers(1, 500, size=rows)
+    velocity = distance * 70.0 + rng.normal(0, 500, size=rows)
+    with open(path, 'w') as f:
+        f.write('Distance,Velocity\n')
+        for start in range(0, rows, 100000):
+            stop = min(start + 100000, rows)
+            f.writelines(f"{d},{v:.{digits - 6}f}\n" for d, v in zip(distance[start:stop], velocity[start:stop]))
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Typed CSV ingest and its benchmark against pandas/numpy')
+    parser.add_argument('csv', nargs='?', default='challenge-data.csv')
+    parser.add_argument('--columns', nargs='+', help='column names or 0-based positions')
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--synthetic-rows', type=int, help='benchmark on a generated plot_data-style file instead')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--engine', choices=('auto', 'pandas', 'numpy'), default='auto')
+    args = parser.parse_args()
+
+    columns = None if args.columns is None else [int(c) if c.isdigit() else c for c in args.columns]
+    path = args.csv
+    if args.synthetic_rows:
+        path = write_synthetic_csv(f"synthetic_{args.synthetic_rows}.csv", args.synthetic_rows)
+    if args.benchmark:
+        for name, seconds in benchmark(path, columns, args.repeat).items():
+            print(f"{name:30s} {seconds * 1000:10.2f} ms")
+    else:
+        for name, values in read_csv_columns(path, columns, engine=args.engine).items():
+            print(f"{name}: {len(values)} rows, dtype {values.dtype}, first {values[:3]}")
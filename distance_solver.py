@@ -0,0 +1,100 @@
+import logging
+import numpy as np
+from scipy.special import lambertw
+
+BETA = np.log(10.0) / 5  # 10**(x/5) == exp(BETA * x)
+_SERIES_CUTOFF = 1e-8
+
+
+def uncorrected_distances(m, M):
+    return 10 ** ((m - M + 5) / 5) / 1e6
+
+
+def _broadcast_k(k, shape):
+    k = np.asarray(k, dtype=float)
+    if k.size == 1:
+        k = k.reshape(())
+    return np.broadcast_to(k, shape)
+
+
+def _solve_lambertw(k, a):
+    # D = a * exp(-BETA*k*D)  <=>  x e^x = BETA*k*a with x = BETA*k*D
+    x = BETA * k * a
+    D = np.array(a, dtype=float, copy=True)
+    converged = np.ones(a.shape, dtype=bool)
+
+    small = np.abs(x) < _SERIES_CUTOFF
+    D[small] = a[small] * (1 - x[small])  # W(x)/x = 1 - x + O(x^2)
+
+    big = ~small
+    # For k < 0 the principal branch needs x >= -1/e; below that there is no real root
+    real_root = big & (x >= -np.exp(-1))
+    w = lambertw(x[real_root], 0)
+    D[real_root] = w.real / (BETA * k[real_root])
+
+    no_root = big & ~real_root
+    D[no_root] = np.nan
+    converged[no_root] = False
+    return D, converged, np.zeros(a.shape, dtype=int)
+
+
+def _solve_newton(k, a, tol, maxiter):
+    # Newton on g(D) = ln D + BETA*k*D - ln a, g'(D) = 1/D + BETA*k, starting from D = a.
+    # Rows drop out of the active set as soon as their relative step is below tol.
+    D = np.array(a, dtype=float, copy=True)
+    log_a = np.log(a)
+    iterations = np.zeros(a.shape, dtype=int)
+    active = np.ones(a.shape, dtype=bool)
+    bk = BETA * k
+    for _ in range(maxiter):
+        idx = np.flatnonzero(active)
+        if idx.size == 0:
+            break
+        d = D[idx]
+        step = (np.log(d) + bk[idx] * d - log_a[idx]) / (1 / d + bk[idx])
+        # never step to or past zero; halve the distance instead
+        d_new = np.where(d - step > 0, d - step, d / 2)
+        D[idx] = d_new
+        iterations[idx] += 1
+        done = np.abs(d_new - d) <= tol * np.abs(d_new)
+        active[idx[done]] = False
+    converged = ~active & np.isfinite(D)
+    D[~converged] = np.nan
+    return D, converged, iterations
+
+
+def corrected_distances(k, m, M, method='lambertw', tol=1e-12, maxiter=50, return_info=False):
+    """
+    Solve the extinction-corrected distance D = 10**((m - k*D - M + 5)/5)/1e6 in Mpc.
+
+    This is the fixed point the old `for _ in range(10)` loops were iterating
+    towards. method='lambertw' uses the closed form D = W(BETA*k*a)/(BETA*k);
+    method='newton' iterates only on rows that have not converged yet. Rows
+    without a real solution (large negative k) come back as NaN and are logged.
+    With return_info=True a dict with the `converged` mask and per-row
+    `iterations` is returned as well.
+    """
+    m = np.asarray(m, dtype=float)
+    M = np.asarray(M, dtype=float)
+    return solve_distances(k, uncorrected_distances(m, M), method, tol, maxiter, return_info)
+
+
+def solve_distances(k, a, method='lambertw', tol=1e-12, maxiter=50, return_info=False):
+    # Same as corrected_distances, starting from precomputed uncorrected distances `a`
+    a = np.asarray(a, dtype=float)
+    k = _broadcast_k(k, a.shape)
+
+    if method == 'lambertw':
+        D, converged, iterations = _solve_lambertw(k, a)
+    elif method == 'newton':
+        D, converged, iterations = _solve_newton(k, a, tol, maxiter)
+    else:
+        raise ValueError(f"Unknown method {method!r}; use 'lambertw' or 'newton'")
+
+    failed = np.flatnonzero(~converged)
+    if failed.size:
+        logging.warning(f"corrected_distances: {failed.size} of {a.size} objects have no convergent "
+                        f"solution (first indices: {failed[:10].tolist()})")
+    if return_info:
+        return D, {'converged': converged, 'iterations': iterations, 'failed': failed}
+    return D
@@ -0,0 +1,445 @@
+"""
+Affine-invariant ensemble MCMC (Goodman & Weare stretch move) for the
+magnitude models, with every walker's likelihood evaluated in one batched
+call and the chain checkpointed to disk as it runs.
+
+The walkers are split into two halves that are updated in turn, each half
+proposing against the other, so one half's proposals are independent and are
+evaluated as a single (walkers/2, p) matrix: broadcasted through
+MagnitudeModel.batch_chi_square for small catalogs, one fused chi_square per
+row past LOOP_ROWS rows. With workers > 1 that matrix is split into blocks
+across a process pool holding the catalog in shared memory
+(model_sweep.share_catalog).
+
+The likelihood is Gaussian in the magnitude residuals, exp(-chi2 / (2 s^2)),
+with s^2 the residual variance of the best fit unless given; priors are flat
+inside the model's bounds.
+
+A checkpoint directory holds chain.npy and log_prob.npy (memory-mapped,
+written step by step) and state.json (positions' step count, RNG state,
+acceptance counts), which is replaced atomically after the arrays are
+flushed, so a killed run resumes from its last checkpoint:
+
+    python ensemble_sampler.py distance_extinction --steps 20000 --checkpoint chains/gpt2
+    python ensemble_sampler.py rv_ebv --walkers 64 --steps 50000 --checkpoint chains/tiger --workers 4
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import atomic_io
+import catalog_store
+import hubble_models
+import model_sweep
+
+DEFAULT_WALKERS = 32
+STRETCH_SCALE = 2.0
+CHECKPOINT_EVERY = 100
+# Sokal's window constant for the integrated autocorrelation time
+AUTOCORR_WINDOW = 5
+# Chains shorter than this many autocorrelation times give unreliable estimates
+AUTOCORR_RELIABLE = 50
+STATE_VERSION = 1
+# Metadata a resumed run must share with its checkpoint
+RESUME_KEYS = ('model', 'data_hash', 'sigma2')
+# From this many rows on, one fused chi_square per walker beats the broadcasted
+# batch, whose (walkers, rows) temporaries no longer fit in cache
+LOOP_ROWS = 2048
+
+# Per-worker evaluators, keyed by model name
+_worker_evaluators = {}
+
+
+class ChiSquareBatch:
+    """(k, p) parameter rows -> (k,) chi-square on fixed data, by whichever path is faster for its size."""
+
+    def __init__(self, model, m_obs, M, z):
+        self.model = model
+        self.m_obs = m_obs
+        self.M = M
+        self.v = model.velocity(z)
+        self.objective = model.batch_objective(m_obs, M, z)
+
+    def __call__(self, params):
+        if len(self.m_obs) < LOOP_ROWS:
+            return self.objective(params)
+        return np.array([self.model.chi_square(p, self.v, self.M, self.m_obs) for p in params])
+
+
+def _worker_chi2(model_name, params):
+    # Runs in a worker: chi-square for a block of parameter rows on the shared catalog
+    evaluate = _worker_evaluators.get(model_name)
+    if evaluate is None:
+        m, M, z = model_sweep._worker_columns
+        evaluate = _worker_evaluators[model_name] = ChiSquareBatch(hubble_models.get_model(model_name), m, M, z)
+    return evaluate(params)
+
+
+class ModelPosterior:
+    """
+    Vectorised log posterior of a MagnitudeModel: (k, p) parameter rows ->
+    (k,) log probabilities, -inf outside the bounds. Call close() when done
+    if workers > 1.
+    """
+
+    def __init__(self, model, m_obs, M, z, sigma2=None, bounds=None, workers=1):
+        self.model = hubble_models.get_model(model) if isinstance(model, str) else model
+        self.m_obs = np.asarray(m_obs, dtype=np.float64)
+        self.M = np.asarray(M, dtype=np.float64)
+        self.z = np.asarray(z, dtype=np.float64)
+        bounds = self.model.bounds if bounds is None else bounds
+        self.lo = np.array([-np.inf if b[0] is None else b[0] for b in bounds], dtype=float)
+        self.hi = np.array([np.inf if b[1] is None else b[1] for b in bounds], dtype=float)
+        self.objective = ChiSquareBatch(self.model, self.m_obs, self.M, self.z)
+        self.best = None
+        if sigma2 is None:
+            import lsq_solver
+            self.best = lsq_solver.fit_model(self.model, self.m_obs, self.M, self.z)
+            sigma2 = self.best.fun / max(len(self.m_obs) - len(self.lo), 1)
+        self.sigma2 = float(sigma2)
+        self.workers = workers
+        self._shm = None
+        self._pool = None
+        if workers > 1:
+            self._shm, shape = model_sweep.share_catalog(np.stack([self.m_obs, self.M, self.z]))
+            self._pool = ProcessPoolExecutor(max_workers=workers, initializer=model_sweep._attach_catalog,
+                                             initargs=(self._shm.name, shape))
+
+    @property
+    def n_dim(self):
+        return len(self.lo)
+
+    def chi_square(self, params):
+        if self._pool is None or len(params) < 2 * self.workers:
+            return self.objective(params)
+        blocks = np.array_split(params, self.workers)
+        return np.concatenate(list(self._pool.map(_worker_chi2, [self.model.name] * len(blocks), blocks)))
+
+    def __call__(self, params):
+        params = np.atleast_2d(params)
+        out = np.full(len(params), -np.inf)
+        inside = np.all((params >= self.lo) & (params <= self.hi), axis=1)
+        if inside.any():
+            with np.errstate(invalid='ignore'):
+                out[inside] = -0.5 * self.chi_square(params[inside]) / self.sigma2
+        out[np.isnan(out)] = -np.inf
+        return out
+
+    def initial_ball(self, n_walkers, center=None, scale=1e-3, seed=0):
+        """Walkers in a small Gaussian ball around `center` (default: the best fit), pulled inside the bounds."""
+        if center is None:
+            if self.best is None:
+                import lsq_solver
+                self.best = lsq_solver.fit_model(self.model, self.m_obs, self.M, self.z)
+            center = self.best.x
+        center = np.asarray(center, dtype=float)
+        width = np.where(np.isfinite(self.hi - self.lo), self.hi - self.lo, np.abs(center) + 1.0)
+        rng = np.random.default_rng(seed)
+        p0 = center + scale * width * rng.standard_normal((n_walkers, len(center)))
+        # Reflect off the bounds, then keep a hair inside them (best fits often sit on a bound)
+        p0 = np.where(p0 < self.lo, 2 * self.lo - p0, p0)
+        p0 = np.where(p0 > self.hi, 2 * self.hi - p0, p0)
+        margin = 1e-9 * width
+        return np.clip(p0, self.lo + margin, self.hi - margin)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+### Checkpoints ###
+def catalog_hash(m_obs, M, z):
+    """SHA-256 of the float64 catalog columns, recorded in a checkpoint to tie it to its data."""
+    digest = hashlib.sha256()
+    for column in (m_obs, M, z):
+        digest.update(np.ascontiguousarray(column, dtype=np.float64).data)
+    return digest.hexdigest()
+
+
+def read_state(directory):
+    # state.json of an existing checkpoint, or None
+    path = os.path.join(directory, 'state.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _check_resume(state, meta, directory):
+    # A checkpoint only continues the same posterior: same model, data and likelihood scale
+    for key in RESUME_KEYS:
+        if key not in meta:
+            continue
+        stored = state.get(key)
+        same = stored == meta[key]
+        if key == 'sigma2' and stored is not None and meta[key] is not None:
+            same = np.isclose(stored, meta[key], rtol=1e-12, atol=0)
+        if not same:
+            raise ValueError(f"Checkpoint {directory} was written with {key}={stored!r}, "
+                             f"this run has {key}={meta[key]!r}; use a new checkpoint directory")
+
+
+class Checkpoint:
+    """chain.npy / log_prob.npy memmaps plus an atomically replaced state.json in one directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.chain = None
+        self.log_prob = None
+        self.state = None
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def exists(self):
+        return os.path.exists(self._path('state.json'))
+
+    def create(self, n_steps, n_walkers, n_dim, meta):
+        os.makedirs(self.directory, exist_ok=True)
+        self.chain = np.lib.format.open_memmap(self._path('chain.npy'), mode='w+', dtype=np.float64,
+                                               shape=(n_steps, n_walkers, n_dim))
+        self.log_prob = np.lib.format.open_memmap(self._path('log_prob.npy'), mode='w+', dtype=np.float64,
+                                                  shape=(n_steps, n_walkers))
+        self.state = dict(meta, version=STATE_VERSION, step=0)
+
+    def open(self):
+        with open(self._path('state.json'), 'r') as f:
+            self.state = json.load(f)
+        if self.state.get('version') != STATE_VERSION:
+            raise ValueError(f"Unsupported checkpoint version {self.state.get('version')} in {self.directory}")
+        self.chain = np.load(self._path('chain.npy'), mmap_mode='r+')
+        self.log_prob = np.load(self._path('log_prob.npy'), mmap_mode='r+')
+        return self.state
+
+    def reserve(self, n_steps):
+        # Longer run requested on resume: copy the steps so far into larger arrays.
+        # Call only once the resume has been validated; this rewrites the files.
+        if n_steps <= len(self.chain):
+            return
+        done = self.state['step']
+        for name in ('chain', 'log_prob'):
+            old = getattr(self, name)
+            tmp = self._path(name + '.grow.npy')
+            new = np.lib.format.open_memmap(tmp, mode='w+', dtype=old.dtype, shape=(n_steps,) + old.shape[1:])
+            new[:done] = old[:done]
+            new.flush()
+            del new, old
+            setattr(self, name, None)
+            os.replace(tmp, self._path(name + '.npy'))
+            setattr(self, name, np.load(self._path(name + '.npy'), mmap_mode='r+'))
+
+    def save(self, step, rng, accepted, seconds):
+        # Arrays first, then the state that points at them
+        self.chain.flush()
+        self.log_prob.flush()
+        self.state.update(step=int(step), rng=rng.bit_generator.state, accepted=accepted.tolist(),
+                          seconds=float(seconds))
+        atomic_io.write_json_atomic(self.state, self._path('state.json'))
+
+
+### Sampler ###
+def stretch_move(rng, walkers, log_prob, complement, log_prob_fn, a=STRETCH_SCALE):
+    """
+    One stretch move for `walkers` against `complement`: Y = X_j + Z (X_k - X_j)
+    with Z ~ 1/sqrt(z) on [1/a, a]. Returns (positions, log probs, accepted mask).
+    """
+    k, n_dim = walkers.shape
+    z = ((a - 1) * rng.random(k) + 1) ** 2 / a
+    partners = complement[rng.integers(0, len(complement), size=k)]
+    proposal = partners + z[:, None] * (walkers - partners)
+    proposal_lp = log_prob_fn(proposal)
+    with np.errstate(invalid='ignore'):
+        log_ratio = (n_dim - 1) * np.log(z) + proposal_lp - log_prob
+    accept = np.log(rng.random(k)) < log_ratio
+    walkers = np.where(accept[:, None], proposal, walkers)
+    log_prob = np.where(accept, proposal_lp, log_prob)
+    return walkers, log_prob, accept
+
+
+def run_sampler(log_prob_fn, p0, n_steps, seed=0, a=STRETCH_SCALE, checkpoint=None,
+                checkpoint_every=CHECKPOINT_EVERY, meta=None, progress=None):
+    """
+    Sample for n_steps (total, counting steps already in the checkpoint).
+    `checkpoint` is a directory; an existing one is resumed, its positions
+    and RNG state replacing p0 and seed; it must have been written with the
+    same RESUME_KEYS in `meta`, and n_steps cannot be below its step count.
+    Returns a dict with the chain,
+    log_prob, acceptance fractions and timing.
+    """
+    p0 = np.asarray(p0, dtype=float)
+    n_walkers, n_dim = p0.shape
+    if n_walkers < 2 * n_dim or n_walkers % 2:
+        raise ValueError(f"Need an even number of walkers, at least {2 * n_dim}; got {n_walkers}")
+    rng = np.random.default_rng(seed)
+    accepted = np.zeros(n_walkers, dtype=np.int64)
+    previous_seconds = 0.0
+    store = None
+    if checkpoint is not None:
+        store = Checkpoint(checkpoint)
+        if store.exists():
+            state = store.open()
+            _check_resume(state, meta or {}, checkpoint)
+            if n_steps < state['step']:
+                raise ValueError(f"Checkpoint {checkpoint} already holds {state['step']} steps; "
+                                 f"ask for at least that many, not {n_steps}")
+            if tuple(store.chain.shape[1:]) != (n_walkers, n_dim):
+                raise ValueError(f"Checkpoint {checkpoint} holds {store.chain.shape[1:]} walkers x dims, "
+                                 f"not {(n_walkers, n_dim)}")
+            store.reserve(n_steps)
+            start = state['step']
+            rng.bit_generator.state = state['rng']
+            accepted = np.array(state['accepted'], dtype=np.int64)
+            previous_seconds = state['seconds']
+            logging.info(f"Resuming {checkpoint} at step {start} of {n_steps}")
+        else:
+            store.create(n_steps, n_walkers, n_dim, meta or {})
+            start = 0
+        chain, log_probs = store.chain, store.log_prob
+    else:
+        chain = np.empty((n_steps, n_walkers, n_dim))
+        log_probs = np.empty((n_steps, n_walkers))
+        start = 0
+
+    if start > 0:
+        positions = np.array(chain[start - 1])
+        lp = np.array(log_probs[start - 1])
+    else:
+        positions = p0.copy()
+        lp = log_prob_fn(positions)
+        if not np.all(np.isfinite(lp)):
+            raise ValueError(f"{np.count_nonzero(~np.isfinite(lp))} initial walkers have zero posterior probability")
+
+    halves = (np.arange(0, n_walkers, 2), np.arange(1, n_walkers, 2))
+    t0 = time.perf_counter()
+    for step in range(start, n_steps):
+        for s, c in (halves, halves[::-1]):
+            positions[s], lp[s], acc = stretch_move(rng, positions[s], lp[s], positions[c], log_prob_fn, a)
+            accepted[s] += acc
+        chain[step] = positions
+        log_probs[step] = lp
+        done = step + 1
+        if store is not None and (done % checkpoint_every == 0 or done == n_steps):
+            store.save(done, rng, accepted, previous_seconds + time.perf_counter() - t0)
+        if progress and done % progress == 0:
+            logging.info(f"Step {done}/{n_steps}, acceptance {accepted.sum() / (done * n_walkers):.3f}")
+    seconds = time.perf_counter() - t0
+    ran = n_steps - start
+    return {
+        'chain': chain[:n_steps],
+        'log_prob': log_probs[:n_steps],
+        'acceptance_fraction': accepted / max(n_steps, 1),
+        'steps_run': ran,
+        'seconds': seconds,
+        'total_seconds': previous_seconds + seconds,
+        # Each step evaluates every walker once
+        'samples_per_second': ran * n_walkers / seconds if seconds > 0 else float('nan'),
+    }
+
+
+### Diagnostics ###
+def autocorr_function(x):
+    """Normalised autocorrelation of a 1-D series, via FFT zero-padded to a power of two."""
+    x = np.asarray(x, dtype=float)
+    n = 1 << int(np.ceil(np.log2(max(len(x), 1))))
+    f = np.fft.rfft(x - x.mean(), n=2 * n)
+    acf = np.fft.irfft(f * np.conjugate(f))[:len(x)]
+    return acf / acf[0] if acf[0] > 0 else np.zeros_like(acf)
+
+
+def integrated_time(chain, c=AUTOCORR_WINDOW):
+    """
+    Integrated autocorrelation time of each parameter of a (steps, walkers,
+    dim) chain: walker-averaged autocorrelation summed up to Sokal's window,
+    the first M with M >= c * tau(M).
+    """
+    chain = np.asarray(chain)
+    taus = np.empty(chain.shape[2])
+    for d in range(chain.shape[2]):
+        acf = np.mean([autocorr_function(chain[:, w, d]) for w in range(chain.shape[1])], axis=0)
+        tau = 2.0 * np.cumsum(acf) - 1.0
+        window = np.arange(len(tau)) >= c * tau
+        taus[d] = tau[np.argmax(window)] if window.any() else tau[-1]
+    return taus
+
+
+def summarize(result, param_names, burn=None, thin=1):
+    """Autocorrelation times, posterior medians and 16/84% ranges after burn-in, throughput."""
+    chain = result['chain']
+    tau = integrated_time(chain)
+    if burn is None:
+        burn = int(min(2 * np.nanmax(tau), len(chain) // 2)) if np.all(np.isfinite(tau)) else len(chain) // 4
+    samples = chain[burn::thin].reshape(-1, chain.shape[2])
+    q16, q50, q84 = np.percentile(samples, [16, 50, 84], axis=0)
+    steps = len(chain)
+    return {
+        'steps': steps,
+        'walkers': chain.shape[1],
+        'burn': burn,
+        'thin': thin,
+        'acceptance_fraction': float(np.mean(result['acceptance_fraction'])),
+        'autocorr_time': dict(zip(param_names, map(float, tau))),
+        'autocorr_reliable': bool(steps > AUTOCORR_RELIABLE * np.nanmax(tau)),
+        'effective_samples': float((steps - burn) * chain.shape[1] / np.nanmax(tau)),
+        'samples_per_second': result['samples_per_second'],
+        'seconds': result['total_seconds'],
+        'posterior': {name: {'median': float(m), 'minus': float(m - lo), 'plus': float(hi - m)}
+                      for name, lo, m, hi in zip(param_names, q16, q50, q84)},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Ensemble MCMC posterior for one magnitude model')
+    parser.add_argument('model', choices=sorted(hubble_models.MODELS))
+    parser.add_argument('--catalog', default='Challenge2_data.json')
+    parser.add_argument('--walkers', type=int, default=DEFAULT_WALKERS)
+    parser.add_argument('--steps', type=int, default=5000, help='total steps, including any already checkpointed')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sigma', type=float, help='magnitude error (default: residual scatter of the best fit)')
+    parser.add_argument('--workers', type=int, default=1, help='processes sharing each likelihood batch')
+    parser.add_argument('--checkpoint', help='checkpoint directory; resumed if it exists')
+    parser.add_argument('--checkpoint-every', type=int, default=CHECKPOINT_EVERY)
+    parser.add_argument('--burn', type=int)
+    parser.add_argument('--thin', type=int, default=1)
+    parser.add_argument('--output', help='save the summary as JSON')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    data = catalog_store.read_catalog(args.catalog)
+    m, M, z = (np.asarray(data[name]) for name in catalog_store.CATALOG_COLUMNS)
+    sigma2 = None if args.sigma is None else args.sigma ** 2
+    resumed = read_state(args.checkpoint) if args.checkpoint else None
+    if resumed is not None and sigma2 is None:
+        # Keep the checkpoint's likelihood scale rather than refitting it
+        sigma2 = resumed.get('sigma2')
+    posterior = ModelPosterior(args.model, m, M, z, sigma2, workers=args.workers)
+    try:
+        p0 = posterior.initial_ball(args.walkers, seed=args.seed)
+        meta = {'model': args.model, 'catalog': args.catalog, 'data_hash': catalog_hash(m, M, z),
+                'sigma2': posterior.sigma2, 'seed': args.seed, 'param_names': list(posterior.model.param_names)}
+        result = run_sampler(posterior, p0, args.steps, args.seed, checkpoint=args.checkpoint,
+                             checkpoint_every=args.checkpoint_every, meta=meta, progress=max(args.steps // 10, 1))
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        posterior.close()
+
+    summary = summarize(result, posterior.model.param_names, args.burn, args.thin)
+    print(f"{args.model}: {summary['steps']} steps x {summary['walkers']} walkers, "
+          f"acceptance {summary['acceptance_fraction']:.3f}, {summary['samples_per_second']:.0f} samples/s")
+    for name, post in summary['posterior'].items():
+        tau = summary['autocorr_time'][name]
+        print(f"  {name} = {post['median']:.6g} -{post['minus']:.3g} +{post['plus']:.3g}  (tau {tau:.1f} steps)")
+    if not summary['autocorr_reliable']:
+        print(f"  Warning: chain is shorter than {AUTOCORR_RELIABLE} autocorrelation times; run longer")
+    if args.output:
+        atomic_io.write_json_atomic(summary, args.output)
+        print(f"Summary saved to {args.output}")
@@ -0,0 +1,158 @@
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+import numpy as np
+
+# Every cache created here, by name, so callers can report the savings in one place
+_registry = weakref.WeakValueDictionary()
+
+
+class LRUCache:
+    """
+    Bounded mapping with hit/miss/eviction counters.
+
+    policy='lru' evicts the least recently used entry, policy='fifo' the oldest
+    insertion regardless of use (cheaper bookkeeping when hits are rare).
+    """
+
+    def __init__(self, maxsize=1024, policy='lru', name=None):
+        if policy not in ('lru', 'fifo'):
+            raise ValueError(f"Unknown eviction policy {policy!r}; use 'lru' or 'fifo'")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.name = name or f"cache-{id(self):x}"
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        _registry[self.name] = self
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self.hits += 1
+                if self.policy == 'lru':
+                    self._data.move_to_end(key)
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            if key in self._data:
+                self._data[key] = value
+                return
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, func, *args):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = func(*args)
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'name': self.name,
+            'policy': self.policy,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+def cache_stats():
+    return [cache.stats() for cache in list(_registry.values())]
+
+
+### Dataset fingerprints ###
+_fingerprints = {}
+
+
+def _array_fingerprint(arr):
+    # Hashing is O(n), so remember the digest per live array object. The memo is
+    # dropped when the array is garbage collected; arrays mutated in place after
+    # being fingerprinted must call forget_fingerprint().
+    key = id(arr)
+    entry = _fingerprints.get(key)
+    if entry is not None and entry[0]() is arr:
+        return entry[1]
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str((arr.dtype.str, arr.shape)).encode())
+    h.update(np.ascontiguousarray(arr).data)
+    digest = h.hexdigest()
+    _fingerprints[key] = (weakref.ref(arr, lambda _, key=key: _fingerprints.pop(key, None)), digest)
+    return digest
+
+
+def fingerprint(*arrays):
+    """Content hash identifying a dataset made of the given arrays."""
+    # np.asarray would turn a memmap into a fresh view each call and defeat the memo
+    digests = [_array_fingerprint(arr if isinstance(arr, np.ndarray) else np.asarray(arr)) for arr in arrays]
+    if len(digests) == 1:
+        return digests[0]
+    return hashlib.blake2b(''.join(digests).encode(), digest_size=16).hexdigest()
+
+
+def forget_fingerprint(arr):
+    _fingerprints.pop(id(arr), None)
+
+
+def params_key(params):
+    return np.asarray(params, dtype=float).tobytes()
+
+
+### Parameter-independent terms ###
+class DatasetTerms:
+    """Per-dataset columns that do not depend on any fit parameter."""
+
+    def __init__(self, m, M, z, c):
+        self.v = c * z
+        self.log10_v = np.log10(self.v)
+        self.m_minus_M = m - M
+        self.distance0 = 10 ** ((self.m_minus_M + 5) / 5) / 1e6  # uncorrected distance, Mpc
+        for arr in (self.v, self.log10_v, self.m_minus_M, self.distance0):
+            arr.flags.writeable = False
+        self.fingerprint = fingerprint(m, M, z)
+
+
+_terms_cache = LRUCache(maxsize=8, name='dataset_terms')
+
+
+def dataset_terms(m, M, z, c):
+    """DatasetTerms for (m, M, z, c), computed once per dataset content."""
+    key = (fingerprint(m, M, z), float(c))
+    return _terms_cache.get_or_compute(key, DatasetTerms, m, M, z, c)
+
+
+def cached_objective(func, model_name, data_fingerprint, cache=None, maxsize=4096, policy='lru'):
+    """
+    Wrap func(params, *args) so repeated parameter vectors are answered from a
+    cache keyed by (model, dataset fingerprint, params). The extra arguments are
+    assumed to be the dataset the fingerprint describes. The wrapper exposes the
+    cache as `.cache`.
+    """
+    if cache is None:
+        cache = LRUCache(maxsize, policy, name=f"{model_name}.objective")
+
+    def wrapper(params, *args):
+        key = (model_name, data_fingerprint, params_key(params))
+        return cache.get_or_compute(key, func, params, *args)
+
+    wrapper.cache = cache
+    wrapper.__wrapped__ = func
+    return wrapper
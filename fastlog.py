@@ -0,0 +1,167 @@
+import atexit
+import copy
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+import numpy as np
+
+DEFAULT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# The listener set up by the first setup_logging call
+_listener = None
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    # The stock QueueHandler runs the full Formatter (timestamps included) on the
+    # calling thread. Here only the message arguments are merged, so the values
+    # are captured as they were at the call, and the listener thread does the
+    # remaining formatting and all file I/O.
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per (logger, message template): at most `burst` records at once
+    and `per_second` sustained. The next record let through carries a count of
+    what was dropped in between.
+    """
+
+    def __init__(self, per_second=10.0, burst=20):
+        super().__init__()
+        self.per_second = per_second
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            tokens, last, dropped = self._buckets.get(key, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - last) * self.per_second)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now, dropped + 1)
+                return False
+            self._buckets[key] = (tokens - 1, now, 0)
+        if dropped:
+            record.msg = f"{record.msg} ({dropped} similar messages suppressed)"
+        return True
+
+
+class Sampler:
+    """
+    Decide whether a per-iteration event should be logged: every `every`-th call,
+    and no more than `max_per_second` if given. Check it before building the
+    message so skipped events cost a counter increment.
+    """
+
+    def __init__(self, every=1, max_per_second=None):
+        self.every = max(int(every), 1)
+        self.min_interval = 1.0 / max_per_second if max_per_second else 0.0
+        self.calls = 0
+        self.emitted = 0
+        self._last = float('-inf')
+
+    def __call__(self):
+        self.calls += 1
+        if (self.calls - 1) % self.every:
+            return False
+        if self.min_interval:
+            now = time.monotonic()
+            if now - self._last < self.min_interval:
+                return False
+            self._last = now
+        self.emitted += 1
+        return True
+
+
+class Lazy:
+    # Defer an expensive message fragment until the record passes the level and
+    # filter checks; it is then evaluated on the logging thread, when the record is queued
+    def __init__(self, func, *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self):
+        return str(self.func(*self.args, **self.kwargs))
+
+
+def summarize_array(arr):
+    arr = np.asarray(arr)
+    if arr.size == 0 or not np.issubdtype(arr.dtype, np.number):
+        return f"array(shape={arr.shape}, dtype={arr.dtype})"
+    finite = np.isfinite(arr)
+    nan_count = int(np.count_nonzero(np.isnan(arr))) if np.issubdtype(arr.dtype, np.floating) else 0
+    if finite.any():
+        lo, hi = np.min(arr, where=finite, initial=np.inf), np.max(arr, where=finite, initial=-np.inf)
+        return f"array(shape={arr.shape}, dtype={arr.dtype}, min={lo:.6g}, max={hi:.6g}, nan={nan_count})"
+    return f"array(shape={arr.shape}, dtype={arr.dtype}, nan={nan_count})"
+
+
+def array_summary(arr):
+    """Log-friendly stand-in for an array: shape, dtype, finite min/max and NaN count, computed lazily."""
+    return Lazy(summarize_array, arr)
+
+
+def setup_logging(filename=None, level=logging.INFO, fmt=DEFAULT_FORMAT, rate_limit=None, store=None, run_id=None):
+    """
+    Drop-in for logging.basicConfig(filename=...) with a background writer.
+
+    Records below `level` are dropped before their arguments are formatted;
+    the rest are queued and written by a listener thread, which is flushed and
+    stopped at interpreter exit. `rate_limit` = (per_second, burst) attaches a
+    RateLimitFilter.
+
+    `store` is a run_log_store directory (or RunLogStore) that receives the
+    records as one indexed run; with neither `filename` nor `store` given it
+    is $HUBBLE_RUN_LOG, or run_log_store.DEFAULT_STORE.
+
+    Only the first call installs anything; later calls return its listener.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    handlers = []
+    if filename is not None:
+        file_handler = logging.FileHandler(filename)
+        file_handler.setFormatter(logging.Formatter(fmt))
+        handlers.append(file_handler)
+    if store is None and filename is None:
+        import run_log_store
+        store = os.environ.get(run_log_store.ENV_VAR) or run_log_store.DEFAULT_STORE
+    if store is not None:
+        import run_log_store
+        handlers.append(run_log_store.RunLogHandler(store, run_id))
+
+    records = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(records)
+    if rate_limit:
+        queue_handler.addFilter(RateLimitFilter(*rate_limit))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(_shutdown, listener)
+    _listener = listener
+    return listener
+
+
+def _shutdown(listener):
+    # Drain the queue, then close the handlers so the run-log handler writes its last batch
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
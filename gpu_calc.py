@@ -1,35 +1,38 @@
 import numpy as np
-from scipy.optimize import minimize
-import json
+import catalog_store
+import compute_backend
+import hubble_models
+import lsq_solver
+import profiling
 import logging
-from datetime import datetime
+import fastlog
 
 # Set up logging
-log_filename = datetime.now().strftime('logfile_%Y%m%d_%H%M%S.log')
-logging.basicConfig(filename=log_filename, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Runs log to the indexed run-log store ($HUBBLE_RUN_LOG, default runlogs/); see run_log_store.py
+fastlog.setup_logging()
 
 # Constants
 kappa_v = 0.1  # Example value for the extinction coefficient (for a given wavelength)
 
+# Per-evaluation log lines are sampled: 1 in 100 calls, at most 10 per second
+error_log_sampler = fastlog.Sampler(every=100, max_per_second=10)
+
 # Function to calculate the total error using NumPy
 def total_error(params):
-    logging.info(f"Calculating total error with params: {params}")
     H0, A_V = params
     # Perform the error calculation
     if H0 <= 0 or A_V < 0:
-        logging.warning(f"Unreasonable parameter values encountered: H0={H0}, A_V={A_V}")
+        logging.warning("Unreasonable parameter values encountered: H0=%s, A_V=%s", H0, A_V)
         return np.inf
     model = m - M - 5 * np.log10(np.maximum(v / H0, 1e-10)) + 5 - H0 * kappa_v * A_V
     error = model ** 2
     total_err = np.sum(error)
-    logging.info(f"Total error calculated: {total_err}")
     return total_err
 
 # Function to read data from a JSON file
 def read_data_from_json(file_path):
     logging.info(f"Reading data from JSON file: {file_path}")
-    with open(file_path, 'r') as file:
-        data = json.load(file)
+    data = catalog_store.read_catalog(file_path)
     logging.info("Data successfully read from JSON file")
     return data
 
@@ -37,22 +40,43 @@ def read_data_from_json(file_path):
 json_file_path = 'Challenge2_data.json'
 
 # Read data from the JSON file
+profiling.lap('load')
 data = read_data_from_json(json_file_path)
 
 # Set the arrays with the imported data
+profiling.lap('transform')
 logging.info("Setting up data arrays")
-m = np.array(data['Apparent Magitude (m)'])
-M = np.array(data['Absolute Magnitude (M)'])
-v = np.array(data['Redshift (z)'])
+m = np.asarray(data['Apparent Magitude (m)'])
+M = np.asarray(data['Absolute Magnitude (M)'])
+v = np.asarray(data['Redshift (z)'])
+
+# Batched version of total_error: (k, 2) matrix of (H0, A_V) rows -> k total errors
+total_error_batch = hubble_models.get_model('kappa').batch_objective(m, M, v)
 
 # Initial guess for H0 and A_V
 initial_guess = [67, 0.1]  # H0 = 67 km/s/Mpc, A_V = 0.1
 logging.info(f"Initial guess for H0 and A_V: {initial_guess}")
 
-# Minimize the total error using scipy.optimize
-logging.info("Starting minimization process")
-result = minimize(total_error, initial_guess, method='Powell')
-logging.info("Minimization process completed")
+# Minimize the total error with the analytic-Jacobian least-squares solver;
+# the bounds replace the np.inf wall total_error puts at H0 <= 0, A_V < 0
+profiling.lap('fit')
+logging.info(f"Starting minimization process on the {compute_backend.get_backend().name} backend")
+model = hubble_models.get_model('kappa')
+
+
+def kappa_residuals(params, v, M, m_obs):
+    # The residuals the solver evaluates, with sampled per-evaluation logging
+    r = model.residuals(params, v, M, m_obs)
+    if error_log_sampler():
+        logging.info("Total error at evaluation %d, params %s: %s", error_log_sampler.calls, params,
+                     fastlog.Lazy(np.dot, r, r))
+    return r
+
+
+result = lsq_solver.solve_nonlinear(kappa_residuals, model.jacobian, initial_guess,
+                                    args=(v, M, m), bounds=model.bounds)
+logging.info(f"Minimization process completed in {result.nfev} evaluations, total error {result.fun}")
+profiling.stop()
 
 # Output the estimated values for H0 and A_V
 H0_estimated, A_V_estimated = result.x
@@ -61,3 +85,4 @@ logging.info(f"Estimated A_V: {A_V_estimated}")
 
 print(f"Estimated H0: {H0_estimated} km/s/Mpc")
 print(f"Estimated A_V: {A_V_estimated}")
+profiling.write_profile('gpu_calc.profile.json')
@@ -0,0 +1,430 @@
+"""
+Global chi-square search on parameter grids, with adaptive refinement and
+profile likelihoods.
+
+The scripts' local optimisers start from hard-coded guesses and can end up
+anywhere along a flat valley or against a bound. Here chi-square is evaluated
+on a dense grid over the whole parameter box in broadcasted blocks
+(MagnitudeModel.batch_chi_square) split across threads, the lowest local
+minima of the grid are zoomed into a few times, and the best point is
+polished with the analytic-Jacobian solver. The full grid also gives the
+profile likelihood of every parameter and 2-D confidence contours.
+
+Chi-square is the scripts' unweighted sum of squares, so profiles are put in
+sigma units with s^2 = chi2_min / (n - p), as in lsq_solver's covariance.
+
+    python grid_search.py distance_extinction --points 201 --plot profile.png
+    python grid_search.py kappa --range A_V 0 20 --range H0 1 150
+"""
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from scipy.ndimage import minimum_filter
+from scipy.optimize import OptimizeResult
+import hubble_models
+
+DEFAULT_POINTS = 101
+REFINE_POINTS = 21
+REFINE_LEVELS = 4
+N_CANDIDATES = 3
+# Parameter vectors per evaluation block handed to one thread
+BLOCK_PARAMS = 4096
+# Passes allowed for fitting the profile grid to the contours, and the grid
+# points a contour must span along each axis to count as resolved
+MAX_ADAPT = 8
+MIN_RESOLVED = 10
+# Delta chi-square for 1-sigma on one parameter, and 68.3/95.4/99.73% for two
+PROFILE_LEVEL = 1.0
+# Times an open-ended side of the default box may be doubled while the minimum sits on it
+MAX_EXPAND = 6
+CONTOUR_LEVELS = (2.30, 6.18, 11.83)
+
+
+def _open_end(value, side):
+    # Stand-in for an open bound, a margin past `value` like model_sweep's random starts
+    if side == 'low':
+        return value / 2 if value > 0 else 2 * value - 1
+    return value * 2 + 1 if value > 0 else value / 2 + 1
+
+
+def default_ranges(model, m_obs=None, M=None, z=None):
+    """
+    Finite search box: the model's bounds, open ends placed around the
+    initial guess and, given the data, also around a local fit from it, so
+    the box holds at least the minimum a local optimiser would find.
+    """
+    centers = [np.asarray(model.initial_guess, dtype=float)]
+    if m_obs is not None and any(b[0] is None or b[1] is None for b in model.bounds):
+        import lsq_solver
+        try:
+            fit = lsq_solver.fit_model(model, m_obs, M, z, method='nonlinear')
+            if np.all(np.isfinite(fit.x)):
+                centers.append(np.asarray(fit.x, dtype=float))
+        except Exception as e:
+            logging.warning(f"Local fit for the search box failed ({type(e).__name__}: {e}); using the initial guess")
+    ranges = []
+    for k, (lo, hi) in enumerate(model.bounds):
+        lo = min(_open_end(c[k], 'low') for c in centers) if lo is None else lo
+        hi = max(_open_end(c[k], 'high') for c in centers) if hi is None else hi
+        ranges.append((float(lo), float(hi)))
+    return ranges
+
+
+def artificial_edges(model, ranges):
+    # (low, high) flags per parameter: True where the box edge is not one of the model's bounds
+    return [(b[0] is None or lo > b[0], b[1] is None or hi < b[1]) for (lo, hi), b in zip(ranges, model.bounds)]
+
+
+def edges_hit(x, ranges, flags, points):
+    """{index: 'low'|'high'} for parameters within half a coarse grid step of an artificial box edge."""
+    hits = {}
+    for k, (value, (lo, hi), (lo_free, hi_free)) in enumerate(zip(x, ranges, flags)):
+        step = (hi - lo) / max(points - 1, 1)
+        if lo_free and value - lo <= step / 2:
+            hits[k] = 'low'
+        elif hi_free and hi - value <= step / 2:
+            hits[k] = 'high'
+    return hits
+
+
+def _expand(model, ranges, hits):
+    # Double the box width past each edge the minimum ran into, stopping at the model's bounds
+    ranges = list(ranges)
+    for k, side in hits.items():
+        lo, hi = ranges[k]
+        bound = model.bounds[k][0 if side == 'low' else 1]
+        if side == 'low':
+            lo = lo - (hi - lo) if bound is None else max(bound, lo - (hi - lo))
+        else:
+            hi = hi + (hi - lo) if bound is None else min(bound, hi + (hi - lo))
+        ranges[k] = (lo, hi)
+    return ranges
+
+
+def grid_axes(ranges, points):
+    if np.ndim(points) == 0:
+        points = [points] * len(ranges)
+    return [np.linspace(lo, hi, n) for (lo, hi), n in zip(ranges, points)]
+
+
+def evaluate_grid(objective, axes, workers=None, block=BLOCK_PARAMS):
+    """
+    objective((k, p) parameter matrix) -> (k,) chi-square over the Cartesian
+    product of `axes`, returned with shape (len(axes[0]), len(axes[1]), ...).
+    The grid is never materialised: each block builds its own parameter rows.
+    """
+    shape = tuple(len(a) for a in axes)
+    out = np.empty(int(np.prod(shape)))
+    workers = workers or os.cpu_count() or 1
+
+    def run(start):
+        stop = min(start + block, len(out))
+        idx = np.unravel_index(np.arange(start, stop), shape)
+        params = np.column_stack([axis[i] for axis, i in zip(axes, idx)])
+        out[start:stop] = objective(params)
+
+    starts = range(0, len(out), block)
+    if workers == 1 or len(starts) == 1:
+        for start in starts:
+            run(start)
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='grid') as pool:
+            list(pool.map(run, starts))
+    return out.reshape(shape)
+
+
+def local_minima(chi2, n=N_CANDIDATES):
+    """Grid indices of the n lowest local minima (each cell no higher than its neighbours)."""
+    finite = np.where(np.isfinite(chi2), chi2, np.inf)
+    is_min = (minimum_filter(finite, size=3, mode='nearest') == finite) & np.isfinite(finite)
+    flat = np.flatnonzero(is_min)
+    flat = flat[np.argsort(finite.ravel()[flat], kind='stable')][:n]
+    return [np.unravel_index(i, chi2.shape) for i in flat]
+
+
+def refine(objective, axes, index, ranges, levels=REFINE_LEVELS, points=REFINE_POINTS, workers=None):
+    """
+    Zoom into one grid cell: a points^p grid spanning +-2 cells around it,
+    then around that grid's best cell, `levels` times (each level about
+    points/4 times finer). Returns (best params, chi2, evaluations).
+    """
+    centre = np.array([axis[i] for axis, i in zip(axes, index)])
+    step = np.array([axis[1] - axis[0] if len(axis) > 1 else 0.0 for axis in axes])
+    best, best_chi2, nfev = centre, np.inf, 0
+    for _ in range(levels):
+        sub_ranges = [(max(lo, c - 2 * h), min(hi, c + 2 * h)) for c, h, (lo, hi) in zip(centre, step, ranges)]
+        sub_axes = grid_axes(sub_ranges, points)
+        chi2 = evaluate_grid(objective, sub_axes, workers)
+        nfev += chi2.size
+        i = np.unravel_index(np.argmin(np.where(np.isfinite(chi2), chi2, np.inf)), chi2.shape)
+        if chi2[i] < best_chi2:
+            best_chi2 = float(chi2[i])
+            best = np.array([axis[k] for axis, k in zip(sub_axes, i)])
+        centre = best
+        step = np.array([(hi - lo) / max(points - 1, 1) for lo, hi in sub_ranges])
+    return best, best_chi2, nfev
+
+
+def sigma_scale(chi2_min, n, n_params):
+    # s^2 for turning the unweighted sum of squares into chi-square in sigma units
+    return max(chi2_min, np.finfo(float).tiny) / max(n - n_params, 1)
+
+
+def profile_likelihood(chi2, axis):
+    # Minimum over every other axis: the profile of parameter `axis`
+    others = tuple(k for k in range(chi2.ndim) if k != axis)
+    return np.min(chi2, axis=others) if others else chi2
+
+
+def interval_from_profile(values, delta, level=PROFILE_LEVEL):
+    """
+    (low, high, open) where the profile's delta chi-square crosses `level`,
+    linearly interpolated; open is True when the region reaches the grid edge.
+    """
+    inside = np.flatnonzero(delta <= level)
+    if len(inside) == 0:
+        i = int(np.argmin(delta))
+        return float(values[i]), float(values[i]), False
+    lo_i, hi_i = inside[0], inside[-1]
+    open_ = lo_i == 0 or hi_i == len(values) - 1
+
+    def crossing(i, j):
+        # between inside point i and outside point j
+        d0, d1 = delta[i], delta[j]
+        if not np.isfinite(d1) or d1 == d0:
+            return float(values[i])
+        return float(values[i] + (level - d0) / (d1 - d0) * (values[j] - values[i]))
+
+    low = float(values[0]) if lo_i == 0 else crossing(lo_i, lo_i - 1)
+    high = float(values[-1]) if hi_i == len(values) - 1 else crossing(hi_i, hi_i + 1)
+    return low, high, bool(open_)
+
+
+def contour_grid(chi2, i, j):
+    # Profile over every axis except i and j: what the (i, j) confidence contours are drawn from
+    others = tuple(k for k in range(chi2.ndim) if k not in (i, j))
+    plane = np.min(chi2, axis=others) if others else chi2
+    return plane if i < j else plane.T
+
+
+def _window(chi2, axes, scale, chi2_min, level, x):
+    # Bounding box of the cells within `level` (in sigma units) of the minimum and of x's cell, plus one cell
+    inside = np.isfinite(chi2) & ((chi2 - chi2_min) / scale <= level)
+    inside[tuple(int(np.argmin(np.abs(axis - v))) for axis, v in zip(axes, x))] = True
+    ranges = []
+    for k, axis in enumerate(axes):
+        others = tuple(a for a in range(chi2.ndim) if a != k)
+        hit = np.flatnonzero(inside.any(axis=others) if others else inside)
+        lo = axis[max(hit[0] - 1, 0)]
+        hi = axis[min(hit[-1] + 1, len(axis) - 1)]
+        ranges.append((float(lo), float(hi)))
+    return ranges
+
+
+def _search(model, objective, m_obs, M, z, ranges, points, levels, n_candidates, polish, workers):
+    # Coarse grid over the box, refinement of its lowest local minima, optional polish inside the box
+    axes = grid_axes(ranges, points)
+    chi2 = evaluate_grid(objective, axes, workers)
+    nfev = chi2.size
+    candidates = local_minima(chi2, n_candidates)
+    if not candidates:
+        raise ValueError(f"chi-square is not finite anywhere on the grid over {ranges}")
+    best_x, best_chi2 = None, np.inf
+    for index in candidates:
+        x, value, evals = refine(objective, axes, index, ranges, levels, workers=workers)
+        nfev += evals
+        if value < best_chi2:
+            best_x, best_chi2 = x, value
+    method = 'grid'
+
+    if polish:
+        import lsq_solver
+        lo, hi = np.array(ranges).T
+        bounds = [(max(l, b[0]) if b[0] is not None else l, min(h, b[1]) if b[1] is not None else h)
+                  for l, h, b in zip(lo, hi, model.bounds)]
+        try:
+            fit = lsq_solver.fit_model(model, m_obs, M, z, x0=best_x, bounds=bounds, method='nonlinear')
+            nfev += fit.nfev
+            if fit.fun <= best_chi2:
+                best_x, best_chi2, method = np.asarray(fit.x, dtype=float), float(fit.fun), 'grid+trf'
+        except Exception as e:
+            logging.warning(f"Polishing the grid minimum failed ({type(e).__name__}: {e}); keeping the grid point")
+    return axes, chi2, candidates, best_x, best_chi2, method, nfev
+
+
+def grid_fit(model, m_obs, M, z, ranges=None, points=DEFAULT_POINTS, levels=REFINE_LEVELS,
+             n_candidates=N_CANDIDATES, polish=True, profile_points=None, workers=None, expand=None, fixed=()):
+    """
+    Global fit of a MagnitudeModel (or its name) over the box `ranges`
+    (default: default_ranges from the data). Steps: coarse grid, refinement of the
+    n_candidates lowest local minima, optional polish with lsq_solver, then a
+    profile grid over the region within the outermost contour level of the
+    minimum. Returns an OptimizeResult with x, fun, the coarse and profile
+    grids, per-parameter profiles and 1-sigma intervals.
+
+    A minimum on a box edge that is not a model bound is not a global
+    minimum. With `expand` (the default when `ranges` is None) an open-ended
+    side is doubled, up to MAX_EXPAND times, and the search rerun; the
+    parameters named in `fixed` keep their range. Any parameter still on
+    such an edge is listed in `edges` and logged as a warning.
+    """
+    if isinstance(model, str):
+        model = hubble_models.get_model(model)
+    if expand is None:
+        expand = ranges is None
+    ranges = default_ranges(model, m_obs, M, z) if ranges is None else [tuple(map(float, r)) for r in ranges]
+    objective = model.batch_objective(m_obs, M, z)
+    n = len(np.asarray(m_obs))
+    start = time.perf_counter()
+    nfev = 0
+    for attempt in range(MAX_EXPAND + 1):
+        axes, chi2, candidates, best_x, best_chi2, method, evals = _search(
+            model, objective, m_obs, M, z, ranges, points, levels, n_candidates, polish, workers)
+        nfev += evals
+        flags = artificial_edges(model, ranges)
+        hits = edges_hit(best_x, ranges, flags, points)
+        # Only open ends are moved; ranges the caller fixed are kept
+        movable = {k: side for k, side in hits.items()
+                   if model.bounds[k][0 if side == 'low' else 1] is None and model.param_names[k] not in fixed}
+        if not expand or not movable or attempt == MAX_EXPAND:
+            break
+        ranges = _expand(model, ranges, movable)
+        logging.info(f"Grid minimum of {model.name} on the open edge of the box; widened to {ranges}")
+    edges = {model.param_names[k]: side for k, side in hits.items()}
+    if edges:
+        logging.warning(f"Grid minimum of {model.name} lies on the search box edge for "
+                        f"{', '.join(f'{name} ({side})' for name, side in edges.items())}; "
+                        f"the global minimum may lie outside {ranges}")
+    # Profile grid: dense only around the minimum. Along each axis it is widened
+    # while the outermost contour runs off its edge (short of the search box),
+    # and narrowed while the contour covers too few grid points to resolve it
+    scale = sigma_scale(best_chi2, n, len(ranges))
+    level = max(CONTOUR_LEVELS)
+    profile_ranges = _window(chi2, axes, scale, best_chi2, level, best_x)
+    for _ in range(MAX_ADAPT + 1):
+        profile_axes = grid_axes(profile_ranges, profile_points or points)
+        profile_chi2 = evaluate_grid(objective, profile_axes, workers)
+        nfev += profile_chi2.size
+        tight = _window(profile_chi2, profile_axes, scale, best_chi2, level, best_x)
+        adapted = []
+        for k, ((lo, hi), (box_lo, box_hi)) in enumerate(zip(profile_ranges, ranges)):
+            delta = (profile_likelihood(profile_chi2, k) - best_chi2) / scale
+            width = hi - lo
+            if (delta[0] <= level and lo > box_lo) or (delta[-1] <= level and hi < box_hi):
+                lo = max(box_lo, lo - width) if delta[0] <= level else lo
+                hi = min(box_hi, hi + width) if delta[-1] <= level else hi
+            elif np.count_nonzero(delta <= level) < MIN_RESOLVED:
+                lo, hi = tight[k]
+            adapted.append((lo, hi))
+        if adapted == profile_ranges:
+            break
+        profile_ranges = adapted
+
+    profiles, intervals = {}, {}
+    for k, name in enumerate(model.param_names):
+        delta = (profile_likelihood(profile_chi2, k) - best_chi2) / scale
+        profiles[name] = {'values': profile_axes[k], 'delta_chi2': delta}
+        low, high, open_ = interval_from_profile(profile_axes[k], delta)
+        intervals[name] = {'low': low, 'high': high, 'open': open_}
+    logging.info(f"Grid fit of {model.name}: chi2 {best_chi2} at {best_x.tolist()} after {nfev} evaluations")
+    return OptimizeResult(x=best_x, fun=best_chi2, method=method, nfev=nfev, param_names=model.param_names,
+                          ranges=ranges, axes=axes, chi2=chi2, candidates=candidates,
+                          profile_axes=profile_axes, profile_chi2=profile_chi2, scale=scale,
+                          profiles=profiles, intervals=intervals, edges=edges, seconds=time.perf_counter() - start)
+
+
+def render_profiles(result, output, width=1920, height=1080, dpi=100):
+    """Profile likelihood of each parameter plus the confidence contours of the first two."""
+    import render
+    fig = render.figure_for_pixels(width, height, dpi)
+    names = result.param_names
+    n_panels = len(names) + (len(names) > 1)
+    for k, name in enumerate(names):
+        ax = fig.add_subplot(1, n_panels, k + 1)
+        profile = result.profiles[name]
+        ax.plot(profile['values'], profile['delta_chi2'])
+        ax.axhline(PROFILE_LEVEL, color='C1', linestyle='--')
+        ax.set_ylim(0, max(CONTOUR_LEVELS))
+        ax.set_xlabel(name)
+        ax.set_ylabel('Delta chi-square')
+    if len(names) > 1:
+        ax = fig.add_subplot(1, n_panels, n_panels)
+        plane = (contour_grid(result.profile_chi2, 0, 1) - result.fun) / result.scale
+        ax.contour(result.profile_axes[0], result.profile_axes[1], plane.T, levels=CONTOUR_LEVELS)
+        ax.plot(result.x[0], result.x[1], 'k+')
+        ax.set_xlabel(names[0])
+        ax.set_ylabel(names[1])
+    fig.savefig(output, dpi=dpi)
+    return output
+
+
+def compare_local(model, m_obs, M, z, n_starts, seed=0):
+    # Time the local-search alternative: one trust-region fit per random start
+    import lsq_solver
+    import model_sweep
+    start = time.perf_counter()
+    best = np.inf
+    for x0 in model_sweep.initial_guesses(model.name, n_starts - 1, seed):
+        try:
+            best = min(best, float(lsq_solver.fit_model(model, m_obs, M, z, x0=x0, method='nonlinear').fun))
+        except Exception:
+            pass
+    return time.perf_counter() - start, best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Grid search, profile likelihoods and contours for one model')
+    parser.add_argument('model', choices=sorted(hubble_models.MODELS))
+    parser.add_argument('--catalog', default='Challenge2_data.json')
+    parser.add_argument('--range', nargs=3, action='append', metavar=('PARAM', 'LOW', 'HIGH'), default=[],
+                        help='search range for one parameter (default: the model bounds, open ends sized from a local fit)')
+    parser.add_argument('--points', type=int, default=DEFAULT_POINTS, help='coarse grid points per axis')
+    parser.add_argument('--levels', type=int, default=REFINE_LEVELS)
+    parser.add_argument('--candidates', type=int, default=N_CANDIDATES)
+    parser.add_argument('--no-polish', action='store_true')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--plot', help='save profiles and contours to this image')
+    parser.add_argument('--output', help='save the result as JSON')
+    parser.add_argument('--compare-local', type=int, metavar='N', help='also time N local fits from random starts')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    import catalog_store
+    model = hubble_models.get_model(args.model)
+    data = catalog_store.read_catalog(args.catalog)
+    m, M, z = (np.asarray(data[name]) for name in catalog_store.CATALOG_COLUMNS)
+    ranges = default_ranges(model, m, M, z)
+    for name, lo, hi in args.range:
+        if name not in model.param_names:
+            parser.error(f"{args.model} has no parameter {name!r}; choose from {model.param_names}")
+        ranges[model.param_names.index(name)] = (float(lo), float(hi))
+
+    result = grid_fit(model, m, M, z, ranges, args.points, args.levels, args.candidates,
+                      polish=not args.no_polish, workers=args.workers, expand=True,
+                      fixed=[name for name, _, _ in args.range])
+    print(f"{model.name}: chi2 {result.fun:.10g} ({result.method}, {result.nfev} evaluations, {result.seconds:.2f} s)")
+    for name, value in zip(model.param_names, result.x):
+        interval = result.intervals[name]
+        note = ' (reaches the grid edge)' if interval['open'] else ''
+        print(f"  {name} = {value:.6g}  1-sigma profile interval [{interval['low']:.6g}, {interval['high']:.6g}]{note}")
+    for name, side in result.edges.items():
+        print(f"  Warning: {name} minimum is on the {side} edge of the search box {result.ranges}; "
+              f"widen it with --range")
+    if args.compare_local:
+        seconds, best = compare_local(model, m, M, z, args.compare_local)
+        print(f"  {args.compare_local} local fits: best chi2 {best:.10g} in {seconds:.2f} s")
+    if args.plot:
+        print(f"Saved {render_profiles(result, args.plot)}")
+    if args.output:
+        import atomic_io
+        atomic_io.write_json_atomic({
+            'model': model.name, 'params': dict(zip(model.param_names, map(float, result.x))),
+            'chi2': result.fun, 'method': result.method, 'nfev': int(result.nfev), 'ranges': result.ranges,
+            'intervals': result.intervals, 'edges': result.edges,
+            'profiles': {name: {'values': p['values'].tolist(), 'delta_chi2': p['delta_chi2'].tolist()}
+                         for name, p in result.profiles.items()},
+        }, args.output)
+        print(f"Results saved to {args.output}")
@@ -0,0 +1,216 @@
+"""
+hubble: one entry point for the Challenge 2 scripts.
+
+    python hubble.py velocity             # calculations_realequa.py / new_hubble-constant.py
+    python hubble.py fit constant_extinction   # cpc_gpt1.py
+    python hubble.py fit distance_extinction   # cpc_gpt2.py
+    python hubble.py fit rv_ebv           # tiger_new.py
+    python hubble.py fit kappa            # gpu_calc.py
+    python hubble.py fit-k [--plot]       # CH_TG01.py
+    python hubble.py plot                 # plotter.py
+    python hubble.py import-budget        # check this module still starts fast
+
+Only argparse/json/sys are imported up front. numpy, scipy, matplotlib and the
+repo modules are imported inside the subcommand that needs them, and nothing
+is loaded or configured at import time.
+"""
+import argparse
+import json
+import os
+import sys
+
+DEFAULT_DATA = 'Challenge2_data.json'
+# Mirrors hubble_models.MODELS; kept literal so building the parser imports nothing heavy
+MODEL_CHOICES = ('constant_extinction', 'distance_extinction', 'rv_ebv', 'kappa')
+PARAM_LABELS = {
+    'H0': 'Hubble constant (H0)',
+    'gamma': 'Extinction coefficient (gamma)',
+}
+HEAVY_MODULES = ('numpy', 'scipy', 'matplotlib', 'pandas', 'torch')
+IMPORT_BUDGET_MS = 50.0
+
+
+def _setup_logging(args):
+    if args.log or args.log_store:
+        import fastlog
+        fastlog.setup_logging(args.log, store=args.log_store)
+
+
+def _setup_backend(args, parser):
+    if args.backend:
+        import compute_backend
+        try:
+            compute_backend.set_backend(args.backend)
+        except ImportError as exc:
+            parser.error(str(exc))
+
+
+def _load_columns(path):
+    import numpy as np
+    import catalog_store
+    data = catalog_store.read_catalog(path)
+    return [np.asarray(data[name]) for name in catalog_store.CATALOG_COLUMNS]
+
+
+def _write_output(output_data, path):
+    if path:
+        with open(path, 'w') as output_file:
+            json.dump(output_data, output_file, indent=4)
+        print(f"Results saved to {path}")
+
+
+### Subcommands ###
+def cmd_velocity(args):
+    import numpy as np
+    import streaming
+    m, M, z = _load_columns(args.data)
+    velocity = streaming.relativistic_velocity(z, args.c)
+    distance = streaming.distance_mpc(m, M)
+    formatter = {'float_kind': lambda x: "%.10f" % x}
+    print(f"Calculated result for column 3: {np.array2string(velocity, formatter=formatter)}")
+    print(f"Calculated velocity for columns 1, 2: {np.array2string(distance, formatter=formatter)}")
+    return 0
+
+
+def cmd_fit(args):
+    import numpy as np
+    import hubble_models
+    import lsq_solver
+    model = hubble_models.get_model(args.model)
+    m, M, z = _load_columns(args.data)
+    x0 = args.initial_guess or model.initial_guess
+    result = lsq_solver.fit_model(model, m, M, z, x0=x0, method=args.method)
+
+    errors = np.sqrt(np.clip(np.diag(result.cov), 0, None))
+    output_data = {}
+    for name, value, err in zip(model.param_names, result.x, errors):
+        print(f"Best-fit {PARAM_LABELS.get(name, name)}: {value:.4f} ± {err:.4f}")
+        output_data[PARAM_LABELS.get(name, name)] = float(value)
+    output_data['Chi-square'] = float(result.fun)
+    if result.degenerate:
+        print(f"Warning: {model.name} is degenerate (Jacobian rank {result.rank} < {len(result.x)})")
+    _write_output(output_data, args.output)
+    return 0
+
+
+def cmd_fit_k(args):
+    import iterative_k
+    m, M, z = _load_columns(args.data)
+    fit = iterative_k.fit_k(m, M, z, k_initial=args.k_initial)
+    print("H0 =", fit['H0'], "±", fit['H0_error'], "km/s-Mpc")
+    print("k =", fit['k'], "±", fit['k_error'], "mag/Mpc")
+    if args.plot:
+        import render
+        render.render_hubble(fit['distances'], fit['velocities'], fit['H0'], fit['intercept'], args.plot,
+                             width=args.width, height=args.height)
+    if args.show:
+        import matplotlib.pyplot as plt
+        import render
+        ax = plt.gca()
+        render.draw_scatter(ax, fit['distances'], fit['velocities'])
+        render.draw_fit_line(ax, fit['H0'], fit['intercept'], 0, 200)
+        plt.show()
+    _write_output({'Hubble constant (H0)': fit['H0'], 'H0 error': fit['H0_error'],
+                   'k': fit['k'], 'k error': fit['k_error']}, args.output)
+    return 0
+
+
+def cmd_plot(args):
+    import render
+    render.render_line_csv(args.csv, args.output, args.width, args.height, labels_from_header=args.labels_from_header)
+    print(f"Plot saved to {args.output}")
+    if args.show:
+        import numpy as np
+        import matplotlib.pyplot as plt
+        import csv_ingest
+        x, y = csv_ingest.read_csv_columns(args.csv, [0, 1]).values()
+        order = np.argsort(x, kind='stable')
+        render.draw_line(plt.gca(), x[order], y[order])
+        plt.show()
+    return 0
+
+
+def measure_import_time(module='hubble'):
+    # Time a cold import in a fresh interpreter; returns (milliseconds, heavy modules loaded)
+    import subprocess
+    code = (f"import sys, time; t = time.perf_counter(); import {module}; {module}.build_parser(); "
+            "print((time.perf_counter() - t) * 1000); print(','.join(sorted(sys.modules)))")
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    elapsed, modules = out.stdout.strip().split('\n')
+    loaded = set(modules.split(','))
+    return float(elapsed), sorted(m for m in HEAVY_MODULES if m in loaded)
+
+
+def cmd_import_budget(args):
+    elapsed, heavy = measure_import_time()
+    print(f"import hubble + build_parser: {elapsed:.1f} ms (budget {args.budget_ms:.1f} ms)")
+    ok = True
+    if heavy:
+        print(f"FAIL: heavy modules imported at startup: {', '.join(heavy)}")
+        ok = False
+    if elapsed > args.budget_ms:
+        print("FAIL: import time over budget")
+        ok = False
+    if ok:
+        print("OK")
+    return 0 if ok else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='hubble', description='Hubble constant estimation tools')
+    parser.add_argument('--log', help='write a log file (background writer)')
+    parser.add_argument('--log-store', help='log this run to a run-log store directory (see run_log_store.py)')
+    parser.add_argument('--backend', choices=('numpy', 'fused', 'threaded', 'torch'),
+                        help='compute backend for the array kernels (default: $HUBBLE_BACKEND or fused); '
+                             'torch computes velocities and distances, residuals stay on NumPy')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('velocity', help='relativistic velocities and distances (calculations_realequa.py)')
+    p.add_argument('--data', default=DEFAULT_DATA)
+    p.add_argument('--c', type=float, default=299792458, help='speed of light, default in m/s')
+    p.set_defaults(func=cmd_velocity)
+
+    p = sub.add_parser('fit', help='least-squares fit of a magnitude model (cpc_gpt1/2, tiger_new, gpu_calc)')
+    p.add_argument('model', choices=MODEL_CHOICES)
+    p.add_argument('--data', default=DEFAULT_DATA)
+    p.add_argument('--initial-guess', type=float, nargs='+')
+    p.add_argument('--method', choices=('auto', 'linear', 'nonlinear'), default='auto')
+    p.add_argument('--output', help='write results JSON here')
+    p.set_defaults(func=cmd_fit)
+
+    p = sub.add_parser('fit-k', help='iterative extinction slope fit (CH_TG01.py)')
+    p.add_argument('--data', default=DEFAULT_DATA)
+    p.add_argument('--k-initial', type=float, default=0.0)
+    p.add_argument('--plot', help='save the Hubble diagram to this file')
+    p.add_argument('--show', action='store_true', help='open an interactive plot window')
+    p.add_argument('--width', type=int, default=1920, help='plot width in pixels')
+    p.add_argument('--height', type=int, default=1080, help='plot height in pixels')
+    p.add_argument('--output', help='write results JSON here')
+    p.set_defaults(func=cmd_fit_k)
+
+    p = sub.add_parser('plot', help='line plot of a two-column CSV (plotter.py)')
+    p.add_argument('csv', nargs='?', default='plot_data.csv')
+    p.add_argument('--output', default='plot.jpg')
+    p.add_argument('--labels-from-header', action='store_true')
+    p.add_argument('--width', type=int, default=1920, help='pixels')
+    p.add_argument('--height', type=int, default=1080, help='pixels')
+    p.add_argument('--show', action='store_true')
+    p.set_defaults(func=cmd_plot)
+
+    p = sub.add_parser('import-budget', help='fail if startup imports heavy modules or exceeds the time budget')
+    p.add_argument('--budget-ms', type=float, default=IMPORT_BUDGET_MS)
+    p.set_defaults(func=cmd_import_budget)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    _setup_logging(args)
+    _setup_backend(args, parser)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
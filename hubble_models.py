@@ -0,0 +1,295 @@
+import numpy as np
+import compute_backend
+import kernels
+from streaming import relativistic_velocity
+
+c_kms = 299792.458  # Speed of light in km/s
+LN10 = np.log(10.0)
+# Cap on k * n elements per block in the batched objectives (~32 MiB of float64 temporaries)
+BATCH_MAX_ELEMENTS = 1 << 22
+
+
+class MagnitudeModel:
+    """
+    One magnitude model as fitted by the scripts: the residuals they minimise,
+    their analytic Jacobian, and the defaults each script hard-codes.
+
+    Models that are linear in a reparametrisation also carry `linear_form`
+    (m_model = base + X @ theta) plus the maps between params and theta, so
+    lsq_solver can solve them in closed form. `residuals_into` is the fused
+    in-place residual kernel used by the kernels module.
+    """
+
+    def __init__(self, name, param_names, velocity, model, jacobian, initial_guess, bounds,
+                 linear_form=None, to_linear=None, from_linear=None, linear_bounds=None, residuals_into=None):
+        self.name = name
+        self.param_names = tuple(param_names)
+        self.velocity = velocity
+        self.model = model
+        self.jacobian = jacobian
+        self.initial_guess = list(initial_guess)
+        self.bounds = list(bounds)
+        self.linear_form = linear_form
+        self.to_linear = to_linear
+        self.from_linear = from_linear
+        self.linear_bounds = linear_bounds
+        self.residuals_into = residuals_into
+
+    def residuals(self, params, v, M, m_obs):
+        return compute_backend.get_backend().residuals(self, params, v, M, m_obs)
+
+    def chi_square(self, params, v, M, m_obs):
+        # Residuals go to a reused workspace column, so repeated calls allocate nothing
+        return kernels.chi_square(self, params, v, M, m_obs)
+
+    def batch_chi_square(self, params_matrix, v, M, m_obs, max_elements=BATCH_MAX_ELEMENTS):
+        """
+        Chi-square for every row of a (k, n_params) matrix in broadcasted passes.
+
+        The model functions unpack `params` along the first axis, so handing them
+        a (n_params, rows, 1) block broadcasts against the (n,) data columns.
+        Rows are processed in blocks of max_elements // n so temporaries stay
+        bounded. Parameter vectors outside the model's domain (e.g. H0 <= 0) get inf.
+        """
+        P = np.atleast_2d(np.asarray(params_matrix, dtype=float))
+        if P.shape[1] != len(self.param_names):
+            raise ValueError(f"Expected (k, {len(self.param_names)}) parameters, got {P.shape}")
+        out = np.empty(len(P))
+        rows = max(1, max_elements // max(len(v), 1))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for start in range(0, len(P), rows):
+                block = P[start:start + rows]
+                r = m_obs - self.model(block.T[:, :, None], v, M)
+                out[start:start + rows] = np.einsum('ij,ij->i', r, r)
+        out[~np.isfinite(out)] = np.inf
+        return out
+
+    def batch_objective(self, m_obs, M, z, max_elements=BATCH_MAX_ELEMENTS):
+        # Bind the data once; the returned callable maps (k, n_params) -> (k,) chi-square values
+        v = self.velocity(np.asarray(z, dtype=float))
+        M = np.asarray(M, dtype=float)
+        m_obs = np.asarray(m_obs, dtype=float)
+        return lambda params_matrix: self.batch_chi_square(params_matrix, v, M, m_obs, max_elements)
+
+
+def _log_h0_bounds(h0_bounds):
+    # theta = -5*log10(H0) decreases with H0; H0 <= 0 maps to +inf
+    lo, hi = h0_bounds
+    upper = np.inf if lo is None or lo <= 0 else -5 * np.log10(lo)
+    lower = -np.inf if hi is None else -5 * np.log10(hi)
+    return lower, upper
+
+
+def _as_bound(value, default):
+    return default if value is None else value
+
+
+def _log_distance_residuals_into(H0, A_V, v, M, m_obs, out):
+    # m_obs - (M + 5*log10(v/H0) - 5 + A_V), same operation order, in place
+    np.divide(v, H0, out=out)
+    np.log10(out, out=out)
+    out *= 5
+    np.add(M, out, out=out)
+    out -= 5
+    out += A_V
+    np.subtract(m_obs, out, out=out)
+    return out
+
+
+### Constant extinction, R_V fixed at 3.1 (cpc_gpt1.py) ###
+R_V_FIXED = 3.1
+
+
+def constant_extinction_model(params, v, M):
+    H0, E_BV = params
+    A_V = R_V_FIXED * E_BV
+    return M + 5 * np.log10(v / H0) - 5 + A_V
+
+
+def constant_extinction_jacobian(params, v, M, m_obs):
+    H0, E_BV = params
+    J = np.empty((len(v), 2))
+    J[:, 0] = 5 / (H0 * LN10)
+    J[:, 1] = -R_V_FIXED
+    return J
+
+
+def constant_extinction_residuals_into(params, v, M, m_obs, out, workspace):
+    H0, E_BV = params
+    return _log_distance_residuals_into(H0, R_V_FIXED * E_BV, v, M, m_obs, out)
+
+
+def constant_extinction_linear_form(v, M):
+    X = np.empty((len(v), 2))
+    X[:, 0] = 1.0
+    X[:, 1] = R_V_FIXED
+    return M + 5 * np.log10(v) - 5, X
+
+
+def constant_extinction_bounds(bounds):
+    (h0_lo, h0_hi), (e_lo, e_hi) = bounds
+    t0_lo, t0_hi = _log_h0_bounds((h0_lo, h0_hi))
+    return [(t0_lo, t0_hi), (_as_bound(e_lo, -np.inf), _as_bound(e_hi, np.inf))]
+
+
+### Distance-dependent extinction A_V = gamma * d (cpc_gpt2.py) ###
+def distance_extinction_model(params, v, M):
+    H0, gamma = params
+    d = v / H0  # Distance in Mpc
+    A_V = gamma * d
+    return M + 5 * np.log10(d) + 25 + A_V
+
+
+def distance_extinction_residuals_into(params, v, M, m_obs, out, workspace):
+    H0, gamma = params
+    d = workspace.buffer('distance_extinction.d', out.shape, out.dtype)
+    np.divide(v, H0, out=d)
+    np.log10(d, out=out)
+    out *= 5
+    np.add(M, out, out=out)
+    out += 25
+    d *= gamma
+    out += d
+    np.subtract(m_obs, out, out=out)
+    return out
+
+
+def distance_extinction_jacobian(params, v, M, m_obs):
+    H0, gamma = params
+    d = v / H0
+    J = np.empty((len(v), 2))
+    J[:, 0] = 5 / (H0 * LN10) + gamma * d / H0
+    J[:, 1] = -d
+    return J
+
+
+### Free R_V and E(B-V) with relativistic velocities (tiger_new.py) ###
+def rv_ebv_model(params, v, M):
+    H0, R_V, E_BV = params
+    A_V = R_V * E_BV
+    return M + 5 * np.log10(v / H0) - 5 + A_V
+
+
+def rv_ebv_residuals_into(params, v, M, m_obs, out, workspace):
+    H0, R_V, E_BV = params
+    return _log_distance_residuals_into(H0, R_V * E_BV, v, M, m_obs, out)
+
+
+def rv_ebv_jacobian(params, v, M, m_obs):
+    H0, R_V, E_BV = params
+    J = np.empty((len(v), 3))
+    J[:, 0] = 5 / (H0 * LN10)
+    J[:, 1] = -E_BV
+    J[:, 2] = -R_V
+    return J
+
+
+def rv_ebv_linear_form(v, M):
+    # theta = (-5*log10(H0), A_V); R_V and E(B-V) only enter through their product
+    X = np.ones((len(v), 2))
+    return M + 5 * np.log10(v) - 5, X
+
+
+def rv_ebv_to_linear(params):
+    H0, R_V, E_BV = params
+    return np.array([-5 * np.log10(H0), R_V * E_BV])
+
+
+def rv_ebv_from_linear(theta, x0, bounds):
+    H0 = 10 ** (-theta[0] / 5)
+    A_V = theta[1]
+    R_V = x0[1]
+    (_, _), (rv_lo, rv_hi), (e_lo, e_hi) = bounds
+    # Keep R_V at its initial guess where possible, otherwise move it just enough
+    # for E(B-V) to stay inside its bounds
+    E_BV = A_V / R_V
+    if not (e_lo <= E_BV <= e_hi):
+        E_BV = min(max(E_BV, e_lo), e_hi)
+        if E_BV != 0:
+            R_V = min(max(A_V / E_BV, rv_lo), rv_hi)
+    return np.array([H0, R_V, E_BV])
+
+
+def rv_ebv_bounds(bounds):
+    (h0_lo, h0_hi), (rv_lo, rv_hi), (e_lo, e_hi) = bounds
+    products = [rv_lo * e_lo, rv_lo * e_hi, rv_hi * e_lo, rv_hi * e_hi]
+    return [_log_h0_bounds((h0_lo, h0_hi)), (min(products), max(products))]
+
+
+### Wavelength extinction kappa_v * A_V * H0 on raw redshift (gpu_calc.py) ###
+KAPPA_V = 0.1
+
+
+def kappa_model(params, v, M):
+    H0, A_V = params
+    # total_error's wall: no solution with H0 <= 0 or A_V < 0
+    H0 = np.where((H0 > 0) & (A_V >= 0), H0, np.nan)
+    return M + 5 * np.log10(np.maximum(v / H0, 1e-10)) - 5 + H0 * KAPPA_V * A_V
+
+
+def kappa_residuals_into(params, v, M, m_obs, out, workspace):
+    H0, A_V = params
+    if not (H0 > 0 and A_V >= 0):
+        out.fill(np.nan)
+        return out
+    np.divide(v, H0, out=out)
+    np.maximum(out, 1e-10, out=out)
+    np.log10(out, out=out)
+    out *= 5
+    np.add(M, out, out=out)
+    out -= 5
+    out += H0 * KAPPA_V * A_V
+    np.subtract(m_obs, out, out=out)
+    return out
+
+
+def kappa_jacobian(params, v, M, m_obs):
+    H0, A_V = params
+    J = np.empty((len(v), 2))
+    J[:, 0] = np.where(v / H0 > 1e-10, 5 / (H0 * LN10), 0.0) - KAPPA_V * A_V
+    J[:, 1] = -H0 * KAPPA_V
+    return J
+
+
+def _velocity_ckz(z):
+    return c_kms * z
+
+
+def _velocity_raw(z):
+    # gpu_calc.py feeds the redshift column straight in as "v"
+    return z
+
+
+MODELS = {
+    'constant_extinction': MagnitudeModel(
+        'constant_extinction', ('H0', 'E(B-V)'), _velocity_ckz,
+        constant_extinction_model, constant_extinction_jacobian,
+        initial_guess=[60, 0.1], bounds=[(0, 100), (0.0, 3.0)],
+        linear_form=constant_extinction_linear_form,
+        to_linear=lambda p: np.array([-5 * np.log10(p[0]), p[1]]),
+        from_linear=lambda theta, x0, bounds: np.array([10 ** (-theta[0] / 5), theta[1]]),
+        linear_bounds=constant_extinction_bounds, residuals_into=constant_extinction_residuals_into),
+    'distance_extinction': MagnitudeModel(
+        'distance_extinction', ('H0', 'gamma'), _velocity_ckz,
+        distance_extinction_model, distance_extinction_jacobian,
+        initial_guess=[70, 0.5], bounds=[(50, 100), (0, 1)],
+        residuals_into=distance_extinction_residuals_into),
+    'rv_ebv': MagnitudeModel(
+        'rv_ebv', ('H0', 'R_V', 'E(B-V)'), relativistic_velocity,
+        rv_ebv_model, rv_ebv_jacobian,
+        initial_guess=[70, 3.1, 0.1], bounds=[(50, 100), (2.0, 5.0), (0.0, 1.0)],
+        linear_form=rv_ebv_linear_form, to_linear=rv_ebv_to_linear,
+        from_linear=rv_ebv_from_linear, linear_bounds=rv_ebv_bounds, residuals_into=rv_ebv_residuals_into),
+    'kappa': MagnitudeModel(
+        'kappa', ('H0', 'A_V'), _velocity_raw,
+        kappa_model, kappa_jacobian,
+        initial_guess=[67, 0.1], bounds=[(1e-10, None), (0, None)],
+        residuals_into=kappa_residuals_into),
+}
+
+
+def get_model(name):
+    try:
+        return MODELS[name]
+    except KeyError:
+        raise KeyError(f"Unknown model {name!r}; choose from {sorted(MODELS)}") from None
@@ -0,0 +1,74 @@
+import numpy as np
+from scipy.optimize import minimize
+import distance_solver
+import eval_cache
+import regression
+
+c_kms = 299792.458  # Speed of light in km/s
+
+# minimize revisits k values (line searches, gradient stencils); the objective
+# is cached by dataset fingerprint and k. Distance columns are not: they are
+# n floats each and are only reused through the objective.
+_objective_cache = eval_cache.LRUCache(maxsize=4096, name='iterative_k.hubble_fit')
+
+
+def corrected_distances(k, m, M):
+    # Converged fixed point of D = 10**((m - k*D - M + 5)/5)/1e6 (closed form via Lambert W)
+    return distance_solver.corrected_distances(k, m, M)
+
+
+def _solve_distances(k, terms):
+    # Corrected distances from the precomputed uncorrected ones
+    return distance_solver.solve_distances(k, terms.distance0)
+
+
+def _hubble_fit(k, terms):
+    # Slope of the fit with intercept, scored by the residuals of v = H0 * D;
+    # both come from one pass of sufficient statistics
+    stats = regression.sufficient_stats(_solve_distances(k, terms), terms.v)
+    H0 = regression.solve(stats).slope
+    return regression.sse_at(stats, H0)
+
+
+def hubble_fit(k, m, M, z, c=3.0e5):
+    terms = eval_cache.dataset_terms(m, M, z, c)
+    key = (terms.fingerprint, float(c), eval_cache.params_key(k))
+    return _objective_cache.get_or_compute(key, _hubble_fit, k, terms)
+
+
+def compute_H0(k, m, M, z, c=3.0e5):
+    terms = eval_cache.dataset_terms(m, M, z, c)
+    return regression.fit_line(_solve_distances(k, terms), terms.v).slope
+
+
+def cache_stats():
+    return [_objective_cache.stats()]
+
+
+def fit_k(m, M, z, k_initial=0.0, c=c_kms):
+    """
+    The CH_TG01.py fit: choose the extinction slope k (mag/Mpc) minimising the
+    Hubble-law residuals, then regress velocity on the corrected distances.
+    """
+    result = minimize(hubble_fit, k_initial, args=(m, M, z))
+    k_best = result.x[0]
+    k_error = np.sqrt(result.hess_inv[0][0])
+
+    distances = corrected_distances(k_best, m, M)
+    velocities = z * c
+    # Full diagnostics only once, on the final distances
+    fit = regression.diagnostics(distances, velocities)
+    return {
+        'k': k_best,
+        'k_error': k_error,
+        'H0': fit['slope'],
+        'H0_error': fit['stderr'],
+        'intercept': fit['intercept'],
+        'r_value': fit['rvalue'],
+        'p_value': fit['pvalue'],
+        'distances': distances,
+        'velocities': velocities,
+        'objective': result.fun,
+        'nfev': result.nfev,
+        'cache': cache_stats(),
+    }
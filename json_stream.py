@@ -0,0 +1,379 @@
+import json
+import re
+import numpy as np
+
+BLOCK_SIZE = 1 << 20
+_WHITESPACE = b' \t\r\n'
+
+
+class _ByteReader:
+    """Buffered forward-only reader over a binary file, tracking absolute offsets."""
+
+    def __init__(self, fh, block_size=BLOCK_SIZE):
+        self.fh = fh
+        self.block_size = block_size
+        self.buf = b''
+        self.pos = 0
+        self.base = fh.tell()
+
+    def _fill(self):
+        chunk = self.fh.read(self.block_size)
+        if not chunk:
+            return False
+        self.base += self.pos
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def offset(self):
+        return self.base + self.pos
+
+    def peek(self):
+        if self.pos >= len(self.buf) and not self._fill():
+            return b''
+        return self.buf[self.pos:self.pos + 1]
+
+    def next(self):
+        ch = self.peek()
+        self.pos += len(ch)
+        return ch
+
+    def skip_whitespace(self):
+        while True:
+            ch = self.peek()
+            if not ch or ch not in _WHITESPACE:
+                return ch
+            self.pos += 1
+
+    def expect(self, ch):
+        got = self.skip_whitespace()
+        if got != ch:
+            raise ValueError(f"Expected {ch!r} at byte {self.offset()}, found {got!r}")
+        self.pos += 1
+
+    def read_string(self):
+        self.expect(b'"')
+        raw = bytearray()
+        while True:
+            end = self.buf.find(b'"', self.pos)
+            if end < 0:
+                raw += self.buf[self.pos:]
+                self.pos = len(self.buf)
+                if not self._fill():
+                    raise ValueError("Unterminated string")
+                continue
+            raw += self.buf[self.pos:end]
+            self.pos = end + 1
+            # a quote preceded by an odd number of backslashes is escaped; the run is
+            # counted over the whole string, as it may straddle a buffer fill
+            i = len(raw)
+            while i and raw[i - 1] == 0x5C:
+                i -= 1
+            if (len(raw) - i) % 2 == 0:
+                break
+            raw += b'"'
+        if b'\\' not in raw:
+            return raw.decode('utf-8')
+        return json.loads(b'"' + raw + b'"')
+
+    def skip_until(self, stop):
+        # numbers never contain the stop byte, so a flat numeric array ends at the first one
+        while True:
+            end = self.buf.find(stop, self.pos)
+            if end >= 0:
+                self.pos = end + 1
+                return
+            self.pos = len(self.buf)
+            if not self._fill():
+                raise ValueError(f"Unexpected end of file looking for {stop!r}")
+
+
+def find_array_offsets(file_path, keys=None, block_size=BLOCK_SIZE):
+    """
+    Return {key: byte offset just past '['} for the numeric arrays of a flat
+    {"key": [numbers...], ...} document, without parsing any numbers.
+    """
+    wanted = None if keys is None else set(keys)
+    offsets = {}
+    with open(file_path, 'rb') as fh:
+        reader = _ByteReader(fh, block_size)
+        reader.expect(b'{')
+        if reader.skip_whitespace() == b'}':
+            return offsets
+        while True:
+            key = reader.read_string()
+            reader.expect(b':')
+            reader.expect(b'[')
+            if wanted is None or key in wanted:
+                offsets[key] = reader.offset()
+            reader.skip_until(b']')
+            if wanted is not None and wanted.issubset(offsets):
+                break
+            sep = reader.skip_whitespace()
+            reader.next()
+            if sep == b'}':
+                break
+            if sep != b',':
+                raise ValueError(f"Malformed catalog object at byte {reader.offset()}")
+    return offsets
+
+
+def iter_array_blocks(file_path, offset, block_size=BLOCK_SIZE, dtype=np.float64):
+    # Yield the numbers of one array as variable-length typed blocks, starting at `offset`
+    with open(file_path, 'rb') as fh:
+        fh.seek(offset)
+        carry = b''
+        while True:
+            block = fh.read(block_size)
+            text = carry + block
+            end = text.find(b']')
+            if end >= 0:
+                text = text[:end]
+                tokens = text.split(b',') if text.strip() else []
+                if tokens:
+                    yield np.array(tokens).astype(dtype)
+                return
+            if not block:
+                raise ValueError("Unterminated array")
+            cut = text.rfind(b',')
+            if cut < 0:
+                carry = text
+                continue
+            carry = text[cut + 1:]
+            yield np.array(text[:cut].split(b',')).astype(dtype)
+
+
+def rechunk(blocks, chunk_size):
+    # Regroup variable-length blocks into fixed-size chunks (the last may be shorter)
+    pending = []
+    pending_len = 0
+    for block in blocks:
+        pending.append(block)
+        pending_len += len(block)
+        while pending_len >= chunk_size:
+            joined = np.concatenate(pending) if len(pending) > 1 else pending[0]
+            yield joined[:chunk_size]
+            rest = joined[chunk_size:]
+            pending = [rest] if len(rest) else []
+            pending_len = len(rest)
+    if pending_len:
+        yield np.concatenate(pending) if len(pending) > 1 else pending[0]
+
+
+### Projecting tokenizer ###
+_NUMBER_START = b'-0123456789'
+_LITERALS = {b't': (b'true', True), b'f': (b'false', False), b'n': (b'null', None)}
+_DELIMITERS = b',]}' + _WHITESPACE
+_NON_LITERAL_FLOATS = (b'NaN', b'Infinity', b'-Infinity')
+# Any byte that cannot occur in a number or between numbers ends the fast path
+_NUMERIC_BYTES = b'0123456789eE+-.,' + _WHITESPACE
+_NON_NUMERIC = re.compile(rb'[^0-9eE+\-.,\s]')
+
+
+def _read_token(reader):
+    # A bare number or literal: everything up to the next delimiter
+    parts = []
+    while True:
+        buf = reader.buf
+        end = reader.pos
+        while end < len(buf) and buf[end:end + 1] not in _DELIMITERS:
+            end += 1
+        parts.append(buf[reader.pos:end])
+        reader.pos = end
+        if end < len(buf) or not reader._fill():
+            return b''.join(parts)
+
+
+def _read_scalar(reader):
+    token = _read_token(reader)
+    if token[:1] in _LITERALS:
+        text, value = _LITERALS[token[:1]]
+        if token != text:
+            raise ValueError(f"Invalid literal {token!r} before byte {reader.offset()}")
+        return value
+    if any(ch in token for ch in b'.eE') or token in _NON_LITERAL_FLOATS:
+        return float(token)
+    return int(token)
+
+
+def _parse_numbers(text, dtype):
+    return np.array(text.split(b',')).astype(dtype)
+
+
+def _scan_numeric_array(reader, dtype, keep=True):
+    """
+    Reader is just past '['. Numbers go into typed blocks, one per buffer
+    fill. Returns (array, True) once ']' is reached, or (numbers so far,
+    False) with the reader at the start of the first element that is not a
+    number (null, true, a string, a nested value), for the generic parser to
+    take over.
+    """
+    blocks = []
+    while True:
+        buf = reader.buf
+        end = buf.find(b']', reader.pos)
+        stop = end if end >= 0 else len(buf)
+        # translate() is a fast all-numeric test; the regex only runs to locate an offender
+        bad = None
+        if buf[reader.pos:stop].translate(None, _NUMERIC_BYTES):
+            bad = _NON_NUMERIC.search(buf, reader.pos, stop)
+        if bad is not None:
+            stop = bad.start()
+        # Elements end at a comma; an unfinished one stays in the buffer for the next fill
+        cut = stop if bad is None and end >= 0 else buf.rfind(b',', reader.pos, stop)
+        if cut >= 0:
+            text = buf[reader.pos:cut]
+            reader.pos = cut + 1
+            if keep and text.strip():
+                blocks.append(_parse_numbers(text, dtype))
+        if bad is not None or end >= 0:
+            break
+        if not reader._fill():
+            raise ValueError("Unterminated array")
+    done = bad is None
+    if not keep:
+        return None, done
+    if not blocks:
+        return np.empty(0, dtype=dtype), done
+    return (np.concatenate(blocks) if len(blocks) > 1 else blocks[0]), done
+
+
+def _read_numeric_array(reader, dtype):
+    # Typed array for a numeric JSON array; a mixed one falls back to a list, as json.load gives
+    numbers, done = _scan_numeric_array(reader, dtype)
+    if done:
+        return numbers
+    out = numbers.tolist()
+    while True:
+        out.append(read_value(reader, dtype))
+        if _end_of_container(reader, b']'):
+            return out
+
+
+def read_value(reader, dtype=np.float64):
+    """
+    Parse the next JSON value. Arrays of numbers are parsed straight into an
+    ndarray of `dtype`; an array that turns out to hold anything else is
+    returned as a list.
+    """
+    ch = reader.skip_whitespace()
+    if ch == b'"':
+        return reader.read_string()
+    if ch == b'{':
+        reader.next()
+        out = {}
+        if reader.skip_whitespace() == b'}':
+            reader.next()
+            return out
+        while True:
+            key = reader.read_string()
+            reader.expect(b':')
+            out[key] = read_value(reader, dtype)
+            if _end_of_container(reader, b'}'):
+                return out
+    if ch == b'[':
+        reader.next()
+        first = reader.skip_whitespace()
+        if first and first in _NUMBER_START:
+            return _read_numeric_array(reader, dtype)
+        out = []
+        if first == b']':
+            reader.next()
+            return out
+        while True:
+            out.append(read_value(reader, dtype))
+            if _end_of_container(reader, b']'):
+                return out
+    if not ch:
+        raise ValueError("Unexpected end of file")
+    return _read_scalar(reader)
+
+
+def skip_value(reader):
+    # Step over the next JSON value without building it
+    ch = reader.skip_whitespace()
+    if ch == b'"':
+        reader.read_string()
+    elif ch == b'[' or ch == b'{':
+        reader.next()
+        first = reader.skip_whitespace()
+        if ch == b'[' and first and first in _NUMBER_START:
+            if _scan_numeric_array(reader, None, keep=False)[1]:
+                return
+            first = None
+        close = b']' if ch == b'[' else b'}'
+        if first == close:
+            reader.next()
+            return
+        while True:
+            if ch == b'{':
+                reader.read_string()
+                reader.expect(b':')
+            skip_value(reader)
+            if _end_of_container(reader, close):
+                return
+    elif not ch:
+        raise ValueError("Unexpected end of file")
+    else:
+        _read_token(reader)
+
+
+def _end_of_container(reader, close):
+    sep = reader.skip_whitespace()
+    reader.next()
+    if sep == close:
+        return True
+    if sep != b',':
+        raise ValueError(f"Expected ',' or {close!r} at byte {reader.offset() - 1}, found {sep!r}")
+    return False
+
+
+def _read_projected_object(reader, wanted, dtype):
+    # Reader is at '{': keep the wanted keys, skip everything else
+    reader.expect(b'{')
+    out = {}
+    if reader.skip_whitespace() == b'}':
+        reader.next()
+        return out
+    while True:
+        key = reader.read_string()
+        reader.expect(b':')
+        if key in wanted:
+            out[key] = read_value(reader, dtype)
+        else:
+            skip_value(reader)
+        if _end_of_container(reader, b'}'):
+            return out
+
+
+def extract_fields(file_path, fields, dtype=np.float64, block_size=BLOCK_SIZE):
+    """
+    Incrementally parse a JSON document keeping only `fields`.
+
+    A top-level object gives {field: value}; a top-level array of objects gives
+    one such dict per record. Flat numeric arrays come back as ndarrays of
+    `dtype`, so peak memory follows the projected columns, not the file.
+    Missing fields are None, as with dict.get.
+    """
+    wanted = set(fields)
+    with open(file_path, 'rb') as fh:
+        reader = _ByteReader(fh, block_size)
+        ch = reader.skip_whitespace()
+        if ch == b'{':
+            found = _read_projected_object(reader, wanted, dtype)
+            return {field: found.get(field) for field in fields}
+        if ch != b'[':
+            raise ValueError(f"Expected a JSON object or array at byte {reader.offset()}, found {ch!r}")
+        reader.next()
+        records = []
+        if reader.skip_whitespace() == b']':
+            return records
+        while True:
+            if reader.skip_whitespace() == b'{':
+                found = _read_projected_object(reader, wanted, dtype)
+                records.append({field: found.get(field) for field in fields})
+            else:
+                skip_value(reader)
+                records.append({field: None for field in fields})
+            if _end_of_container(reader, b']'):
+                return records
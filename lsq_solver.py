@@ -0,0 +1,148 @@
+import logging
+import time
+import numpy as np
+from scipy.optimize import OptimizeResult, least_squares
+import hubble_models
+import kernels
+import profiling
+
+
+def _bounds_arrays(bounds, n):
+    if bounds is None:
+        return np.full(n, -np.inf), np.full(n, np.inf)
+    lo = np.array([-np.inf if b[0] is None else b[0] for b in bounds], dtype=float)
+    hi = np.array([np.inf if b[1] is None else b[1] for b in bounds], dtype=float)
+    return lo, hi
+
+
+def covariance_from_jacobian(J, r):
+    """
+    Exact Gauss-Newton covariance s^2 (J^T J)^+ and Fisher matrix J^T J / s^2
+    at the solution, with s^2 = SSE / (n - rank). The pseudo-inverse keeps the
+    covariance finite along degenerate directions; check `rank` before trusting it.
+    """
+    JTJ = J.T @ J
+    rank = np.linalg.matrix_rank(J)
+    dof = max(len(r) - rank, 1)
+    s2 = np.dot(r, r) / dof
+    return s2 * np.linalg.pinv(JTJ), JTJ / s2, rank
+
+
+def solve_nonlinear(residuals, jacobian, x0, args=(), bounds=None, **kwargs):
+    """
+    Trust-region least squares on a residuals function with its analytic Jacobian.
+    Both functions take (params, *args), matching the scripts' residuals signature.
+    """
+    start = time.perf_counter()
+    x0 = np.asarray(x0, dtype=float)
+    lo, hi = _bounds_arrays(bounds, len(x0))
+    x0 = np.clip(x0, lo, hi)
+    # float32 data (precision.py) gives float32 residuals; the solver itself works in float64
+    fun = lambda params, *a: np.asarray(residuals(params, *a), dtype=np.float64)
+    fit = least_squares(fun, x0, jac=jacobian, args=args, bounds=(lo, hi), **kwargs)
+    cov, fisher, rank = covariance_from_jacobian(fit.jac, fit.fun)
+    degenerate = rank < len(x0)
+    if degenerate:
+        logging.warning(f"Jacobian has rank {rank} < {len(x0)} parameters; "
+                        "the fit is degenerate and the covariance is a pseudo-inverse")
+    result = OptimizeResult(x=fit.x, fun=np.dot(fit.fun, fit.fun), residuals=fit.fun, jac=fit.jac,
+                            cov=cov, fisher=fisher, rank=rank, degenerate=degenerate,
+                            success=fit.success, status=fit.status, message=fit.message,
+                            nfev=fit.nfev, njev=fit.njev, method='trf')
+    name = getattr(getattr(residuals, '__self__', None), 'name', getattr(residuals, '__name__', 'residuals'))
+    profiling.record_fit(name, result, time.perf_counter() - start, rows=len(fit.fun))
+    return result
+
+
+def _clamp_to_ridge(theta, null_vec, lo, hi):
+    # Slide along the single degenerate direction until theta lies inside the box
+    t_lo, t_hi = -np.inf, np.inf
+    for i in range(len(theta)):
+        if abs(null_vec[i]) < 1e-12:
+            continue
+        a = (lo[i] - theta[i]) / null_vec[i]
+        b = (hi[i] - theta[i]) / null_vec[i]
+        t_lo = max(t_lo, min(a, b))
+        t_hi = min(t_hi, max(a, b))
+    if t_lo > t_hi:
+        logging.warning("No point of the degenerate solution set satisfies the bounds")
+        return theta
+    return theta + min(max(0.0, t_lo), t_hi) * null_vec
+
+
+def solve_linear(model, v, M, m_obs, x0=None, bounds=None):
+    """
+    Closed-form fit for models linear in a reparametrisation theta.
+
+    When the design matrix is rank deficient only some combinations of theta
+    are identifiable (e.g. -5*log10(H0) + R_V*E(B-V) for the tiger model).
+    The returned point is the one on that solution set closest to the initial
+    guess, moved inside the bounds if possible, and a warning is logged.
+    """
+    start = time.perf_counter()
+    x0 = np.asarray(model.initial_guess if x0 is None else x0, dtype=float)
+    bounds = model.bounds if bounds is None else bounds
+    base, X = model.linear_form(v, M)
+    y = m_obs - base
+    U, s, Vt = np.linalg.svd(X, full_matrices=False)
+    tol = s.max() * max(X.shape) * np.finfo(float).eps
+    rank = int(np.sum(s > tol))
+
+    theta0 = model.to_linear(x0)
+    # theta0 + pinv(X) (y - X theta0): exact least-squares solution nearest the initial guess
+    inv_s = np.where(s > tol, 1 / np.where(s > tol, s, 1), 0.0)
+    theta = theta0 + Vt.T @ (inv_s * (U.T @ (y - X @ theta0)))
+
+    degenerate = rank < X.shape[1]
+    if degenerate:
+        null_space = Vt[rank:]
+        lo, hi = _bounds_arrays(model.linear_bounds(bounds), len(theta))
+        if len(null_space) == 1:
+            theta = _clamp_to_ridge(theta, null_space[0], lo, hi)
+        combos = [' + '.join(f"{w:.3g}*theta{i}" for i, w in enumerate(row) if abs(w) > 1e-12)
+                  for row in Vt[:rank]]
+        logging.warning(f"Model {model.name} is degenerate: only {rank} of {X.shape[1]} linear "
+                        f"parameter combinations are identifiable ({'; '.join(combos)}). "
+                        f"Returning the solution nearest the initial guess {x0.tolist()}.")
+
+    params = model.from_linear(theta, x0, bounds)
+    lo, hi = _bounds_arrays(bounds, len(params))
+    if np.any(params < lo) or np.any(params > hi):
+        # The unconstrained optimum is infeasible, so the answer sits on the boundary;
+        # polish from the clipped closed-form point with the bounded solver
+        logging.warning(f"Closed-form solution {params.tolist()} lies outside the bounds {bounds}; "
+                        "refining on the boundary")
+        result = solve_nonlinear(model.residuals, model.jacobian, np.clip(params, lo, hi),
+                                 args=(v, M, m_obs), bounds=bounds)
+        result.degenerate = result.degenerate or degenerate
+        return result
+
+    r = np.asarray(model.residuals(params, v, M, m_obs), dtype=np.float64)
+    J = model.jacobian(params, v, M, m_obs)
+    cov, fisher, _ = covariance_from_jacobian(J, r)
+    result = OptimizeResult(x=params, theta=theta, fun=np.dot(r, r), residuals=r, jac=J,
+                            cov=cov, fisher=fisher, rank=rank, degenerate=degenerate,
+                            success=True, status=0, message='closed-form linear least squares',
+                            nfev=1, njev=1, method='linear')
+    profiling.record_fit(model.name, result, time.perf_counter() - start, rows=len(r))
+    return result
+
+
+def fit_model(model, m_obs, M, z, x0=None, bounds=None, method='auto', **kwargs):
+    """
+    Fit one of hubble_models.MODELS (or its name) to the catalog columns.
+
+    method='auto' uses the closed form whenever the model has one and falls
+    back to the trust-region solver otherwise; 'linear' / 'nonlinear' force one.
+    """
+    if isinstance(model, str):
+        model = hubble_models.get_model(model)
+    x0 = model.initial_guess if x0 is None else x0
+    bounds = model.bounds if bounds is None else bounds
+    v = model.velocity(kernels.as_float(z))
+    M = kernels.as_float(M)
+    m_obs = kernels.as_float(m_obs)
+
+    if method == 'linear' or (method == 'auto' and model.linear_form is not None):
+        return solve_linear(model, v, M, m_obs, x0, bounds)
+    return solve_nonlinear(model.residuals, model.jacobian, x0, args=(v, M, m_obs), bounds=bounds, **kwargs)
@@ -0,0 +1,145 @@
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+import atomic_io
+import catalog_store
+import hubble_models
+
+ITERATIVE_K = 'iterative_k'
+SWEEP_MODELS = tuple(hubble_models.MODELS) + (ITERATIVE_K,)
+
+# Per-worker view of the shared catalog, set up once by _attach_catalog
+_worker_shm = None
+_worker_columns = None
+
+
+def share_catalog(columns):
+    # Copy the (3, n) catalog into a fresh shared-memory block; caller must close() and unlink()
+    block = np.ascontiguousarray(columns, dtype=np.float64)
+    shm = shared_memory.SharedMemory(create=True, size=max(block.nbytes, 1))
+    view = np.ndarray(block.shape, dtype=block.dtype, buffer=shm.buf)
+    view[:] = block
+    return shm, block.shape
+
+
+def _attach_catalog(name, shape):
+    global _worker_shm, _worker_columns
+    _worker_shm = shared_memory.SharedMemory(name=name)
+    _worker_columns = np.ndarray(shape, dtype=np.float64, buffer=_worker_shm.buf)
+    _worker_columns.flags.writeable = False
+
+
+def initial_guesses(model_name, n_random=0, seed=0):
+    """The script's hard-coded guess followed by n_random draws inside the model's bounds."""
+    if model_name == ITERATIVE_K:
+        guesses = [[0.0]]
+        lo, hi = np.array([0.0]), np.array([0.01])  # mag/Mpc; negative k quickly has no solution
+    else:
+        model = hubble_models.get_model(model_name)
+        guesses = [list(model.initial_guess)]
+        lo = np.array([b[0] if b[0] is not None else g / 2 for b, g in zip(model.bounds, model.initial_guess)], float)
+        hi = np.array([b[1] if b[1] is not None else g * 2 + 1 for b, g in zip(model.bounds, model.initial_guess)], float)
+        lo = np.maximum(lo, 1e-6 * (np.arange(len(lo)) == 0))  # keep H0 strictly positive
+    rng = np.random.default_rng([seed, len(model_name)] + [ord(ch) for ch in model_name])
+    guesses += rng.uniform(lo, hi, size=(n_random, len(lo))).tolist()
+    return guesses
+
+
+def fit_one(model_name, x0, method='auto'):
+    # Runs in a worker: fit one model from one starting point on the shared catalog
+    return fit_columns(_worker_columns, model_name, x0, method)
+
+
+def fit_columns(columns, model_name, x0, method='auto'):
+    """Fit one model from one starting point on a (3, n) catalog block; returns a JSON-ready record."""
+    m, M, z = columns
+    start = time.perf_counter()
+    try:
+        if model_name == ITERATIVE_K:
+            import iterative_k
+            fit = iterative_k.fit_k(m, M, z, k_initial=x0[0])
+            record = {
+                'params': {'k': float(fit['k']), 'H0': float(fit['H0'])},
+                'errors': {'k': float(fit['k_error']), 'H0': float(fit['H0_error'])},
+                'objective': float(fit['objective']),
+                'success': bool(np.isfinite(fit['objective']) and np.isfinite(fit['H0'])),
+                'nfev': int(fit['nfev']),
+            }
+        else:
+            import lsq_solver
+            model = hubble_models.get_model(model_name)
+            fit = lsq_solver.fit_model(model, m, M, z, x0=x0, method=method)
+            errors = np.sqrt(np.clip(np.diag(fit.cov), 0, None))
+            record = {
+                'params': dict(zip(model.param_names, map(float, fit.x))),
+                'errors': dict(zip(model.param_names, map(float, errors))),
+                'objective': float(fit.fun),
+                'success': bool(fit.success and np.isfinite(fit.fun)),
+                'degenerate': bool(fit.degenerate),
+                'nfev': int(fit.nfev),
+            }
+    except Exception as e:
+        record = {'success': False, 'error': f"{type(e).__name__}: {e}"}
+    record.update(model=model_name, initial_guess=[float(g) for g in x0],
+                  seconds=time.perf_counter() - start, pid=os.getpid())
+    return record
+
+
+def run_sweep(file_path, models=SWEEP_MODELS, n_random=0, seed=0, workers=None, method='auto'):
+    data = catalog_store.read_catalog(file_path)
+    columns = np.stack([np.asarray(data[name], dtype=np.float64) for name in catalog_store.CATALOG_COLUMNS])
+    workers = workers or os.cpu_count() or 1
+    tasks = [(name, x0) for name in models for x0 in initial_guesses(name, n_random, seed)]
+    logging.info(f"Sweeping {len(tasks)} fits over {columns.shape[1]} rows with {workers} workers")
+
+    shm, shape = share_catalog(columns)
+    results = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach_catalog,
+                                 initargs=(shm.name, shape)) as pool:
+            futures = [pool.submit(fit_one, name, x0, method) for name, x0 in tasks]
+            for future in as_completed(futures):
+                results.append(future.result())
+    finally:
+        shm.close()
+        shm.unlink()
+
+    order = {name: i for i, name in enumerate(models)}
+    results.sort(key=lambda r: (order[r['model']], r['initial_guess']))
+    best = {}
+    for record in results:
+        if not record['success']:
+            continue
+        current = best.get(record['model'])
+        if current is None or record['objective'] < current['objective']:
+            best[record['model']] = record
+    return {
+        'dataset': {'path': file_path, 'rows': int(shape[1])},
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'workers': workers,
+        'results': results,
+        'best': best,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Fit every model from every initial guess in parallel')
+    parser.add_argument('catalog', nargs='?', default='Challenge2_data.json')
+    parser.add_argument('--models', nargs='+', choices=SWEEP_MODELS, default=list(SWEEP_MODELS))
+    parser.add_argument('--random-guesses', type=int, default=0, help='extra starting points per model')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, help='default: number of CPU cores')
+    parser.add_argument('--method', choices=('auto', 'linear', 'nonlinear'), default='auto')
+    parser.add_argument('--output', default='sweep_results.json')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sweep = run_sweep(args.catalog, args.models, args.random_guesses, args.seed, args.workers, args.method)
+    atomic_io.write_json_atomic(sweep, args.output)
+    for name, record in sweep['best'].items():
+        print(f"{name}: {record['params']}")
+    print(f"{len(sweep['results'])} fits written to {args.output}")
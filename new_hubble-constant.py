@@ -1,19 +1,19 @@
-import json
 import logging
+import fastlog
 import numpy as np
-from datetime import datetime
+import catalog_store
+import streaming
 
 # Set up logging configuration
-log_filename = datetime.now().strftime('logfile_%Y%m%d_%H%M%S.log')
-logging.basicConfig(filename=log_filename, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Runs log to the indexed run-log store ($HUBBLE_RUN_LOG, default runlogs/); see run_log_store.py
+fastlog.setup_logging()
 ###  End of Basics Setup ###
 
 ### Start of Functions Declaration ###
 def load_data_from_json(file_path):
     logging.info(f"Attempting to load data from {file_path}")
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
+        data = catalog_store.read_catalog(file_path)
         logging.info("Data loaded successfully from JSON file.")
         return data
     except Exception as e:
@@ -24,7 +24,7 @@ def load_data_from_json(file_path):
 def transform_data(data):
     logging.info("Starting data transformation.")
     try:
-        transformed_data = np.array([data["Apparent Magitude (m)"], data["Absolute Magnitude (M)"], data["Redshift (z)"]]).T
+        transformed_data = catalog_store.as_table(data)
         logging.info("Data transformation completed successfully.")
         return transformed_data
     except Exception as e:
@@ -43,10 +43,10 @@ def calculate_expression(data, column_index, c):
             raise IndexError("Column index is out of bounds")
 
         col = data[:, column_index]
-        result = (((col + 1)**2 - 1) / ((col + 1)**2 + 1)) * c
+        result = streaming.relativistic_velocity(col, c)
 
         formatted_result = np.array2string(result, formatter={'float_kind':lambda x: "%.10f" % x})
-        logging.info(f"Calculated result for column {column_index + 1}: {formatted_result}")
+        logging.info("Calculated result for column %d: %s", column_index + 1, fastlog.array_summary(result))
         print(f"Calculated result for column {column_index + 1}: {formatted_result}")
 
         return result
@@ -66,10 +66,10 @@ def velocity_calc(data, col1, col2):
 
         column1 = data[:, col1]
         column2 = data[:, col2]
-        result = (10**((column1 - column2 + 5) / 5)) / 10**6
+        result = streaming.distance_mpc(column1, column2)
 
         formatted_result = np.array2string(result, formatter={'float_kind':lambda x: "%.10f" % x})
-        logging.info(f"Calculated velocity for columns {col1 + 1}, {col2 + 1}: {formatted_result}")
+        logging.info("Calculated velocity for columns %d, %d: %s", col1 + 1, col2 + 1, fastlog.array_summary(result))
         print(f"Calculated velocity for columns {col1 + 1}, {col2 + 1}: {formatted_result}")
 
         return result
@@ -90,7 +90,7 @@ def file_loader(file_path):
         return None
 
     formatted_data = np.array2string(transformed_data, formatter={'float_kind':lambda x: "%.10f" % x})
-    logging.info(f"Transformed data: {formatted_data}")
+    logging.info("Transformed data: %s", fastlog.array_summary(transformed_data))
     print(f"Transformed data: {formatted_data}")
 
     return transformed_data
@@ -0,0 +1,123 @@
+import argparse
+import json
+import math
+import numpy as np
+import atomic_io
+import regression
+import streaming
+
+STATE_VERSION = 1
+
+
+class OnlineHubbleEstimator:
+    """
+    Running H0 estimate over a catalog that grows (and shrinks) in batches.
+
+    Only the six regression sums of distance and velocity are kept, so update()
+    and downdate() cost O(batch) and every query is O(1). Velocities are c*z as
+    in CH_TG02.py, or the relativistic form with relativistic=True.
+    """
+
+    def __init__(self, c=streaming.c_kms, relativistic=False, through_origin=False):
+        self.c = c
+        self.relativistic = relativistic
+        self.through_origin = through_origin
+        self.stats = regression.EMPTY_STATS
+
+    def _batch_stats(self, m, M, z, weights):
+        d = streaming.distance_mpc(np.asarray(m, dtype=float), np.asarray(M, dtype=float))
+        z = np.asarray(z, dtype=float)
+        v = streaming.relativistic_velocity(z, self.c) if self.relativistic else self.c * z
+        return regression.sufficient_stats(d, v, weights)
+
+    def update(self, m, M, z, weights=None):
+        self.stats += self._batch_stats(m, M, z, weights)
+        return self
+
+    def downdate(self, m, M, z, weights=None):
+        # Remove observations previously passed to update(); the caller must pass the same rows
+        removed = self._batch_stats(m, M, z, weights)
+        if removed.n > self.stats.n + 1e-9:
+            raise ValueError(f"Cannot remove {removed.n:g} rows from an estimator holding {self.stats.n:g}")
+        self.stats -= removed
+        return self
+
+    @property
+    def n(self):
+        return self.stats.n
+
+    def _fit(self):
+        needed = 1 if self.through_origin else 2
+        if self.stats.n < needed:
+            raise ValueError(f"Need at least {needed} rows to fit, got {self.stats.n:g}")
+        return regression.solve(self.stats, self.through_origin)
+
+    def h0(self):
+        return self._fit().slope
+
+    def intercept(self):
+        return self._fit().intercept
+
+    def stderr(self):
+        # Standard error of the slope, as linregress reports it
+        fit = self._fit()
+        s = self.stats
+        dof = s.n - (1 if self.through_origin else 2)
+        sxx = s.sxx if self.through_origin else s.sxx - s.sx ** 2 / s.n
+        return math.sqrt(fit.sse / dof / sxx) if dof > 0 else float('nan')
+
+    def result(self):
+        fit = self._fit()
+        return {'rows': int(round(self.stats.n)), 'H0': float(fit.slope), 'Intercept': float(fit.intercept),
+                'Standard Error': self.stderr(), 'SSE': float(fit.sse)}
+
+    def diagnostics(self):
+        """Full linregress-style report (r and p values need scipy)."""
+        return regression.diagnostics_from_stats(self.stats, self.through_origin)
+
+    ### State ###
+    def to_dict(self):
+        return {
+            'version': STATE_VERSION,
+            'c': self.c,
+            'relativistic': self.relativistic,
+            'through_origin': self.through_origin,
+            'stats': {name: float(value) for name, value in self.stats._asdict().items()},
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        if state.get('version') != STATE_VERSION:
+            raise ValueError(f"Unsupported estimator state version {state.get('version')!r}")
+        est = cls(state['c'], state['relativistic'], state['through_origin'])
+        est.stats = regression.SufficientStats(**state['stats'])
+        return est
+
+    def save(self, path):
+        atomic_io.write_json_atomic(self.to_dict(), path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Fold new observations into a saved H0 estimate')
+    parser.add_argument('state', help='estimator state file (created if missing)')
+    parser.add_argument('catalogs', nargs='*', help='catalogs to add (JSON, CSV or .npy store)')
+    parser.add_argument('--remove', nargs='*', default=[], help='catalogs to take back out')
+    parser.add_argument('--relativistic', action='store_true', help='relativistic velocities for a new state')
+    parser.add_argument('--through-origin', action='store_true', help='fit without intercept for a new state')
+    args = parser.parse_args()
+
+    try:
+        estimator = OnlineHubbleEstimator.load(args.state)
+    except FileNotFoundError:
+        estimator = OnlineHubbleEstimator(relativistic=args.relativistic, through_origin=args.through_origin)
+    for path, apply in [(p, estimator.update) for p in args.catalogs] + [(p, estimator.downdate) for p in args.remove]:
+        for m, M, z in streaming.iter_catalog_chunks(path):
+            apply(m, M, z)
+    estimator.save(args.state)
+    for key, value in estimator.result().items():
+        print(f"{key}: {value}")
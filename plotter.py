@@ -1,6 +1,8 @@
-import pandas as pd
+import numpy as np
 import matplotlib.pyplot as plt
 import logging
+import csv_ingest
+import render
 
 # Set up logging
 logging.basicConfig(filename='plotter.log', level=logging.INFO, 
@@ -11,20 +13,20 @@ logging.info('Starting the plotting process')
 try:
     # Read CSV file
     logging.info('Reading CSV file')
-    data = pd.read_csv('plot_data.csv')
-
-    # Sort data by the first column in ascending order
-    logging.info('Sorting data by the first column')
-    data = data.sort_values(by=data.columns[0])
+    data = csv_ingest.read_csv_columns('plot_data.csv', [0, 1])
 
     # Extract columns
     logging.info('Extracting columns')
-    x = data.iloc[:, 0]
-    y = data.iloc[:, 1]
+    x, y = data.values()
+
+    # Sort data by the first column in ascending order
+    logging.info('Sorting data by the first column')
+    order = np.argsort(x, kind='stable')
+    x, y = x[order], y[order]
 
-    # Plot data
+    # Plot data, decimated to what the axes can show
     logging.info('Plotting data')
-    plt.plot(x, y)
+    render.draw_line(plt.gca(), x, y)
     plt.xlabel('X Axis')
     plt.ylabel('Y Axis')
     plt.title('Line Graph from CSV Data')
@@ -46,8 +48,7 @@ except Exception as e:
         Save the current plot as a JPG file in Full HD resolution (1920x1080).
         """
         logging.info('Saving plot as FHD JPG')
-        plt.gcf().set_size_inches(19.20, 10.80)
-        plt.savefig(filename, dpi=1000)
+        render.save_pixels(plt.gcf(), filename, 1920, 1080)
 
     # Save plot as FHD JPG
     save_plot_as_fhd_jpg()
\ No newline at end of file
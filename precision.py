@@ -0,0 +1,185 @@
+"""
+Opt-in float32 storage and compute for load -> transform -> velocity -> residual.
+
+Magnitudes are only meaningful to about 1e-4 mag and redshifts to about 1e-6,
+while float32 carries about 7 significant digits (6e-7 relative, ~1e-5 mag at
+m ~ 20), so the catalog columns and the element-wise kernels can run at half
+the memory traffic. Reductions never do: chi-square sums accumulate float32
+residuals in float64 blocks (kernels.sum_squares), the regression sufficient
+statistics widen each block into a float64 buffer, and the solvers iterate
+in float64.
+
+Enable with HUBBLE_PRECISION=float32 (read_catalog then returns float32
+columns) or set_precision('float32'). `validate` fits every model both ways
+and reports how far float32 moves H0, gamma, A_V and the other parameters,
+against their values and their standard errors:
+
+    python precision.py Challenge2_data.json --output precision_report.json
+    python precision.py --synthetic 1000000
+"""
+import argparse
+import logging
+import os
+import sys
+import numpy as np
+
+ENV_VAR = 'HUBBLE_PRECISION'
+PRECISIONS = {'float64': np.float64, 'float32': np.float32}
+# Agreement required of the float32 path against float64
+RESIDUAL_TOL = 1e-4     # mag
+VELOCITY_RTOL = 1e-6
+PARAM_RTOL = 1e-4
+# ... or a parameter may move by this fraction of its own standard error
+SIGMA_FRACTION = 1e-2
+
+_current = None
+
+
+def set_precision(name=None):
+    """Select 'float64' or 'float32' (None: $HUBBLE_PRECISION or float64); returns the dtype."""
+    global _current
+    name = name or os.environ.get(ENV_VAR) or 'float64'
+    try:
+        _current = np.dtype(PRECISIONS[name])
+    except KeyError:
+        raise ValueError(f"Unknown precision {name!r}; choose from {sorted(PRECISIONS)}") from None
+    return _current
+
+
+def compute_dtype():
+    return set_precision() if _current is None else _current
+
+
+def storage_dtype():
+    # None leaves stored catalogs as they are; only float32 mode converts on load
+    dtype = compute_dtype()
+    return dtype if dtype == np.float32 else None
+
+
+### Validation ###
+def _max_abs(a, b):
+    with np.errstate(invalid='ignore'):
+        diff = np.abs(np.asarray(a, dtype=np.float64) - np.asarray(b, dtype=np.float64))
+    return float(np.nanmax(diff)) if diff.size else 0.0
+
+
+def _compare_params(names, x64, x32, rtol, sigma=None):
+    # A shift passes when it is small relative to the value or to the parameter's standard error
+    out = {}
+    for i, (name, a, b) in enumerate(zip(names, x64, x32)):
+        abs_diff = abs(float(b) - float(a))
+        rel_diff = abs_diff / abs(float(a)) if a else abs_diff
+        entry = {'float64': float(a), 'float32': float(b), 'abs_diff': abs_diff, 'rel_diff': rel_diff}
+        ok = rel_diff <= rtol
+        if sigma is not None:
+            entry['sigma'] = float(sigma[i])
+            ok = ok or abs_diff <= SIGMA_FRACTION * sigma[i]
+        entry['ok'] = bool(ok)
+        out[name] = entry
+    return out
+
+
+def validate(m, M, z, models=None, param_rtol=PARAM_RTOL, residual_tol=RESIDUAL_TOL, velocity_rtol=VELOCITY_RTOL):
+    """
+    Run the pipeline on (m, M, z) in float64 and in float32 and compare: the
+    velocity columns, every model's residuals at the float64 optimum, the
+    fitted parameters and chi-square, and the Hubble-line slope. Returns a
+    report dict whose 'ok' is True when everything is inside the tolerances.
+    """
+    import hubble_models
+    import lsq_solver
+    import regression
+    import streaming
+
+    cols64 = [np.asarray(col, dtype=np.float64) for col in (m, M, z)]
+    cols32 = [col.astype(np.float32) for col in cols64]
+    m64, M64, z64 = cols64
+    m32, M32, z32 = cols32
+    report = {'rows': len(m64), 'tolerances': {'param_rtol': param_rtol, 'residual_mag': residual_tol,
+                                               'velocity_rtol': velocity_rtol}}
+
+    # Storage: what rounding the columns to float32 costs on its own
+    report['storage'] = {name: _max_abs(c64, c32) for name, c64, c32 in
+                         zip(('m', 'M', 'z'), cols64, cols32)}
+
+    v64 = streaming.relativistic_velocity(z64, streaming.c_kms)
+    v32 = streaming.relativistic_velocity(z32, streaming.c_kms)
+    rel = _max_abs(v64, v32) / max(float(np.max(np.abs(v64))), np.finfo(float).tiny)
+    report['velocity'] = {'max_rel_diff': rel, 'ok': bool(rel <= velocity_rtol)}
+
+    # Linear Hubble fit (CH_TG02): float32 distances, float64 sufficient statistics
+    d64, d32 = streaming.distance_mpc(m64, M64), streaming.distance_mpc(m32, M32)
+    fit64 = regression.fit_line(d64, streaming.c_kms * z64)
+    fit32 = regression.fit_line(d32, streaming.c_kms * z32)
+    report['hubble_line'] = _compare_params(('H0', 'Intercept'), fit64, fit32[:2], param_rtol)
+    # The intercept is ~0 and only meaningful in absolute terms
+    report['hubble_line']['Intercept']['ok'] = True
+
+    report['models'] = {}
+    for name in models or hubble_models.MODELS:
+        model = hubble_models.get_model(name)
+        res64 = lsq_solver.fit_model(model, m64, M64, z64)
+        res32 = lsq_solver.fit_model(model, m32, M32, z32)
+        # Same parameters, both precisions: the element-wise error with the optimiser taken out
+        with np.errstate(invalid='ignore'):
+            r64 = model.residuals(res64.x, model.velocity(z64), M64, m64)
+            r32 = model.residuals(res64.x, model.velocity(z32), M32, m32)
+        residual_diff = _max_abs(r64, r32)
+        params = _compare_params(model.param_names, res64.x, res32.x, param_rtol, np.sqrt(np.diag(res64.cov)))
+        chi_rel = abs(float(res32.fun) - float(res64.fun)) / max(abs(float(res64.fun)), np.finfo(float).tiny)
+        entry = {
+            'parameters': params,
+            'chi_square': {'float64': float(res64.fun), 'float32': float(res32.fun), 'rel_diff': chi_rel},
+            'max_residual_diff': residual_diff,
+            'residual_ok': bool(residual_diff <= residual_tol),
+            'degenerate': bool(res64.degenerate),
+        }
+        if res64.degenerate:
+            # Only combinations of the parameters are determined; the split between them is not a precision question
+            entry['ok'] = entry['residual_ok']
+        else:
+            entry['ok'] = entry['residual_ok'] and all(p['ok'] for p in params.values())
+        report['models'][name] = entry
+
+    report['ok'] = (report['velocity']['ok'] and report['hubble_line']['H0']['ok']
+                    and all(entry['ok'] for entry in report['models'].values()))
+    return report
+
+
+def print_report(report):
+    print(f"float32 vs float64 on {report['rows']} rows")
+    print(f"  velocity max rel diff {report['velocity']['max_rel_diff']:.3e}")
+    h0 = report['hubble_line']['H0']
+    print(f"  hubble_line H0 {h0['float64']:.6f} vs {h0['float32']:.6f} (rel {h0['rel_diff']:.2e})")
+    for name, entry in report['models'].items():
+        params = ', '.join(f"{p} {v['float64']:.6g}/{v['float32']:.6g} (rel {v['rel_diff']:.1e})"
+                           for p, v in entry['parameters'].items())
+        flag = 'ok' if entry['ok'] else 'FAIL'
+        print(f"  {name:20s} {flag:4s} residual diff {entry['max_residual_diff']:.2e} mag; {params}")
+    print('PASS' if report['ok'] else 'FAIL')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Validate the float32 pipeline against float64')
+    parser.add_argument('catalog', nargs='?', default='Challenge2_data.json')
+    parser.add_argument('--synthetic', type=int, help='validate on a generated catalog of this many rows')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--param-rtol', type=float, default=PARAM_RTOL)
+    parser.add_argument('--output', help='write the report as JSON')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    if args.synthetic:
+        import benchmark_suite
+        m, M, z = benchmark_suite.make_catalog(args.synthetic, args.seed)
+    else:
+        import catalog_store
+        data = catalog_store.read_catalog(args.catalog, dtype=np.float64)
+        m, M, z = (data[name] for name in catalog_store.CATALOG_COLUMNS)
+    report = validate(m, M, z, param_rtol=args.param_rtol)
+    print_report(report)
+    if args.output:
+        import atomic_io
+        atomic_io.write_json_atomic(report, args.output)
+        print(f"Report saved to {args.output}")
+    sys.exit(0 if report['ok'] else 1)
@@ -0,0 +1,272 @@
+"""
+Opt-in instrumentation: wall and CPU time per pipeline stage, evaluation
+counts and time per evaluation for every solver call, and peak memory,
+written as a JSON profile next to a script's result file.
+
+Disabled (the default) every hook is a method call on NullProfiler that does
+nothing. Enable with HUBBLE_PROFILE=1, or profiling.enable(). Scripts mark
+their stages with lap(name), which ends the previous stage, or with
+`with stage(name):`; lsq_solver reports each fit through record_fit.
+
+HUBBLE_PROFILE=tracemalloc also records per-stage Python allocation peaks
+(tracemalloc slows allocation-heavy code noticeably). HUBBLE_PROFILE_SAMPLER
+attaches a sampling profiler for the whole run: 'cprofile' for the built-in
+deterministic profiler, or a command template for an external one, e.g.
+
+    HUBBLE_PROFILE=1 HUBBLE_PROFILE_SAMPLER="py-spy record -o {output} --pid {pid}" python cpc_gpt2.py
+
+{pid} is this process and {output} profile_<pid>.sampler in the working
+directory (cProfile writes profile_<pid>.pstats); the profile records which.
+"""
+import atexit
+import logging
+import os
+import shlex
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ENV_VAR = 'HUBBLE_PROFILE'
+SAMPLER_ENV_VAR = 'HUBBLE_PROFILE_SAMPLER'
+
+
+def profile_path_for(result_path):
+    root, _ = os.path.splitext(result_path)
+    return root + '.profile.json'
+
+
+def peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class NullProfiler:
+    """Every hook is a no-op; what runs when profiling is off."""
+    enabled = False
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def lap(self, name):
+        pass
+
+    def stop(self):
+        pass
+
+    def record_fit(self, name, result, seconds, rows=None):
+        pass
+
+    def write(self, path):
+        return None
+
+    def write_for(self, result_path):
+        return None
+
+
+class _Stage:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.token = self.profiler._start(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler._finish(self.token)
+        return False
+
+
+class Profiler:
+    """Collects stage timings and fit records; write() exports them as JSON."""
+    enabled = True
+
+    def __init__(self, trace_memory=False, sampler=None):
+        self.trace_memory = trace_memory
+        self.stages = []
+        self.fits = []
+        self._lap = None
+        self._t0 = time.perf_counter()
+        self._cpu0 = time.process_time()
+        self._sampler = sampler
+        self._sampler_handle = None
+        self._sampler_output = None
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _start(self, name):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        return name, time.perf_counter(), time.process_time()
+
+    def _finish(self, token):
+        name, wall0, cpu0 = token
+        record = {
+            'name': name,
+            'start_seconds': wall0 - self._t0,
+            'wall_seconds': time.perf_counter() - wall0,
+            'cpu_seconds': time.process_time() - cpu0,
+        }
+        if self.trace_memory:
+            record['peak_traced_bytes'] = tracemalloc.get_traced_memory()[1]
+        self.stages.append(record)
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def lap(self, name):
+        # End the running lap (if any) and start `name`
+        self.stop()
+        self._lap = self._start(name)
+
+    def stop(self):
+        if self._lap is not None:
+            self._finish(self._lap)
+            self._lap = None
+
+    def record_fit(self, name, result, seconds, rows=None):
+        nfev = int(getattr(result, 'nfev', 0) or 0)
+        njev = int(getattr(result, 'njev', 0) or 0)
+        self.fits.append({
+            'name': name,
+            'method': getattr(result, 'method', None),
+            'nfev': nfev,
+            'njev': njev,
+            'rows': rows,
+            # every residual or Jacobian evaluation is one pass over the data
+            'data_passes': nfev + njev,
+            'seconds': seconds,
+            'seconds_per_evaluation': seconds / max(nfev + njev, 1),
+            'success': bool(getattr(result, 'success', True)),
+        })
+
+    ### Sampling profiler hook ###
+    def start_sampler(self, output_path):
+        if not self._sampler:
+            return
+        if self._sampler == 'cprofile':
+            import cProfile
+            self._sampler_handle = cProfile.Profile()
+            self._sampler_output = os.path.splitext(output_path)[0] + '.pstats'
+            self._sampler_handle.enable()
+            return
+        self._sampler_output = os.path.splitext(output_path)[0] + '.sampler'
+        command = self._sampler.format(pid=os.getpid(), output=self._sampler_output)
+        try:
+            self._sampler_handle = subprocess.Popen(shlex.split(command))
+        except OSError as e:
+            logging.warning(f"Could not start sampling profiler {command!r}: {e}")
+            self._sampler_output = None
+
+    def stop_sampler(self):
+        handle, self._sampler_handle = self._sampler_handle, None
+        if handle is None:
+            return None
+        if isinstance(handle, subprocess.Popen):
+            handle.terminate()
+            try:
+                handle.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                handle.kill()
+        else:
+            handle.disable()
+            handle.dump_stats(self._sampler_output)
+        return self._sampler_output
+
+    def to_dict(self):
+        return {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'argv': sys.argv,
+            'pid': os.getpid(),
+            'wall_seconds': time.perf_counter() - self._t0,
+            'cpu_seconds': time.process_time() - self._cpu0,
+            'peak_rss_bytes': peak_rss_bytes(),
+            'peak_traced_bytes': tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None,
+            'stages': sorted(self.stages, key=lambda s: s['start_seconds']),
+            'fits': self.fits,
+            'sampler_output': self._sampler_output,
+        }
+
+    def write(self, path):
+        import atomic_io
+        self.stop()
+        self.stop_sampler()
+        atomic_io.write_json_atomic(self.to_dict(), path)
+        logging.info(f"Profile written to {path}")
+        return path
+
+    def write_for(self, result_path):
+        return self.write(profile_path_for(result_path))
+
+
+_current = NullProfiler()
+
+
+def enable(trace_memory=False, sampler=None, output_path=None):
+    """Install a recording Profiler; `output_path` names where a sampler's output goes (its profile path)."""
+    global _current
+    _current = Profiler(trace_memory, sampler)
+    if sampler:
+        _current.start_sampler(output_path or f"profile_{os.getpid()}.json")
+        atexit.register(_current.stop_sampler)
+    return _current
+
+
+def disable():
+    global _current
+    _current.stop()
+    if isinstance(_current, Profiler):
+        _current.stop_sampler()
+    _current = NullProfiler()
+
+
+def get_profiler():
+    return _current
+
+
+# Module-level shortcuts, so call sites read profiling.lap('fit')
+def stage(name):
+    return _current.stage(name)
+
+
+def lap(name):
+    _current.lap(name)
+
+
+def stop():
+    _current.stop()
+
+
+def record_fit(name, result, seconds, rows=None):
+    _current.record_fit(name, result, seconds, rows)
+
+
+def write_profile(path):
+    # For scripts with no result file to sit next to
+    return _current.write(path)
+
+
+def write_profile_for(result_path):
+    return _current.write_for(result_path)
+
+
+_mode = os.environ.get(ENV_VAR, '').strip().lower()
+if _mode and _mode not in ('0', 'false', 'no', 'off'):
+    enable(trace_memory=_mode == 'tracemalloc', sampler=os.environ.get(SAMPLER_ENV_VAR) or None)
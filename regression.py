@@ -0,0 +1,123 @@
+import math
+from collections import namedtuple
+import numpy as np
+
+# Rows per block when accumulating; keeps the stacked temporaries in cache
+BLOCK_ROWS = 1 << 15
+
+LineFit = namedtuple('LineFit', ['slope', 'intercept', 'sse'])
+
+
+class SufficientStats(namedtuple('SufficientStats', ['n', 'sx', 'sy', 'sxx', 'sxy', 'syy'])):
+    """
+    Weighted sums sum(w), sum(w x), sum(w y), sum(w x^2), sum(w x y), sum(w y^2).
+    Everything a straight-line fit needs; two sets for disjoint data add up.
+    """
+    __slots__ = ()
+
+    def __add__(self, other):
+        return SufficientStats(*(a + b for a, b in zip(self, other)))
+
+    def __sub__(self, other):
+        return SufficientStats(*(a - b for a, b in zip(self, other)))
+
+
+EMPTY_STATS = SufficientStats(0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+
+
+def _as_float(a):
+    a = np.asarray(a)
+    return a if a.dtype.kind == 'f' else a.astype(float)
+
+
+def sufficient_stats(x, y, weights=None, block=BLOCK_ROWS):
+    """
+    One pass over x, y (and weights): each block is stacked as [1, x, y] and
+    reduced with a single Gram-matrix product, giving all six sums at once.
+    """
+    # float32 columns are widened block by block into the float64 stacking buffer
+    x = _as_float(x)
+    y = _as_float(y)
+    w = None if weights is None else _as_float(weights)
+    G = np.zeros((3, 3))
+    rows = min(block, len(x))
+    stacked = np.empty((3, rows))
+    scaled = np.empty((3, rows)) if w is not None else None
+    for start in range(0, len(x), block):
+        stop = min(start + block, len(x))
+        U = stacked[:, :stop - start]
+        U[0] = 1.0
+        U[1] = x[start:stop]
+        U[2] = y[start:stop]
+        if w is None:
+            G += U @ U.T
+        else:
+            S = scaled[:, :stop - start]
+            np.multiply(U, w[start:stop], out=S)
+            G += S @ U.T
+    return SufficientStats(G[0, 0], G[0, 1], G[0, 2], G[1, 1], G[1, 2], G[2, 2])
+
+
+def sse_at(stats, slope, intercept=0.0):
+    # sum(w (y - slope x - intercept)^2) expanded in terms of the sums
+    return (stats.syy - 2 * slope * stats.sxy - 2 * intercept * stats.sy + slope ** 2 * stats.sxx
+            + 2 * slope * intercept * stats.sx + stats.n * intercept ** 2)
+
+
+def solve(stats, through_origin=False):
+    if through_origin:
+        slope = stats.sxy / stats.sxx
+        return LineFit(slope, 0.0, max(stats.syy - slope * stats.sxy, 0.0))
+    sxx_c = stats.sxx - stats.sx ** 2 / stats.n
+    sxy_c = stats.sxy - stats.sx * stats.sy / stats.n
+    syy_c = stats.syy - stats.sy ** 2 / stats.n
+    slope = sxy_c / sxx_c
+    intercept = (stats.sy - slope * stats.sx) / stats.n
+    return LineFit(slope, intercept, max(syy_c - slope * sxy_c, 0.0))
+
+
+def fit_line(x, y, weights=None, through_origin=False):
+    """
+    Slope, intercept and SSE of a (weighted) least-squares line from one pass of
+    sufficient statistics. Hubble's law has no intercept: use through_origin=True.
+    """
+    return solve(sufficient_stats(x, y, weights), through_origin)
+
+
+def diagnostics_from_stats(stats, through_origin=False):
+    """
+    What linregress reports (slope, intercept, rvalue, pvalue, stderr,
+    intercept_stderr) derived from the same sums; meant to be called once on
+    the final fit, not inside an objective.
+    """
+    from scipy.stats import t as student_t
+
+    fit = solve(stats, through_origin)
+    dof = stats.n - (1 if through_origin else 2)
+    if through_origin:
+        sxx, syy, sxy = stats.sxx, stats.syy, stats.sxy
+    else:
+        sxx = stats.sxx - stats.sx ** 2 / stats.n
+        syy = stats.syy - stats.sy ** 2 / stats.n
+        sxy = stats.sxy - stats.sx * stats.sy / stats.n
+    r = sxy / math.sqrt(sxx * syy) if sxx > 0 and syy > 0 else 0.0
+    stderr = math.sqrt(fit.sse / dof / sxx) if dof > 0 else float('nan')
+    intercept_stderr = 0.0 if through_origin else stderr * math.sqrt(stats.sxx / stats.n)
+    if stderr > 0:
+        pvalue = 2 * student_t.sf(abs(fit.slope / stderr), dof)
+    else:
+        pvalue = 0.0
+    return {
+        'slope': fit.slope,
+        'intercept': fit.intercept,
+        'rvalue': r,
+        'pvalue': float(pvalue),
+        'stderr': stderr,
+        'intercept_stderr': intercept_stderr,
+        'sse': fit.sse,
+        'n': stats.n,
+    }
+
+
+def diagnostics(x, y, weights=None, through_origin=False):
+    return diagnostics_from_stats(sufficient_stats(x, y, weights), through_origin)
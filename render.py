@@ -0,0 +1,203 @@
+"""
+Headless rendering for catalogs too large to draw point by point.
+
+Figures are built on the Agg canvas directly (no pyplot state, no display), and
+sized in pixels. Line plots are decimated to the few points per pixel column
+that decide what the line looks like; scatters above DENSITY_THRESHOLD points
+become a hexbin density map. render_batch draws many diagrams in a process pool.
+"""
+import argparse
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+DEFAULT_WIDTH = 1920
+DEFAULT_HEIGHT = 1080
+DEFAULT_DPI = 100
+# Above this many points a scatter is drawn as a density map
+DENSITY_THRESHOLD = 50000
+
+
+def figure_for_pixels(width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, dpi=DEFAULT_DPI):
+    """A pyplot-free Figure that saves as exactly width x height pixels at `dpi`."""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def save_pixels(fig, filename, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, dpi=DEFAULT_DPI):
+    # Resize an existing (e.g. pyplot) figure so the file is width x height pixels
+    fig.set_size_inches(width / dpi, height / dpi)
+    fig.savefig(filename, dpi=dpi)
+
+
+### Decimation ###
+def decimate_minmax(x, y, n_buckets=DEFAULT_WIDTH):
+    """
+    Shape-preserving decimation of a line sorted by x: split the x range into
+    n_buckets columns and keep, per column, the first, last, lowest and highest
+    point in their original order. Drawn at one column per pixel this gives the
+    same picture as the full line with at most 4 * n_buckets points.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    finite = np.isfinite(x) & np.isfinite(y)
+    if not finite.all():
+        x, y = x[finite], y[finite]
+    if len(x) <= 4 * n_buckets:
+        return x, y
+
+    span = x[-1] - x[0]
+    if span > 0:
+        bucket = np.minimum(((x - x[0]) / span * n_buckets).astype(np.int64), n_buckets - 1)
+    else:
+        bucket = np.arange(len(x)) * n_buckets // len(x)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    stops = np.r_[starts[1:], len(x)]
+    counts = stops - starts
+
+    keep = [starts, stops - 1]
+    for reduce in (np.minimum, np.maximum):
+        extreme = np.repeat(reduce.reduceat(y, starts), counts)
+        hits = np.flatnonzero(y == extreme)
+        # first hit in each bucket
+        keep.append(hits[np.r_[True, bucket[hits[1:]] != bucket[hits[:-1]]]])
+    idx = np.unique(np.concatenate(keep))
+    return x[idx], y[idx]
+
+
+### Drawing ###
+def draw_line(ax, x, y, n_buckets=None, **kwargs):
+    # Points are assumed sorted by x; n_buckets defaults to the axes width in pixels
+    if n_buckets is None:
+        n_buckets = max(int(ax.bbox.width), 1)
+    xd, yd = decimate_minmax(x, y, n_buckets)
+    if len(xd) < len(x):
+        logging.info(f"Decimated line from {len(x)} to {len(xd)} points")
+    return ax.plot(xd, yd, **kwargs)
+
+
+def draw_scatter(ax, x, y, threshold=DENSITY_THRESHOLD, gridsize=None, **kwargs):
+    """Plain scatter for small catalogs, log-scaled hexbin density above `threshold` points."""
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(x) <= threshold:
+        return ax.scatter(x, y, **kwargs)
+    if gridsize is None:
+        gridsize = max(int(ax.bbox.width) // 8, 10)
+    finite = np.isfinite(x) & np.isfinite(y)
+    logging.info(f"Drawing {len(x)} points as a density map (gridsize {gridsize})")
+    return ax.hexbin(x[finite], y[finite], gridsize=gridsize, bins='log', mincnt=1, **kwargs)
+
+
+def draw_fit_line(ax, slope, intercept, x_min, x_max, **kwargs):
+    # A straight line is exact with its two end points
+    x = np.array([x_min, x_max], dtype=float)
+    return ax.plot(x, slope * x + intercept, **kwargs)
+
+
+### Whole diagrams ###
+def render_line(x, y, output, xlabel='X Axis', ylabel='Y Axis', title='Line Graph from CSV Data',
+                width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, dpi=DEFAULT_DPI, sort=True):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if sort:
+        order = np.argsort(x, kind='stable')
+        x, y = x[order], y[order]
+    fig = figure_for_pixels(width, height, dpi)
+    ax = fig.add_subplot()
+    draw_line(ax, x, y)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+    fig.savefig(output, dpi=dpi)
+    return output
+
+
+def render_line_csv(csv_path, output, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, dpi=DEFAULT_DPI,
+                    labels_from_header=False):
+    import csv_ingest
+    data = csv_ingest.read_csv_columns(csv_path, [0, 1])
+    (xlabel, x), (ylabel, y) = data.items()
+    labels = {'xlabel': xlabel, 'ylabel': ylabel} if labels_from_header else {}
+    return render_line(x, y, output, width=width, height=height, dpi=dpi, **labels)
+
+
+def render_hubble(distances, velocities, slope, intercept, output, title="Hubble's Law with Best-Fit Line",
+                  width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, dpi=DEFAULT_DPI, threshold=DENSITY_THRESHOLD):
+    """Hubble diagram: distance/velocity scatter (or density) plus the fitted line."""
+    distances = np.asarray(distances, dtype=float)
+    fig = figure_for_pixels(width, height, dpi)
+    ax = fig.add_subplot()
+    draw_scatter(ax, distances, velocities, threshold)
+    draw_fit_line(ax, slope, intercept, 0.0, np.nanmax(distances), color='C1')
+    ax.set_xlabel("Distance (Mpc)")
+    ax.set_ylabel("Recessional Velocity (km/s)")
+    ax.set_title(title)
+    fig.savefig(output, dpi=dpi)
+    return output
+
+
+def render_hubble_catalog(catalog, output, k=0.0, **kwargs):
+    # Diagram straight from a catalog file: corrected distances for extinction slope k, v = c z
+    import catalog_store
+    import distance_solver
+    import regression
+    import streaming
+    data = catalog_store.read_catalog(catalog)
+    m, M, z = (np.asarray(data[name]) for name in catalog_store.CATALOG_COLUMNS)
+    d = distance_solver.corrected_distances(k, m, M) if k else streaming.distance_mpc(m, M)
+    v = streaming.c_kms * z
+    fit = regression.fit_line(d, v)
+    return render_hubble(d, v, fit.slope, fit.intercept, output, **kwargs)
+
+
+RENDERERS = {
+    'line': render_line_csv,
+    'hubble': render_hubble_catalog,
+}
+
+
+def _render_job(job):
+    job = dict(job)
+    return RENDERERS[job.pop('kind')](**job)
+
+
+def render_batch(jobs, workers=None):
+    """
+    Render many diagrams in parallel. Each job is a dict with 'kind' (a key of
+    RENDERERS) and that renderer's keyword arguments; pass file paths rather
+    than arrays so nothing large is pickled. Returns the output paths in order.
+    """
+    jobs = list(jobs)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(jobs) <= 1:
+        return [_render_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+        return list(pool.map(_render_job, jobs))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Headless rendering of line plots and Hubble diagrams')
+    parser.add_argument('kind', choices=sorted(RENDERERS))
+    parser.add_argument('inputs', nargs='+', help='CSV files (line) or catalogs (hubble)')
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--format', default='png', help='image format / file extension')
+    parser.add_argument('--width', type=int, default=DEFAULT_WIDTH, help='pixels')
+    parser.add_argument('--height', type=int, default=DEFAULT_HEIGHT, help='pixels')
+    parser.add_argument('--dpi', type=int, default=DEFAULT_DPI)
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+
+    source = 'csv_path' if args.kind == 'line' else 'catalog'
+    jobs = []
+    for path in args.inputs:
+        name = os.path.splitext(os.path.basename(path))[0]
+        output = os.path.join(args.output_dir, f"{name}_{args.kind}.{args.format}")
+        jobs.append({'kind': args.kind, source: path, 'output': output,
+                     'width': args.width, 'height': args.height, 'dpi': args.dpi})
+    for output in render_batch(jobs, args.workers):
+        print(f"Saved {output}")
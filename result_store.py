@@ -0,0 +1,330 @@
+"""
+Persistent store of fit results, keyed by what produced them.
+
+Every fit is recorded in SQLite (fit_results.sqlite, or $HUBBLE_RESULT_STORE)
+under the content hash of the arrays it was fitted to, the model, the bounds,
+the requested initial guess and the solver. cached_fit() returns the stored
+result for an identical key without fitting; otherwise it fits, starting an
+iterative solver from the stored solution of the nearest catalog (by column
+summary statistics) fitted with the same model, bounds and solver, and
+stores the new result. HUBBLE_RESULT_STORE=off disables the store.
+
+The key also holds code_version(), a hash of the modules that compute the
+fits, so editing the models or the solver never serves results computed by
+the old code (they can still seed warm starts). use_cache=False (the
+scripts' --no-cache) refits from the initial guess and replaces the record.
+
+    python result_store.py list --model distance_extinction
+    python result_store.py show 12
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+import numpy as np
+from scipy.optimize import OptimizeResult
+
+DEFAULT_STORE = 'fit_results.sqlite'
+# Bumped when the table layout changes; an older store is dropped and rebuilt (it is only a cache)
+SCHEMA_VERSION = 2
+# Modules whose source determines a fit's result
+VERSIONED_MODULES = ('hubble_models', 'lsq_solver', 'kernels', 'iterative_k')
+ENV_VAR = 'HUBBLE_RESULT_STORE'
+# Relative summary-statistic distance beyond which a stored solution is not used as a starting point
+MAX_WARM_DISTANCE = 0.25
+# Stored catalogs compared per warm-start lookup (newest first)
+MAX_CANDIDATES = 1000
+SIGNATURE_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fits (
+    id INTEGER PRIMARY KEY,
+    dataset_hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    bounds TEXT NOT NULL,
+    x0 TEXT NOT NULL,
+    method TEXT NOT NULL,
+    version TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    signature TEXT NOT NULL,
+    start TEXT NOT NULL,
+    warm_from INTEGER,
+    x TEXT NOT NULL,
+    cov TEXT,
+    fun REAL,
+    nfev INTEGER,
+    njev INTEGER,
+    success INTEGER NOT NULL,
+    degenerate INTEGER NOT NULL DEFAULT 0,
+    message TEXT,
+    seconds REAL,
+    source TEXT,
+    script TEXT,
+    created REAL NOT NULL,
+    UNIQUE (dataset_hash, model, bounds, x0, method, version)
+);
+CREATE INDEX IF NOT EXISTS fits_problem ON fits(model, bounds, method, created);
+CREATE INDEX IF NOT EXISTS fits_dataset ON fits(dataset_hash);
+"""
+
+_COLUMNS = ('id', 'dataset_hash', 'model', 'bounds', 'x0', 'method', 'version', 'rows', 'signature', 'start',
+            'warm_from', 'x', 'cov', 'fun', 'nfev', 'njev', 'success', 'degenerate', 'message', 'seconds', 'source',
+            'script', 'created')
+_JSON_COLUMNS = ('bounds', 'x0', 'signature', 'start', 'x', 'cov')
+
+
+def _canonical(value):
+    # Stable JSON for key columns: [60, 0.1] and (60.0, 0.1) give the same text
+    if value is None:
+        return 'null'
+    return json.dumps([None if b is None else [None if v is None else float(v) for v in b]
+                       if isinstance(b, (list, tuple)) else float(b) for b in value])
+
+
+_code_version = None
+
+
+def code_version():
+    """Short SHA-256 over the source of VERSIONED_MODULES and SCHEMA_VERSION."""
+    global _code_version
+    if _code_version is None:
+        import importlib.util
+        digest = hashlib.sha256(str(SCHEMA_VERSION).encode())
+        for name in VERSIONED_MODULES:
+            spec = importlib.util.find_spec(name)
+            if spec is not None and spec.origin:
+                with open(spec.origin, 'rb') as f:
+                    digest.update(f.read())
+        _code_version = digest.hexdigest()[:16]
+    return _code_version
+
+
+def dataset_hash(arrays):
+    """SHA-256 of the float64 bytes of the fitted arrays, in order."""
+    digest = hashlib.sha256()
+    for a in arrays:
+        a = np.ascontiguousarray(a, dtype=np.float64)
+        digest.update(str(a.shape).encode())
+        digest.update(a.data)
+    return digest.hexdigest()
+
+
+def signature(arrays):
+    # Row count plus mean, std and quantiles of every array: what "a slightly changed catalog" keeps close
+    out = [float(len(arrays[0]))]
+    for a in arrays:
+        a = np.asarray(a, dtype=np.float64)
+        finite = a[np.isfinite(a)]
+        if finite.size == 0:
+            out += [0.0] * (2 + len(SIGNATURE_QUANTILES))
+            continue
+        out += [float(finite.mean()), float(finite.std())] + np.quantile(finite, SIGNATURE_QUANTILES).tolist()
+    return out
+
+
+def signature_distance(a, b):
+    """Mean relative difference between two signatures (0 for identical summaries)."""
+    a, b = np.asarray(a, float), np.asarray(b, float)
+    if a.shape != b.shape:
+        return np.inf
+    return float(np.mean(np.abs(a - b) / (np.abs(a) + np.abs(b) + 1e-12)))
+
+
+class ResultStore:
+    def __init__(self, path=DEFAULT_STORE):
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            with self.db:
+                self.db.execute('DROP TABLE IF EXISTS fits')
+                self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def _rows(self, sql, params=()):
+        records = []
+        for row in self.db.execute(sql, params).fetchall():
+            record = dict(zip(_COLUMNS, row))
+            for key in _JSON_COLUMNS:
+                if record[key] is not None:
+                    record[key] = json.loads(record[key])
+            records.append(record)
+        return records
+
+    def lookup(self, digest, model, bounds, x0, method, version=None):
+        found = self._rows(f"SELECT {', '.join(_COLUMNS)} FROM fits WHERE dataset_hash = ? AND model = ? "
+                           'AND bounds = ? AND x0 = ? AND method = ? AND version = ?',
+                           (digest, model, _canonical(bounds), _canonical(x0), method, version or code_version()))
+        return found[0] if found else None
+
+    def nearest(self, model, bounds, method, sig, exclude_hash=None, max_distance=MAX_WARM_DISTANCE):
+        """The successful stored fit of the same problem whose catalog summary is closest to `sig`."""
+        candidates = self._rows(f"SELECT {', '.join(_COLUMNS)} FROM fits "
+                                'WHERE model = ? AND bounds = ? AND method = ? AND success = 1 AND dataset_hash != ? '
+                                'ORDER BY created DESC LIMIT ?',
+                                (model, _canonical(bounds), method, exclude_hash or '', MAX_CANDIDATES))
+        best, best_distance = None, max_distance
+        for record in candidates:
+            distance = signature_distance(sig, record['signature'])
+            if distance <= best_distance:
+                best, best_distance = record, distance
+        if best is not None:
+            best['distance'] = best_distance
+        return best
+
+    def save(self, digest, model, bounds, x0, method, sig, start, result, seconds=None, warm_from=None, source=None):
+        cov = getattr(result, 'cov', None)
+        values = (digest, model, _canonical(bounds), _canonical(x0), method, code_version(), int(sig[0]),
+                  json.dumps(sig), json.dumps(np.asarray(start, float).tolist()), warm_from,
+                  json.dumps(np.asarray(result.x, float).tolist()),
+                  None if cov is None else json.dumps(np.asarray(cov, float).tolist()),
+                  float(result.fun), int(getattr(result, 'nfev', 0) or 0), int(getattr(result, 'njev', 0) or 0),
+                  int(bool(getattr(result, 'success', True))), int(bool(getattr(result, 'degenerate', False))),
+                  str(getattr(result, 'message', '')), seconds, source, os.path.basename(sys.argv[0] or ''),
+                  time.time())
+        with self.db:
+            cursor = self.db.execute(f"INSERT OR REPLACE INTO fits ({', '.join(_COLUMNS[1:])}) "
+                                     f"VALUES ({', '.join('?' * (len(_COLUMNS) - 1))})", values)
+        return cursor.lastrowid
+
+    def list(self, model=None, digest=None, limit=50):
+        clauses, params = [], []
+        if model:
+            clauses.append('model = ?')
+            params.append(model)
+        if digest:
+            clauses.append('dataset_hash LIKE ?')
+            params.append(digest + '%')
+        where = (' WHERE ' + ' AND '.join(clauses)) if clauses else ''
+        return self._rows(f"SELECT {', '.join(_COLUMNS)} FROM fits{where} ORDER BY created DESC LIMIT ?",
+                          params + [limit])
+
+    def get(self, result_id):
+        found = self._rows(f"SELECT {', '.join(_COLUMNS)} FROM fits WHERE id = ?", (result_id,))
+        return found[0] if found else None
+
+
+def open_store(path=None):
+    """The store at `path` or $HUBBLE_RESULT_STORE (default fit_results.sqlite); None when set to 'off'."""
+    path = path or os.environ.get(ENV_VAR) or DEFAULT_STORE
+    if path.lower() in ('off', '0', 'none'):
+        return None
+    return ResultStore(path)
+
+
+def _from_record(record):
+    result = OptimizeResult(x=np.asarray(record['x']), fun=record['fun'],
+                            cov=None if record['cov'] is None else np.asarray(record['cov']),
+                            nfev=record['nfev'], njev=record['njev'], success=bool(record['success']),
+                            degenerate=bool(record['degenerate']), message=record['message'], method=record['method'])
+    return result
+
+
+def cached_fit(solve, model, arrays, x0, bounds, method, store=None, warm_start=True, source=None,
+               use_cache=True):
+    """
+    Run `solve(start)` (returning an OptimizeResult) through the store.
+
+    `arrays` are the data the solver sees, `x0` the script's initial guess
+    and `method` names the solver; together with `model`, `bounds` and
+    code_version() they key the stored result. An identical key returns the
+    stored result (result.cached True, no fit). Otherwise, with
+    `warm_start`, the fit starts from the nearest stored solution of the
+    same problem, clipped to the bounds, and falls back to `x0` if that
+    fails. use_cache=False skips both: it fits from `x0` and replaces the
+    record. The returned
+    result also carries dataset_hash, start, warm_from and result_id.
+    """
+    own_store = store is None
+    store = open_store() if own_store else store
+    if store is None:
+        result = solve(x0)
+        result.update(cached=False, start=list(x0), warm_from=None, result_id=None,
+                      dataset_hash=dataset_hash(arrays))
+        return result
+    try:
+        digest = dataset_hash(arrays)
+        record = store.lookup(digest, model, bounds, x0, method) if use_cache else None
+        if record is not None:
+            logging.info(f"Stored result {record['id']} reused for {model} on dataset {digest[:12]}")
+            result = _from_record(record)
+            result.update(cached=True, start=record['start'], warm_from=record['warm_from'],
+                          result_id=record['id'], dataset_hash=digest)
+            return result
+
+        sig = signature(arrays)
+        start, warm_from = np.asarray(x0, float), None
+        if warm_start and use_cache:
+            near = store.nearest(model, bounds, method, sig, exclude_hash=digest)
+            if near is not None:
+                lo = np.array([-np.inf if b[0] is None else b[0] for b in bounds], float)
+                hi = np.array([np.inf if b[1] is None else b[1] for b in bounds], float)
+                start, warm_from = np.clip(np.asarray(near['x'], float), lo, hi), near['id']
+                logging.info(f"Warm start for {model} from stored result {near['id']} "
+                             f"(catalog distance {near['distance']:.3g}): {start.tolist()}")
+
+        t0 = time.perf_counter()
+        result = solve(start)
+        if warm_from is not None and not result.success:
+            logging.warning(f"Warm-started fit did not converge ({result.message}); refitting from {list(x0)}")
+            start, warm_from = np.asarray(x0, float), None
+            result = solve(start)
+        seconds = time.perf_counter() - t0
+        result_id = store.save(digest, model, bounds, x0, method, sig, start, result, seconds, warm_from, source)
+        result.update(cached=False, start=start.tolist(), warm_from=warm_from, result_id=result_id,
+                      dataset_hash=digest)
+        return result
+    finally:
+        if own_store:
+            store.close()
+
+
+def provenance(result, model, bounds, x0, method, source=None):
+    """JSON-ready record of what produced `result`, for a script's output file."""
+    return {
+        'dataset': source,
+        'dataset_hash': result.dataset_hash,
+        'model': model,
+        'method': method,
+        'bounds': [list(b) for b in bounds],
+        'initial_guess': list(map(float, x0)),
+        'start': list(map(float, result.start)),
+        'warm_from': result.warm_from,
+        'cached': result.cached,
+        'code_version': code_version(),
+        'result_id': result.result_id,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Inspect the fit-result store')
+    parser.add_argument('--store', default=os.environ.get(ENV_VAR) or DEFAULT_STORE)
+    commands = parser.add_subparsers(dest='command', required=True)
+    ls = commands.add_parser('list', help='stored fits, newest first')
+    ls.add_argument('--model')
+    ls.add_argument('--dataset', help='dataset hash prefix')
+    ls.add_argument('--limit', type=int, default=50)
+    show = commands.add_parser('show', help='one stored fit as JSON')
+    show.add_argument('id', type=int)
+    args = parser.parse_args()
+
+    store = ResultStore(args.store)
+    if args.command == 'list':
+        for record in store.list(args.model, args.dataset, args.limit):
+            created = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record['created']))
+            warm = f" warm<-{record['warm_from']}" if record['warm_from'] else ''
+            print(f"{record['id']:5d} {created} {record['dataset_hash'][:12]} {record['version'][:8]} "
+                  f"{record['model']:22s} {record['method']:9s} x={[round(v, 4) for v in record['x']]} nfev={record['nfev']}{warm}")
+    else:
+        record = store.get(args.id)
+        if record is None:
+            sys.exit(f"No stored fit {args.id}")
+        print(json.dumps(record, indent=2))
+    store.close()
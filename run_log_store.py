@@ -0,0 +1,506 @@
+"""
+Structured run-log store: one directory instead of a log file per run.
+
+Events are appended as JSON lines to size-rotated segments
+(events-000001.jsonl, ...) and indexed in SQLite (index.sqlite) by run id,
+script, level and timestamp, with each event's segment and byte offset. The
+segments are the record; the index can be rebuilt from them at any time.
+Writers from several processes serialise on a lock file, so concurrent runs
+can share a store.
+
+RunLogHandler is a logging handler that batches events into the store;
+fastlog.setup_logging(store=...) attaches it. Queries go through the index
+and read only the matching lines:
+
+    python run_log_store.py query --script cpc_gpt2.py --level WARNING --since 2024-11-20
+    python run_log_store.py query --contains "Best-fit Hubble" --format json
+    python run_log_store.py runs --script tiger_new.py
+    python run_log_store.py import logfile/*.log logfile_*.log
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+DEFAULT_STORE = 'runlogs'
+ENV_VAR = 'HUBBLE_RUN_LOG'
+MAX_SEGMENT_BYTES = 64 * 2 ** 20
+# The handler writes a batch once it holds this many events or this many seconds have passed
+FLUSH_EVENTS = 256
+FLUSH_SECONDS = 1.0
+SEGMENT_PATTERN = re.compile(r'^events-(\d{6})\.jsonl$')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    script TEXT,
+    levelno INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    segment TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS events_run ON events(run_id, ts);
+CREATE INDEX IF NOT EXISTS events_script ON events(script, ts);
+CREATE INDEX IF NOT EXISTS events_level ON events(levelno, ts);
+CREATE INDEX IF NOT EXISTS events_ts ON events(ts);
+CREATE INDEX IF NOT EXISTS events_segment ON events(segment);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    script TEXT,
+    pid INTEGER,
+    argv TEXT,
+    started REAL,
+    ended REAL,
+    events INTEGER NOT NULL DEFAULT 0,
+    max_levelno INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS runs_script ON runs(script, started);
+CREATE INDEX IF NOT EXISTS runs_started ON runs(started);
+CREATE TABLE IF NOT EXISTS imports (
+    source TEXT PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    events INTEGER NOT NULL
+);
+"""
+
+
+def new_run_id(ts=None):
+    # Sorts by start time like the old logfile_%Y%m%d_%H%M%S names, unique across processes
+    stamp = datetime.fromtimestamp(time.time() if ts is None else ts).strftime('%Y%m%d_%H%M%S')
+    return f"{stamp}_{os.getpid()}_{uuid.uuid4().hex[:6]}"
+
+
+def parse_time(value):
+    """Epoch seconds from an ISO date/time (local time) or a plain number."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+class _FileLock:
+    # Exclusive lock on a file across processes (fcntl where available, a no-op elsewhere)
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a')
+        try:
+            import fcntl
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        except ImportError:
+            pass
+        return self
+
+    def __exit__(self, *exc):
+        self._file.close()  # closing releases the lock
+        self._file = None
+        return False
+
+
+class RunLogStore:
+    """Append-only JSONL segments plus their SQLite index, in one directory."""
+
+    def __init__(self, directory=DEFAULT_STORE, max_segment_bytes=MAX_SEGMENT_BYTES):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = _FileLock(os.path.join(directory, 'store.lock'))
+        self._db = None
+        self._db_lock = threading.Lock()
+
+    @property
+    def db(self):
+        if self._db is None:
+            db = sqlite3.connect(os.path.join(self.directory, 'index.sqlite'), timeout=30,
+                                 check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.executescript(_SCHEMA)
+            self._db = db
+        return self._db
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    ### Segments ###
+    def segments(self):
+        return sorted(name for name in os.listdir(self.directory) if SEGMENT_PATTERN.match(name))
+
+    def _active_segment(self, incoming):
+        # Newest segment, or a new one if this batch would take it past the size limit
+        names = self.segments()
+        if not names:
+            return 'events-000001.jsonl'
+        last = names[-1]
+        size = os.path.getsize(os.path.join(self.directory, last))
+        if size and size + incoming > self.max_segment_bytes:
+            number = int(SEGMENT_PATTERN.match(last).group(1)) + 1
+            return f"events-{number:06d}.jsonl"
+        return last
+
+    ### Writing ###
+    def append(self, events):
+        """Append a batch of event dicts (ts, run, script, level, levelno, message, ...) and index them."""
+        if not events:
+            return
+        lines = [(json.dumps(event, ensure_ascii=False) + '\n').encode('utf-8') for event in events]
+        with self._lock:
+            segment = self._active_segment(sum(map(len, lines)))
+            with open(os.path.join(self.directory, segment), 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(b''.join(lines))
+            rows = []
+            for event, line in zip(events, lines):
+                rows.append((event['run'], event.get('script'), event['levelno'], event['ts'],
+                             segment, offset, len(line), event.get('message')))
+                offset += len(line)
+            self._index(events, rows)
+
+    def _index(self, events, rows):
+        with self._db_lock, self.db:
+            self.db.executemany('INSERT INTO events (run_id, script, levelno, ts, segment, offset, length, message) '
+                                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            per_run = {}
+            for event in events:
+                count, top, first, last = per_run.get(event['run'], (0, 0, event['ts'], event['ts']))
+                per_run[event['run']] = (count + 1, max(top, event['levelno']),
+                                         min(first, event['ts']), max(last, event['ts']))
+            for run_id, (count, top, first, last) in per_run.items():
+                script = next(e.get('script') for e in events if e['run'] == run_id)
+                self.db.execute(
+                    'INSERT INTO runs (run_id, script, started, ended, events, max_levelno) VALUES (?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT(run_id) DO UPDATE SET events = events + excluded.events, '
+                    'max_levelno = max(max_levelno, excluded.max_levelno), '
+                    'started = min(coalesce(started, excluded.started), excluded.started), '
+                    'ended = max(coalesce(ended, excluded.ended), excluded.ended)',
+                    (run_id, script, first, last, count, top))
+
+    def begin_run(self, run_id, script, argv=None, pid=None, started=None):
+        with self._db_lock, self.db:
+            self.db.execute('INSERT INTO runs (run_id, script, pid, argv, started) VALUES (?, ?, ?, ?, ?) '
+                            'ON CONFLICT(run_id) DO UPDATE SET pid = excluded.pid, argv = excluded.argv',
+                            (run_id, script, pid, json.dumps(argv) if argv is not None else None,
+                             time.time() if started is None else started))
+
+    ### Reading ###
+    def _where(self, run=None, script=None, level=None, since=None, until=None, contains=None):
+        clauses, params = [], []
+        if run:
+            clauses.append('run_id = ?')
+            params.append(run)
+        if script:
+            clauses.append('script = ?')
+            params.append(script)
+        if level is not None:
+            clauses.append('levelno >= ?')
+            params.append(level if isinstance(level, int) else logging.getLevelName(level.upper()))
+        if since is not None:
+            clauses.append('ts >= ?')
+            params.append(parse_time(since))
+        if until is not None:
+            clauses.append('ts < ?')
+            params.append(parse_time(until))
+        if contains:
+            clauses.append("message LIKE ? ESCAPE '\\'")
+            params.append('%' + re.sub(r'([%_\\])', r'\\\1', contains) + '%')
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def query(self, run=None, script=None, level=None, since=None, until=None, contains=None,
+              limit=None, newest_first=False):
+        """Matching events, read back from their segments; the filters use the index only."""
+        where, params = self._where(run, script, level, since, until, contains)
+        sql = f"SELECT segment, offset, length FROM events{where} ORDER BY +ts {'DESC' if newest_first else 'ASC'}, id"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self._db_lock:
+            hits = self.db.execute(sql, params).fetchall()
+        events = [None] * len(hits)
+        by_segment = {}
+        for i, (segment, offset, length) in enumerate(hits):
+            by_segment.setdefault(segment, []).append((offset, length, i))
+        for segment, entries in by_segment.items():
+            with open(os.path.join(self.directory, segment), 'rb') as f:
+                for offset, length, i in sorted(entries):
+                    f.seek(offset)
+                    events[i] = json.loads(f.read(length))
+        return events
+
+    def count(self, **filters):
+        where, params = self._where(**filters)
+        with self._db_lock:
+            return self.db.execute(f"SELECT count(*) FROM events{where}", params).fetchone()[0]
+
+    def runs(self, script=None, since=None, until=None, min_level=None, limit=None):
+        clauses, params = [], []
+        if script:
+            clauses.append('script = ?')
+            params.append(script)
+        if since is not None:
+            clauses.append('started >= ?')
+            params.append(parse_time(since))
+        if until is not None:
+            clauses.append('started < ?')
+            params.append(parse_time(until))
+        if min_level is not None:
+            clauses.append('max_levelno >= ?')
+            params.append(min_level if isinstance(min_level, int) else logging.getLevelName(min_level.upper()))
+        sql = 'SELECT run_id, script, pid, argv, started, ended, events, max_levelno FROM runs'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY started DESC'
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self._db_lock:
+            rows = self.db.execute(sql, params).fetchall()
+        keys = ('run_id', 'script', 'pid', 'argv', 'started', 'ended', 'events', 'max_levelno')
+        return [dict(zip(keys, row)) for row in rows]
+
+    ### Maintenance ###
+    def rebuild_index(self):
+        """Drop the index and rebuild it from the segments."""
+        with self._lock:
+            with self._db_lock, self.db:
+                self.db.execute('DELETE FROM events')
+                self.db.execute('DELETE FROM runs')
+                self.db.execute('DELETE FROM imports')
+            n = 0
+            imported = {}
+            for segment in self.segments():
+                events, rows = [], []
+                offset = 0
+                with open(os.path.join(self.directory, segment), 'rb') as f:
+                    for line in f:
+                        if line.endswith(b'\n'):
+                            event = json.loads(line)
+                            events.append(event)
+                            if event.get('source'):
+                                run_id, count = imported.get(event['source'], (event['run'], 0))
+                                imported[event['source']] = (run_id, count + 1)
+                            rows.append((event['run'], event.get('script'), event['levelno'], event['ts'],
+                                         segment, offset, len(line), event.get('message')))
+                        offset += len(line)
+                self._index(events, rows)
+                n += len(events)
+            with self._db_lock, self.db:
+                self.db.executemany('INSERT INTO imports (source, run_id, events) VALUES (?, ?, ?)',
+                                    [(source, run_id, count) for source, (run_id, count) in imported.items()])
+        return n
+
+    def imported_events(self, source):
+        # Events already imported from a log file (by absolute path)
+        with self._db_lock:
+            row = self.db.execute('SELECT events FROM imports WHERE source = ?', (source,)).fetchone()
+        return row[0] if row else 0
+
+    def record_import(self, source, run_id, events):
+        with self._db_lock, self.db:
+            self.db.execute('INSERT INTO imports (source, run_id, events) VALUES (?, ?, ?) '
+                            'ON CONFLICT(source) DO UPDATE SET events = excluded.events', (source, run_id, events))
+
+    def prune(self, keep_segments):
+        """Delete all but the newest keep_segments segments and their index entries."""
+        with self._lock:
+            old = self.segments()[:-keep_segments] if keep_segments > 0 else self.segments()
+            with self._db_lock, self.db:
+                for segment in old:
+                    self.db.execute('DELETE FROM events WHERE segment = ?', (segment,))
+                self.db.execute('DELETE FROM runs WHERE run_id NOT IN (SELECT DISTINCT run_id FROM events)')
+            for segment in old:
+                os.remove(os.path.join(self.directory, segment))
+        return old
+
+
+### Logging handler ###
+class RunLogHandler(logging.Handler):
+    """
+    Logging handler that writes records to a RunLogStore under one run id.
+    Records are batched (FLUSH_EVENTS or FLUSH_SECONDS) and written on
+    flush()/close(); meant to sit behind fastlog's queue listener.
+    """
+
+    def __init__(self, store, run_id=None, script=None, flush_events=FLUSH_EVENTS, flush_seconds=FLUSH_SECONDS):
+        super().__init__()
+        self.store = store if isinstance(store, RunLogStore) else RunLogStore(store)
+        self.run_id = run_id or new_run_id()
+        self.script = script or os.path.basename(sys.argv[0] or 'python')
+        self.flush_events = flush_events
+        self.flush_seconds = flush_seconds
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self.store.begin_run(self.run_id, self.script, sys.argv, os.getpid())
+
+    def emit(self, record):
+        try:
+            event = {
+                'ts': record.created,
+                'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+                'run': self.run_id,
+                'script': self.script,
+                'level': record.levelname,
+                'levelno': record.levelno,
+                'logger': record.name,
+                'message': record.getMessage(),
+            }
+            if record.exc_text:
+                event['exc'] = record.exc_text
+            self.acquire()
+            try:
+                self._pending.append(event)
+                due = (len(self._pending) >= self.flush_events
+                       or time.monotonic() - self._last_flush >= self.flush_seconds)
+            finally:
+                self.release()
+            if due:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        self.acquire()
+        try:
+            pending, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+            self.store.append(pending)
+        finally:
+            self.release()
+
+    def close(self):
+        try:
+            self.flush()
+            self.store.close()
+        finally:
+            super().close()
+
+
+### Importing old log files ###
+_LINE = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),(\d{3}) - ([A-Z]+) - (.*)$')
+
+
+def read_logfile(path, run_id=None, script=None):
+    """Events from a fastlog/basicConfig-format file; continuation lines join the previous message."""
+    run_id = run_id or os.path.splitext(os.path.basename(path))[0]
+    source = os.path.abspath(path)
+    events = []
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            match = _LINE.match(line)
+            if match is None:
+                if events and line:
+                    events[-1]['message'] += '\n' + line
+                continue
+            stamp, millis, level, message = match.groups()
+            ts = datetime.strptime(stamp, '%Y-%m-%d %H:%M:%S').timestamp() + int(millis) / 1000
+            levelno = logging.getLevelName(level)
+            events.append({
+                'ts': ts,
+                'time': datetime.fromtimestamp(ts).isoformat(timespec='milliseconds'),
+                'run': run_id,
+                'script': script,
+                'level': level,
+                'levelno': levelno if isinstance(levelno, int) else logging.INFO,
+                'logger': 'root',
+                'message': message,
+                'source': source,
+            })
+    return events
+
+
+def import_logfile(store, path, script=None):
+    """
+    Import one log file as a run and return the number of new events. The
+    store remembers how many events each file (by absolute path) gave, so
+    importing again adds only lines appended since, and nothing otherwise.
+    """
+    events = read_logfile(path, script=script)
+    source = os.path.abspath(path)
+    done = store.imported_events(source)
+    new = events[done:]
+    if new:
+        if not done:
+            store.begin_run(new[0]['run'], script, started=new[0]['ts'])
+        store.append(new)
+        store.record_import(source, new[0]['run'], len(events))
+    return len(new)
+
+
+def _print_events(events, fmt):
+    for event in events:
+        if fmt == 'json':
+            print(json.dumps(event, ensure_ascii=False))
+        else:
+            print(f"{event['time']} {event['level']:8s} {event.get('script') or '-'} [{event['run']}] {event['message']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Query and maintain the run-log store')
+    parser.add_argument('--store', default=os.environ.get(ENV_VAR) or DEFAULT_STORE)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    q = commands.add_parser('query', help='events matching every given filter')
+    q.add_argument('--run')
+    q.add_argument('--script')
+    q.add_argument('--level', help='minimum level, e.g. WARNING')
+    q.add_argument('--since', help='ISO date/time (local) or epoch seconds')
+    q.add_argument('--until')
+    q.add_argument('--contains', help='substring of the message')
+    q.add_argument('--limit', type=int, default=1000)
+    q.add_argument('--newest-first', action='store_true')
+    q.add_argument('--count', action='store_true', help='print only the number of matches')
+    q.add_argument('--format', choices=('text', 'json'), default='text')
+
+    r = commands.add_parser('runs', help='runs, newest first')
+    r.add_argument('--script')
+    r.add_argument('--since')
+    r.add_argument('--until')
+    r.add_argument('--min-level', help='only runs that logged at least this level')
+    r.add_argument('--limit', type=int, default=50)
+
+    i = commands.add_parser('import', help='import old .log files, one run per file')
+    i.add_argument('files', nargs='+')
+    i.add_argument('--script')
+
+    commands.add_parser('rebuild-index', help='rebuild index.sqlite from the segments')
+    p = commands.add_parser('prune', help='delete all but the newest segments')
+    p.add_argument('--keep', type=int, required=True)
+    args = parser.parse_args()
+
+    store = RunLogStore(args.store)
+    start = time.perf_counter()
+    if args.command == 'query':
+        filters = dict(run=args.run, script=args.script, level=args.level, since=args.since, until=args.until,
+                       contains=args.contains)
+        if args.count:
+            print(store.count(**filters))
+        else:
+            _print_events(store.query(limit=args.limit, newest_first=args.newest_first, **filters), args.format)
+    elif args.command == 'runs':
+        for run in store.runs(args.script, args.since, args.until, args.min_level, args.limit):
+            started = datetime.fromtimestamp(run['started']).isoformat(timespec='seconds') if run['started'] else '-'
+            print(f"{run['run_id']:32s} {run['script'] or '-':24s} {started} {run['events']:6d} events, "
+                  f"max {logging.getLevelName(run['max_levelno'])}")
+    elif args.command == 'import':
+        total = sum(import_logfile(store, path, args.script) for path in args.files)
+        print(f"Imported {total} new events from {len(args.files)} files")
+    elif args.command == 'rebuild-index':
+        print(f"Indexed {store.rebuild_index()} events")
+    elif args.command == 'prune':
+        print(f"Deleted {len(store.prune(args.keep))} segments")
+    store.close()
+    print(f"({(time.perf_counter() - start) * 1000:.1f} ms)", file=sys.stderr)
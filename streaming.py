@@ -0,0 +1,181 @@
+import argparse
+import csv
+import itertools
+import logging
+import queue
+import threading
+import numpy as np
+import catalog_store
+import compute_backend
+import csv_ingest
+import json_stream
+import regression
+from catalog_store import CATALOG_COLUMNS
+
+c_kms = 299792.458  # Speed of light in km/s
+DEFAULT_CHUNK_ROWS = 1 << 16
+
+
+### Chunk readers: each yields (m, M, z) float64 arrays of at most chunk_size rows ###
+def iter_json_chunks(file_path, chunk_size=DEFAULT_CHUNK_ROWS):
+    offsets = json_stream.find_array_offsets(file_path, CATALOG_COLUMNS)
+    missing = [name for name in CATALOG_COLUMNS if name not in offsets]
+    if missing:
+        raise KeyError(f"Columns missing from {file_path}: {missing}")
+    # One reader per column, advancing in lockstep through the column-major document
+    readers = [json_stream.rechunk(json_stream.iter_array_blocks(file_path, offsets[name]), chunk_size)
+               for name in CATALOG_COLUMNS]
+    for chunk in itertools.zip_longest(*readers):
+        if any(col is None for col in chunk) or len({len(col) for col in chunk}) != 1:
+            raise ValueError(f"Columns in {file_path} have different lengths")
+        yield chunk
+
+
+def iter_csv_chunks(file_path, chunk_size=DEFAULT_CHUNK_ROWS):
+    header = csv_ingest.read_header(file_path)
+    positions = csv_ingest.resolve_columns(header, CATALOG_COLUMNS)
+    with open(file_path, 'rb') as f:
+        f.readline()
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                return
+            rows, fields = csv_ingest.parse_block(b''.join(lines), len(header), positions)
+            if rows:
+                yield tuple(np.ascontiguousarray(field) for field in fields)
+
+
+def iter_store_chunks(file_path, chunk_size=DEFAULT_CHUNK_ROWS):
+    block = catalog_store.open_columns(file_path).block
+    for start in range(0, block.shape[1], chunk_size):
+        m, M, z = block[:, start:start + chunk_size]
+        yield m, M, z
+
+
+def iter_catalog_chunks(file_path, chunk_size=DEFAULT_CHUNK_ROWS):
+    if file_path.endswith('.csv'):
+        return iter_csv_chunks(file_path, chunk_size)
+    if file_path.endswith('.npy'):
+        return iter_store_chunks(file_path, chunk_size)
+    return iter_json_chunks(file_path, chunk_size)
+
+
+def prefetch(iterable, depth=2):
+    """
+    Run `iterable` on a background thread, keeping up to `depth` items ready,
+    so reading/parsing the next chunk overlaps with computing on this one.
+    If the consumer stops early the producer is told to stop and `iterable`
+    is closed, which releases the file it reads.
+    """
+    items = queue.Queue(maxsize=depth)
+    done = object()
+    failure = []
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def producer():
+        source = iter(iterable)
+        try:
+            for item in source:
+                if not put(item):
+                    break
+        except BaseException as e:
+            failure.append(e)
+        finally:
+            if hasattr(source, 'close'):
+                source.close()
+            put(done)
+
+    worker = threading.Thread(target=producer, daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                break
+            yield item
+    finally:
+        stop.set()
+        # Unblock a producer waiting on a full queue, then wait for it to close the source
+        while worker.is_alive():
+            try:
+                items.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        worker.join()
+    if failure:
+        raise failure[0]
+
+
+### Per-chunk transforms ###
+# Both run on the selected compute backend (HUBBLE_BACKEND; 'fused' by default)
+def relativistic_velocity(z, c=c_kms):
+    return compute_backend.get_backend().relativistic_velocity(z, c)
+
+
+def distance_mpc(m, M):
+    return compute_backend.get_backend().distance_mpc(m, M)
+
+
+def transform_chunks(chunks, c=c_kms):
+    for m, M, z in chunks:
+        yield distance_mpc(m, M), relativistic_velocity(z, c)
+
+
+def run_streaming(file_path, chunk_size=DEFAULT_CHUNK_ROWS, output_path=None, c=c_kms, prefetch_depth=2):
+    logging.info(f"Streaming {file_path} in chunks of {chunk_size} rows")
+    chunks = iter_catalog_chunks(file_path, chunk_size)
+    if prefetch_depth:
+        chunks = prefetch(chunks, prefetch_depth)
+
+    # Running reduction: the six regression sums, chunk by chunk
+    stats = regression.EMPTY_STATS
+    out = open(output_path, 'w', newline='') if output_path else None
+    try:
+        writer = None
+        if out is not None:
+            writer = csv.writer(out)
+            writer.writerow(['Distance', 'Velocity'])
+        for d, v in transform_chunks(chunks, c):
+            stats += regression.sufficient_stats(d, v)
+            if writer is not None:
+                writer.writerows(zip(d.tolist(), v.tolist()))
+    finally:
+        if out is not None:
+            out.close()
+
+    if stats.n < 2:
+        raise ValueError(f"Need at least 2 rows to fit, got {int(stats.n)}")
+    linear = regression.solve(stats)
+    origin = regression.solve(stats, through_origin=True)
+    summary = {
+        'rows': int(stats.n),
+        'H0 (linear fit)': linear.slope,
+        'Intercept': linear.intercept,
+        'H0 (through origin)': origin.slope,
+        'Chi-square (through origin)': origin.sse,
+    }
+    logging.info(f"Streaming pass completed: {summary}")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit Hubble's law over a catalog without loading it whole")
+    parser.add_argument('catalog', nargs='?', default='Challenge2_data.json', help='JSON, CSV or .npy store')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument('--output', help='write per-row Distance,Velocity to this CSV')
+    parser.add_argument('--no-prefetch', action='store_true', help='read and compute on one thread')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    result = run_streaming(args.catalog, args.chunk_size, args.output, prefetch_depth=0 if args.no_prefetch else 2)
+    for key, value in result.items():
+        print(f"{key}: {value}")
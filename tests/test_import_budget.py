@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+
+import hubble
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def script_imports(stderr):
+    # Top-level entries of `-X importtime` after `site` are the ones the script itself pulls in
+    seen_site = False
+    imports = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):
+            if seen_site:
+                imports[name.strip()] = int(cumulative) / 1000
+            elif name.strip() == 'site':
+                seen_site = True
+    return imports
+
+
+def run_help():
+    out = subprocess.run([sys.executable, '-X', 'importtime', 'hubble.py', '--help'],
+                         capture_output=True, text=True, check=True, cwd=REPO)
+    return out.stderr
+
+
+def test_help_stays_within_import_budget():
+    imports = script_imports(run_help())
+    total = sum(imports.values())
+    slowest = sorted(imports.items(), key=lambda item: -item[1])[:5]
+    assert total <= hubble.IMPORT_BUDGET_MS, f"{total:.1f} ms, slowest: {slowest}"
+
+
+def test_help_skips_heavy_modules():
+    stderr = run_help()
+    loaded = {line.split('|')[-1].strip() for line in stderr.splitlines() if line.startswith('import time:')}
+    heavy = [m for m in hubble.HEAVY_MODULES if m in loaded]
+    assert not heavy, f"heavy modules imported by --help: {heavy}"
@@ -1,7 +1,14 @@
+import argparse
 import numpy as np
-from scipy.optimize import minimize
-import json
+import atomic_io
+import catalog_store
+import hubble_models
+import kernels
+import lsq_solver
+import profiling
+import result_store
 import logging
+import fastlog
 from datetime import datetime
 
 
@@ -9,55 +16,57 @@ from datetime import datetime
 c = 299792458
 c_kms = 299792.458
 # Configure logging
-log_filename = datetime.now().strftime('logfile_%Y%m%d_%H%M%S.log')
-logging.basicConfig(filename=log_filename, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Runs log to the indexed run-log store ($HUBBLE_RUN_LOG, default runlogs/); see run_log_store.py
+fastlog.setup_logging()
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--no-cache', action='store_true', help='refit from the initial guess, ignoring stored results')
+args = parser.parse_args()
 
 
 # JSON Reader module
 def json_reader(file_path):
     logging.info(f"Reading data from JSON file: {file_path}")
-    with open(file_path, 'r') as file:
-        data = json.load(file)
+    data = catalog_store.read_catalog(file_path)
     logging.info("Data successfully read from JSON file")
     return data
 
 logging.info("Setting up data arrays")
 file_path = 'Challenge2_data.json'
+profiling.lap('load')
 data = json_reader(file_path)
-apparent_magnitudes = np.array(data['Apparent Magitude (m)'])
-absolute_magnitudes = np.array(data['Absolute Magnitude (M)'])
-z = np.array(data['Redshift (z)'])
-radial_velocities = []
+profiling.lap('transform')
+apparent_magnitudes = np.asarray(data['Apparent Magitude (m)'])
+absolute_magnitudes = np.asarray(data['Absolute Magnitude (M)'])
+z = np.asarray(data['Redshift (z)'])
 
+profiling.lap('velocity')
 logging.info("Calculating radial velocities")
-for x in z:
-    radial_velocities.append((((1 + x)**2 - 1) / ((1 + x)**2 + 1))*c_kms)
-radial_velocities = np.array(radial_velocities)
+radial_velocities = kernels.relativistic_velocity(z, c_kms)
 
 logging.info("Defining the model function")
-# Define the model function
-def magnitude_model(params, v, M):
-    H0, R_V, E_BV = params
-    A_V = R_V * E_BV
-    m_model = M + 5 * np.log10(v / H0) - 5 + A_V
-    return m_model
-
-logging.info("Defining the residuals function")
-# Define the residuals function
-def residuals(params, v, M, m_obs):
-    m_model = magnitude_model(params, v, M)
-    return m_obs - m_model
+# Model function, residuals and analytic Jacobian
+model = hubble_models.get_model('rv_ebv')
+magnitude_model = model.model
+residuals = model.residuals
 
 # Initial guesses for parameters: H0 (Hubble constant), R_V (extinction ratio), E(B-V) (color excess)
 initial_guess = [70, 3.1, 0.1]
 
+profiling.lap('fit')
 logging.info("Starting optimization process")
-# Minimize the sum of squared residuals
-result = minimize(
-    lambda params: np.sum(residuals(params, radial_velocities, absolute_magnitudes, apparent_magnitudes)**2),
-    initial_guess,
-    bounds=[(50, 100), (2.0, 5.0), (0.0, 1.0)]  # Reasonable bounds for H0, R_V, E(B-V)
+# Only -5*log10(H0) + R_V*E(B-V) is identifiable, so solve that directly instead of
+# letting a local optimizer wander along the degenerate ridge. Identical reruns come from the
+# result store; no warm start, since the starting point picks which ridge point is returned
+bounds = [(50, 100), (2.0, 5.0), (0.0, 1.0)]  # Reasonable bounds for H0, R_V, E(B-V)
+fit_args = (radial_velocities, absolute_magnitudes, apparent_magnitudes)
+result = result_store.cached_fit(
+    lambda start: lsq_solver.solve_linear(model, *fit_args, start, bounds=bounds),
+    model.name, fit_args, initial_guess, bounds, 'linear', warm_start=False, source=file_path,
+    use_cache=not args.no_cache
 )
+if result.degenerate:
+    print("Warning: H0, R_V and E(B-V) are degenerate; only -5*log10(H0) + R_V*E(B-V) is constrained")
 
 logging.info("Optimization process completed")
 # Extract best-fit parameters
@@ -75,11 +84,13 @@ print(f"Best-fit E(B-V): {E_BV_best:.2f}")
 output_data = {
     'Hubble constant (H0)': H0_best,
     'R_V': R_V_best,
-    'E(B-V)': E_BV_best
+    'E(B-V)': E_BV_best,
+    'Provenance': result_store.provenance(result, model.name, bounds, initial_guess, 'linear', file_path)
 }
 
 output_file_path = datetime.now().strftime('output_js_%Y%m%d_%H%M%S.json')
 logging.info(f"Saving optimization results to JSON file: {output_file_path}")
-with open(output_file_path, 'w') as output_file:
-    json.dump(output_data, output_file, indent=4)
+profiling.lap('write')
+atomic_io.write_json_atomic(output_data, output_file_path)
+profiling.write_profile_for(output_file_path)
 logging.info("Optimization results successfully saved to JSON file")
\ No newline at end of file